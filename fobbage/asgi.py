@@ -6,7 +6,7 @@ import os
 from django.core.asgi import get_asgi_application
 from django.urls import re_path
 from channels.routing import (
-    ProtocolTypeRouter, URLRouter)
+    ChannelNameRouter, ProtocolTypeRouter, URLRouter)
 
 # Load the ASGI APP before importing other APPS
 # some weird channels order bug
@@ -15,17 +15,26 @@ django_asgi_app = get_asgi_application()
 
 from channels.auth import AuthMiddlewareStack  # noqa: E402
 from fobbage.quizes import consumers  # noqa: E402
+from fobbage.quizes.timers import PHASE_TIMER_CHANNEL  # noqa: E402
 
 # There is no longer a need for routing.py
 # Routing is done here
 application = ProtocolTypeRouter({
     "http": django_asgi_app,
     "https": django_asgi_app,
-    "websocket": AuthMiddlewareStack(
-        URLRouter([
+    "websocket": URLRouter([
+        # spectators don't log in, they skip the session and user queries
+        re_path(
+            r'^ws/session/(?P<session_id>\d+)/watch/$',
+            consumers.SpectatorConsumer.as_asgi()),
+        re_path(r'', AuthMiddlewareStack(URLRouter([
             re_path(
                 r'^ws/session/(?P<session_id>[^/]+)/$',
                 consumers.ChatConsumer.as_asgi()),
-        ])
-    )
+        ]))),
+    ]),
+    # manage.py runphasetimers
+    "channel": ChannelNameRouter({
+        PHASE_TIMER_CHANNEL: consumers.PhaseTimerConsumer.as_asgi(),
+    }),
 })
@@ -0,0 +1,185 @@
+"""
+In-process channel layer for single process deployments
+
+Like `channels.layers.InMemoryChannelLayer`, messages only reach consumers in
+the same process, but:
+
+- a group send puts the one message object on the queue of every member, it
+  is not copied or serialized, consumers must not change the messages they
+  receive
+- messages can be sent from any thread, such as the broadcast outbox, the
+  receiving event loop is woken up thread safely
+- queues are bounded by `capacity`, a full channel drops group messages and
+  raises `ChannelFull` on a direct send
+- expired messages are dropped per channel, when it is sent to or received
+  from, not by scanning every channel on every send. A channel that lets its
+  messages expire is no longer read and is removed from its groups
+"""
+import asyncio
+import random
+import string
+import threading
+import time
+from collections import deque
+
+from channels.exceptions import ChannelFull
+from channels.layers import BaseChannelLayer
+
+
+class _Channel:
+    __slots__ = ('messages', 'waiters')
+
+    def __init__(self):
+        # (expires, message)
+        self.messages = deque()
+        # (loop, future) of the receivers waiting for a message
+        self.waiters = []
+
+
+class LocalChannelLayer(BaseChannelLayer):
+    extensions = ['groups', 'flush']
+
+    def __init__(self, expiry=60, group_expiry=86400, capacity=100,
+                 channel_capacity=None, **kwargs):
+        super().__init__(
+            expiry=expiry, capacity=capacity,
+            channel_capacity=channel_capacity, **kwargs)
+        self.group_expiry = group_expiry
+        self.channels = {}
+        # group: {channel: joined}
+        self.groups = {}
+        # sends can come from other threads than the event loop
+        self._lock = threading.Lock()
+        self.stats = {'sent': 0, 'dropped': 0, 'expired': 0}
+
+    def _expire(self, name, channel, now):
+        """Drop the expired messages of a channel, returns how many"""
+        expired = 0
+        while channel.messages and channel.messages[0][0] < now:
+            channel.messages.popleft()
+            expired += 1
+        if expired:
+            self.stats['expired'] += expired
+            for members in self.groups.values():
+                members.pop(name, None)
+        return expired
+
+    def _put(self, name, message, now):
+        """Queue a message and wake a receiver, called with the lock held"""
+        channel = self.channels.get(name)
+        if channel is None:
+            channel = self.channels[name] = _Channel()
+        self._expire(name, channel, now)
+        if len(channel.messages) >= self.get_capacity(name):
+            raise ChannelFull(name)
+        channel.messages.append((now + self.expiry, message))
+        self.stats['sent'] += 1
+        if channel.waiters:
+            _wake(*channel.waiters.pop(0))
+
+    # Channel layer API
+
+    async def send(self, channel, message):
+        assert isinstance(message, dict), 'message is not a dict'
+        self.require_valid_channel_name(channel)
+        assert '__asgi_channel__' not in message
+        with self._lock:
+            self._put(channel, message, time.time())
+
+    async def receive(self, channel):
+        self.require_valid_channel_name(channel)
+        loop = asyncio.get_running_loop()
+        while True:
+            with self._lock:
+                state = self.channels.get(channel)
+                if state is None:
+                    state = self.channels[channel] = _Channel()
+                self._expire(channel, state, time.time())
+                if state.messages:
+                    _, message = state.messages.popleft()
+                    if not state.messages and not state.waiters:
+                        del self.channels[channel]
+                    return message
+                future = loop.create_future()
+                state.waiters.append((loop, future))
+            try:
+                await future
+            except asyncio.CancelledError:
+                with self._lock:
+                    if (loop, future) in state.waiters:
+                        state.waiters.remove((loop, future))
+                    elif state.messages and state.waiters:
+                        # woken, but cancelled before taking the message
+                        _wake(*state.waiters.pop(0))
+                raise
+
+    async def new_channel(self, prefix='specific.'):
+        return '{}.local!{}'.format(prefix, ''.join(
+            random.choice(string.ascii_letters) for _ in range(12)))
+
+    # Flush extension
+
+    async def flush(self):
+        with self._lock:
+            self.channels = {}
+            self.groups = {}
+
+    async def close(self):
+        pass
+
+    # Groups extension
+
+    async def group_add(self, group, channel):
+        self.require_valid_group_name(group)
+        self.require_valid_channel_name(channel)
+        with self._lock:
+            self.groups.setdefault(group, {})[channel] = time.time()
+
+    async def group_discard(self, group, channel):
+        self.require_valid_channel_name(channel)
+        self.require_valid_group_name(group)
+        with self._lock:
+            members = self.groups.get(group)
+            if members:
+                members.pop(channel, None)
+                if not members:
+                    del self.groups[group]
+
+    async def group_send(self, group, message):
+        assert isinstance(message, dict), 'message is not a dict'
+        self.require_valid_group_name(group)
+        now = time.time()
+        joined_after = now - self.group_expiry
+        with self._lock:
+            members = self.groups.get(group)
+            if not members:
+                return
+            for name, joined in list(members.items()):
+                if joined < joined_after:
+                    del members[name]
+                    continue
+                try:
+                    self._put(name, message, now)
+                except ChannelFull:
+                    self.stats['dropped'] += 1
+
+
+def _wake(loop, future):
+    """Wake a receiver from any thread"""
+    try:
+        running = asyncio.get_running_loop()
+    except RuntimeError:
+        running = None
+    if running is loop:
+        _set(future)
+        return
+    try:
+        loop.call_soon_threadsafe(_set, future)
+    except RuntimeError:
+        # its event loop is closed
+        pass
+
+
+def _set(future):
+    if not future.done():
+        future.set_result(None)
@@ -0,0 +1,53 @@
+from django.core.management.base import BaseCommand
+
+from fobbage.quizes.models import Fobbit, Session
+from fobbage.quizes.scoring import record_scores
+
+
+class Command(BaseCommand):
+    help = (
+        'Fills the score ledger and score sheets for finished fobbits of '
+        'past sessions')
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--batch-size', type=int, default=100,
+            help='number of fobbits scored per transaction',
+        )
+        parser.add_argument(
+            '--session', type=int, action='append', dest='sessions',
+            help='only backfill the given session id(s)',
+        )
+        parser.add_argument(
+            '--missing', action='store_true',
+            help='only fobbits that are not in the score ledger yet',
+        )
+
+    def backfill_session(self, session, batch_size, missing=False):
+        fobbits = session.fobbits.filter(status=Fobbit.FINISHED)
+        if missing:
+            fobbits = fobbits.filter(scored=False)
+        fobbit_ids = list(fobbits.values_list('id', flat=True))
+
+        for i in range(0, len(fobbit_ids), batch_size):
+            record_scores(session, fobbit_ids[i:i + batch_size])
+
+        for fobbit in session.fobbits.filter(
+                status=Fobbit.FINISHED, score_sheet__isnull=True):
+            fobbit.freeze_score_sheet()
+        return len(fobbit_ids)
+
+    def handle(self, *args, **options):
+        sessions = Session.objects.filter(
+            fobbits__status=Fobbit.FINISHED).distinct().order_by('id')
+        if options['sessions']:
+            sessions = sessions.filter(id__in=options['sessions'])
+        if options['missing']:
+            sessions = sessions.filter(
+                fobbits__status=Fobbit.FINISHED, fobbits__scored=False)
+
+        for session in sessions.iterator():
+            n = self.backfill_session(
+                session, options['batch_size'], options['missing'])
+            self.stdout.write(
+                'Session {}: scored {} fobbits'.format(session.id, n))
@@ -0,0 +1,19 @@
+from channels import DEFAULT_CHANNEL_LAYER
+from channels.management.commands import runworker
+
+from fobbage.quizes.timers import PHASE_TIMER_CHANNEL, PhaseTimerWorker
+
+
+class Command(runworker.Command):
+    help = 'End bluff and guess phases when their deadline passes'
+    worker_class = PhaseTimerWorker
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--layer', default=DEFAULT_CHANNEL_LAYER,
+            help='Channel layer alias to use, if not the default.',
+        )
+        parser.add_argument(
+            'channels', nargs='*', default=[PHASE_TIMER_CHANNEL],
+            help='Channels to listen on.',
+        )
@@ -1,96 +1,286 @@
 # chat/consumers.py
-from asgiref.sync import async_to_sync
-from channels.generic.websocket import JsonWebsocketConsumer, SyncConsumer
 import json
+from types import SimpleNamespace
+from urllib.parse import parse_qs
 
-from .models import Bluff, Session
+from channels.db import database_sync_to_async
+from channels.consumer import AsyncConsumer, get_handler_name
+from channels.generic.websocket import (
+    AsyncJsonWebsocketConsumer, AsyncWebsocketConsumer, SyncConsumer)
+from rest_framework.exceptions import ValidationError
 
+from django.conf import settings
 
-class ChatConsumer(JsonWebsocketConsumer):
-    def connect(self):
+from .deltas import session_events
+from .engine import engine
+from .messages import coalesce_broadcasts
+from .multiplexer import get_multiplexer
+from .sendqueue import SLOW_CLOSE_CODE, SendQueue
+from . import presence
+from .models import Session
+from .serializers import BluffSerializer, GuessSerializer
+from .spectators import get_hub
+from .timers import scheduler
+
+
+class ChatConsumer(AsyncJsonWebsocketConsumer):
+    """
+    Websocket of a session
+
+    The session and user are loaded once at connect, an idle connection
+    holds no thread and runs no queries.
+
+    Players submit bluffs and guesses over the socket with
+    `{"action": "bluff", "request_id": .., "fobbit": .., "text": ..}` or
+    `{"action": "guess", "request_id": .., "answer": ..}`, they are validated
+    by the REST serializers and acknowledged to the sender with
+    `{"type": "ack", "request_id": .., "ok": .., "data" or "errors": ..}`.
+
+    With `WEBSOCKET_MULTIPLEXER` the consumers of a session share one
+    subscription to its group per process.
+
+    A client that reconnects with `?last_seq=<version>` gets the broadcasts
+    it missed replayed, or one without a patch when they are no longer kept,
+    which makes it fetch the session.
+
+    Connected players are tracked in `fobbage.quizes.presence`, without
+    queries, the group gets a `presence_message` when one comes or goes.
+
+    Everything is sent through a `SendQueue`, when it is full the session
+    broadcasts collapse into one without a patch. Clients tell which version
+    they read with `{"action": "seen", "version": ..}`, ones that stay too
+    far behind are disconnected.
+    """
+    serializers = {
+        'bluff': BluffSerializer,
+        'guess': GuessSerializer,
+    }
+    room_group_name = None
+    queue = None
+
+    async def connect(self):
         self.session_id = self.scope['url_route']['kwargs']['session_id']
-        self.room_group_name = 'session_%s' % self.session_id
+        self.user = self.scope["user"]
+        self.session = await self.get_session()
+        if self.session is None:
+            await self.close()
+            return
+
+        if self.user.is_authenticated:
+            self.username = self.user.username
+        else:
+            self.username = 'anonymous'
+        self.room_group_name = 'session_%s' % self.session.id
+        self.queue = SendQueue(
+            self.send_json, self.close_slow,
+            settings.WEBSOCKET_SEND_QUEUE, settings.WEBSOCKET_SLOW_SECONDS,
+            settings.WEBSOCKET_MAX_LAG)
 
         # Join room group
-        async_to_sync(self.channel_layer.group_add)(
-            self.room_group_name,
-            self.channel_name
-        )
+        if settings.WEBSOCKET_MULTIPLEXER:
+            await get_multiplexer().subscribe(
+                self.room_group_name, self.group_message)
+        else:
+            await self.channel_layer.group_add(
+                self.room_group_name,
+                self.channel_name
+            )
         # accept websocket
-        self.accept()
-        # report user has joined
-        async_to_sync(self.channel_layer.group_send)(
-            self.room_group_name,
-            {
-                'type': 'session_message',
-                'message': 'user joined: {}'.format(self.get_username()),
-                'user': self.get_username(),
-            }
-        )
+        await self.accept()
+        self.queue.start()
+        # after joining the group, so nothing falls in between
+        await self.replay()
+        if not self.user.is_authenticated:
+            # spectators join silently, each join is sent to the whole group
+            return
+        await presence.join(self.session.id, self.user)
 
-    def disconnect(self, close_code):
+    async def disconnect(self, close_code):
         # Leave room group
-        async_to_sync(self.channel_layer.group_discard)(
-            self.room_group_name,
-            self.channel_name
-        )
-
-    def get_username(self):
-        self.user = self.scope["user"]
-        self.session = Session.objects.get(id=self.session_id)
+        if not self.room_group_name:
+            return
+        self.queue.stop()
         if self.user.is_authenticated:
-            return self.user.username
+            await presence.leave(self.session.id, self.user)
+        if settings.WEBSOCKET_MULTIPLEXER:
+            await get_multiplexer().unsubscribe(
+                self.room_group_name, self.group_message)
         else:
-            return 'anonymous'
+            await self.channel_layer.group_discard(
+                self.room_group_name,
+                self.channel_name
+            )
+
+    async def group_message(self, message):
+        """A message of the group, from the multiplexer"""
+        # not self.dispatch, it closes old database connections in a thread
+        # for every message
+        await getattr(self, get_handler_name(message))(message)
+
+    async def replay(self):
+        query = parse_qs(self.scope.get('query_string', b'').decode())
+        try:
+            last_seq = int(query['last_seq'][0])
+        except (KeyError, ValueError):
+            return
+        events = await database_sync_to_async(session_events)(
+            self.session.id, last_seq)
+        if events is None:
+            events = [(None, None)]
+        for version, patch in events:
+            await self.session_message({
+                'type': 'session_message',
+                'session_id': self.session.id,
+                'version': version,
+                'patch': patch,
+            })
+
+    async def close_slow(self):
+        await self.close(code=SLOW_CLOSE_CODE)
+
+    @database_sync_to_async
+    def get_session(self):
+        try:
+            return Session.objects.get(id=self.session_id)
+        except (Session.DoesNotExist, ValueError):
+            return None
+
+    @database_sync_to_async
+    def submit(self, action, content):
+        """Validate and save a bluff or guess, returns the ack"""
+        if settings.GAME_ENGINE == 'memory':
+            return self.play(action, content)
+
+        serializer = self.serializers[action](
+            data=content,
+            # the serializers only read the user from the request
+            context={'request': SimpleNamespace(user=self.user)},
+        )
+        try:
+            with coalesce_broadcasts():
+                serializer.is_valid(raise_exception=True)
+                serializer.save()
+        except ValidationError as error:
+            return {'ok': False, 'errors': error.detail}
+        return {'ok': True, 'data': serializer.data}
+
+    def play(self, action, content):
+        """Apply a bluff or guess to the in-memory engine"""
+        try:
+            if action == 'bluff':
+                data = {'fobbit': int(content['fobbit']),
+                        'text': str(content['text'])}
+                error = engine.bluff(
+                    self.session.id, self.user.id,
+                    data['fobbit'], data['text'])
+            else:
+                data = {'answer': int(content['answer'])}
+                error = engine.guess(
+                    self.session.id, self.user.id, data['answer'])
+        except (KeyError, TypeError, ValueError):
+            error = 'invalid {}'.format(action)
+        if error:
+            return {'ok': False, 'errors': [error]}
+        return {'ok': True, 'data': data}
 
     # Receive message from WebSocket
-    def receive_json(self, content, **kwargs):
-        user = self.get_username()
+    async def receive_json(self, content, **kwargs):
         if 'message' in content:
             message = content['message']
 
             # Send message to room group
-            async_to_sync(self.channel_layer.group_send)(
+            await self.channel_layer.group_send(
                 self.room_group_name,
                 {
                     'type': 'chat_message',
                     'message': message,
-                    'user': user,
+                    'user': self.username,
                 }
             )
 
-        elif 'answer' in content:
-            answer = Bluff.objects.create(
-                player=self.user,
-                question=self.session.active_fobbit,
-                text=content['answer']
-            )
+        elif content.get('action') == 'seen':
+            version = content.get('version')
+            if isinstance(version, int):
+                self.queue.ack(version)
 
-            # Send message to room group
-            async_to_sync(self.channel_layer.group_send)(
-                self.room_group_name,
-                {
-                    'type': 'chat_message',
-                    'message': answer.text,
-                    'user': user,
-                }
-            )
+        elif content.get('action') in self.serializers:
+            if self.user.is_authenticated:
+                ack = await self.submit(content['action'], content)
+            else:
+                ack = {'ok': False, 'errors': ['not logged in']}
+            # acks are never dropped, the client waits for them
+            self.queue.put(dict(
+                ack, type='ack', request_id=content.get('request_id')),
+                force=True)
 
     # Receive message from room group
-    def session_message(self, event):
-        # Send message to WebSocket
-        self.send(text_data=json.dumps(event))
+    async def session_message(self, event):
+        # when the client falls behind, it fetches the latest version
+        self.queue.put(
+            event, collapse=lambda: dict(event, patch=None),
+            version=event.get('version'))
 
     # Receive message from room group
-    def user_joined(self):
-        user = self.get_username()
+    async def chat_message(self, event):
+        self.queue.put(event)
+
+    async def presence_message(self, event):
+        self.queue.put(event)
+
+
+class SpectatorConsumer(AsyncWebsocketConsumer):
+    """
+    Read only websocket of a session, for an audience
+
+    Not authenticated and without a channel of its own, the messages come
+    from the `SpectatorHub` of the session. Spectators only send which
+    version they read, `{"action": "seen", "version": ..}`.
+    """
+    channel_layer_alias = None
+    hub = None
+
+    async def connect(self):
+        self.hub = await get_hub(
+            int(self.scope['url_route']['kwargs']['session_id']))
+        if self.hub is None:
+            await self.close()
+            return
+        await self.accept()
+        self.queue = SendQueue(
+            self.send_frame, self.close_slow,
+            settings.WEBSOCKET_SEND_QUEUE, settings.WEBSOCKET_SLOW_SECONDS,
+            settings.WEBSOCKET_MAX_LAG)
+        self.queue.start()
+        await self.hub.join(self)
 
-        # Send message to WebSocket
-        self.send(text_data=json.dumps({
-            'message': 'user joined: {}'.format(user)
-        }))
+    async def send_frame(self, frame):
+        await self.send(text_data=frame)
+
+    async def close_slow(self):
+        await self.close(code=SLOW_CLOSE_CODE)
+
+    async def disconnect(self, close_code):
+        if self.hub is not None:
+            self.queue.stop()
+            await self.hub.leave(self)
+
+    async def receive(self, text_data=None, bytes_data=None):
+        try:
+            content = json.loads(text_data)
+        except (TypeError, ValueError):
+            return
+        if isinstance(content, dict) and content.get('action') == 'seen' \
+                and isinstance(content.get('version'), int):
+            self.queue.ack(content['version'])
 
 
 class EchoConsumer(SyncConsumer):
     def test(self, event):
         print(event['message'])
+
+
+class PhaseTimerConsumer(AsyncConsumer):
+    """Feeds the deadlines sent to the phase-timers channel to the scheduler"""
+
+    async def phase_timer(self, event):
+        scheduler.schedule(event['fobbit'], event['status'], event['deadline'])
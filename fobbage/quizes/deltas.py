@@ -0,0 +1,124 @@
+"""
+Versioned session state deltas
+
+Every broadcast about a session carries a version and a patch with the
+parts of a compact session state that changed since the previous version.
+Clients that have the previous version apply the patch, clients that missed
+a version fetch the full session again.
+
+The last `SESSION_LOG_SIZE` patches of a session are kept as events, a
+websocket that reconnects with the version it has gets the missed ones
+replayed instead of fetching the session.
+"""
+from django.conf import settings
+from django.db import transaction
+
+from .models import Fobbit, Session, SessionEvent, SessionState
+from .scoring import recorded_scores
+
+
+def session_version(session_id):
+    """Current version of a session, 0 before its first broadcast"""
+    return SessionState.objects.filter(
+        session_id=session_id).values_list('version', flat=True).first() or 0
+
+
+def session_state(session_id):
+    """
+    Compact state of a session, the fields clients update live
+
+    Players fetch the whole session when `active_fobbit` or `status` is in a
+    patch, those change fields that are not in the state. Spectators only
+    get the state.
+    """
+    session = Session.objects.select_related(
+        'active_fobbit__question').get(id=session_id)
+    fobbit = session.active_fobbit
+
+    state = {
+        'active_fobbit': fobbit.id if fobbit else None,
+        'scores': {
+            str(player_id): int(score)
+            for player_id, score in recorded_scores(session).items()
+        },
+    }
+    if fobbit:
+        without_bluff = list(session.players.exclude(
+            bluffs__fobbit=fobbit).values('id', 'username'))
+        without_guess = list(session.players.exclude(
+            guesses__answer__fobbit=fobbit).values('id', 'username'))
+        question = fobbit.question
+        state.update(
+            question={
+                'id': question.id, 'text': question.text,
+                'image_url': question.image_url,
+            },
+            status=fobbit.status,
+            players_without_bluff=without_bluff,
+            players_without_bluff_count=len(without_bluff),
+            players_without_guess=without_guess,
+            players_without_guess_count=len(without_guess),
+            answers=list(fobbit.answers.values(
+                'id', 'text', 'fobbit', 'order'))
+            if fobbit.status >= Fobbit.GUESS else [],
+        )
+    return state
+
+
+def session_patch(session_id):
+    """
+    Bump the version of a session
+
+    The version and the last state are stored in the database and the
+    session row is locked while the new state is read, so every process and
+    thread sees the same versions in the same order as the states.
+
+    returns the new version and the parts of the state that changed
+    """
+    with transaction.atomic():
+        # raises DoesNotExist when the session was deleted
+        Session.objects.select_for_update().only('id').get(id=session_id)
+        last, _ = SessionState.objects.get_or_create(session_id=session_id)
+        state = session_state(session_id)
+        patch = {
+            key: value for key, value in state.items()
+            if key not in last.state or last.state[key] != value
+        }
+        last.version += 1
+        last.state = state
+        last.save()
+        SessionEvent.objects.create(
+            session_id=session_id, seq=last.version, patch=patch)
+        SessionEvent.objects.filter(
+            session_id=session_id,
+            seq__lte=last.version - settings.SESSION_LOG_SIZE,
+        ).delete()
+    return last.version, patch
+
+
+def last_state(session_id):
+    """
+    The version and state of the last broadcast about a session
+
+    raises Session.DoesNotExist
+    """
+    last = SessionState.objects.filter(session_id=session_id).first()
+    if last is not None:
+        return last.version, last.state
+    # not broadcast yet
+    return 0, session_state(session_id)
+
+
+def session_events(session_id, last_seq):
+    """
+    The (version, patch) events of a session after version `last_seq`
+
+    returns None when some of them are no longer kept
+    """
+    events = list(SessionEvent.objects.filter(
+        session_id=session_id, seq__gt=last_seq,
+    ).values_list('seq', 'patch'))
+    if events:
+        return events if events[0][0] == last_seq + 1 else None
+    # nothing missed, unless the client is ahead of us
+    return [] if last_seq == session_version(session_id) else None
@@ -0,0 +1,259 @@
+"""
+In-memory game engine
+
+With `GAME_ENGINE = 'memory'` the websocket bluffs and guesses of the active
+fobbit of a session are checked against and applied to a compact in-memory
+state, and written to the database in batches (write-behind): when
+`WRITE_BEHIND_BATCH` actions are pending, every `WRITE_BEHIND_SECONDS` and
+before a phase ends. Ending a phase (generating answers, finishing and
+scoring) still goes through the models, the database stays the source of
+truth and the state is loaded again from it afterwards.
+
+The state lives in the process, so every session has to be played through a
+single process. Changes to sessions, fobbits, bluffs and guesses that don't
+come from the engine mark the state as stale, it is loaded again on the next
+action. An action that can't be written, e.g. a bluff the player also made
+over the REST api meanwhile, is dropped on its own.
+Actions are acknowledged before they are written, a crash loses the actions
+of the last `WRITE_BEHIND_SECONDS`.
+"""
+import atexit
+import logging
+import threading
+
+from django.conf import settings
+from django.db import DataError, IntegrityError, transaction
+from django.db.models.signals import m2m_changed, post_save
+from django.dispatch import receiver
+from rest_framework.exceptions import ValidationError
+
+from .messages import session_updated
+from .models import Answer, Bluff, Fobbit, FobbitProgress, Guess, Session
+from .serializers import BluffSerializer
+
+logger = logging.getLogger(__name__)
+
+
+class LiveSession:
+    """State of the active fobbit of a session"""
+    __slots__ = (
+        'session_id', 'fobbit_id', 'status', 'players', 'answers',
+        'bluffed', 'guessed', 'pending_bluffs', 'pending_guesses', 'stale',
+    )
+
+    def __init__(self, session_id):
+        self.session_id = session_id
+        self.stale = False
+        self.pending_bluffs = []
+        self.pending_guesses = []
+        session = Session.objects.select_related(
+            'active_fobbit').get(id=session_id)
+        fobbit = session.active_fobbit
+        self.fobbit_id = fobbit.id if fobbit else None
+        self.status = fobbit.status if fobbit else None
+        self.players = frozenset(
+            session.players.values_list('id', flat=True))
+        self.answers = frozenset(Answer.objects.filter(
+            fobbit_id=self.fobbit_id).values_list('id', flat=True))
+        self.bluffed = set(Bluff.objects.filter(
+            fobbit_id=self.fobbit_id).values_list('player_id', flat=True))
+        self.guessed = set(Guess.objects.filter(
+            answer__fobbit_id=self.fobbit_id).values_list(
+                'player_id', flat=True))
+
+    @property
+    def pending(self):
+        return len(self.pending_bluffs) + len(self.pending_guesses)
+
+
+class Engine:
+    def __init__(self, batch_size=500, interval=0.5):
+        self.batch_size = batch_size
+        self.interval = interval
+        self.sessions = {}
+        # actions are microseconds, one lock keeps it simple
+        self._lock = threading.RLock()
+        self._thread = None
+        self.stats = {
+            'actions': 0, 'flushes': 0, 'written': 0, 'rejected': 0,
+            'loads': 0}
+        # validates the text of bluffs like the REST api does
+        self._bluff_text = BluffSerializer().fields['text']
+
+    def _live(self, session_id):
+        live = self.sessions.get(session_id)
+        if live is None or live.stale:
+            if live is not None:
+                self._flush(live)
+            live = self.sessions[session_id] = LiveSession(session_id)
+            self.stats['loads'] += 1
+        return live
+
+    def bluff(self, session_id, player_id, fobbit_id, text):
+        """Returns None when the bluff was accepted, otherwise the error"""
+        try:
+            text = self._bluff_text.run_validation(text)
+        except ValidationError as error:
+            return str(error.detail[0])
+        self.start()
+        with self._lock:
+            live = self._live(session_id)
+            if player_id not in live.players:
+                return 'player is not playing this session'
+            if fobbit_id != live.fobbit_id or live.status != Fobbit.BLUFF:
+                return 'not bluffing on this question'
+            if player_id in live.bluffed:
+                return 'player already bluffed for this question'
+
+            live.bluffed.add(player_id)
+            live.pending_bluffs.append(Bluff(
+                fobbit_id=fobbit_id, player_id=player_id, text=text))
+            self.stats['actions'] += 1
+            if len(live.bluffed) >= len(live.players):
+                self._end_phase(live, Fobbit.bluffing_complete)
+            elif live.pending >= self.batch_size:
+                self._flush(live)
+
+    def guess(self, session_id, player_id, answer_id):
+        """Returns None when the guess was accepted, otherwise the error"""
+        self.start()
+        with self._lock:
+            live = self._live(session_id)
+            if player_id not in live.players:
+                return 'player is not playing this session'
+            if answer_id not in live.answers or live.status != Fobbit.GUESS:
+                return 'not guessing on this answer'
+            if player_id in live.guessed:
+                return 'you already made a guess for this question'
+
+            live.guessed.add(player_id)
+            live.pending_guesses.append(Guess(
+                answer_id=answer_id, player_id=player_id))
+            self.stats['actions'] += 1
+            if len(live.guessed) >= len(live.players):
+                self._end_phase(live, Fobbit.guessing_complete)
+            elif live.pending >= self.batch_size:
+                self._flush(live)
+
+    def _end_phase(self, live, complete):
+        self._flush(live)
+        fobbit = Fobbit.objects.select_related('session').get(
+            id=live.fobbit_id)
+        complete(fobbit)
+        live.stale = True
+
+    def _flush(self, live):
+        """Write the pending actions of a session"""
+        bluffs, live.pending_bluffs = live.pending_bluffs, []
+        guesses, live.pending_guesses = live.pending_guesses, []
+        if not bluffs and not guesses:
+            return
+        try:
+            with transaction.atomic():
+                # no signals, the counters and broadcast are done once
+                try:
+                    with transaction.atomic():
+                        Bluff.objects.bulk_create(bluffs)
+                        Guess.objects.bulk_create(guesses)
+                except (DataError, IntegrityError):
+                    # e.g. a player that also bluffed over the REST api,
+                    # the other players keep their acknowledged actions
+                    bluffs = self._write_each(bluffs)
+                    guesses = self._write_each(guesses)
+                    live.stale = True
+                FobbitProgress.count(
+                    live.fobbit_id, bluffs=len(bluffs), guesses=len(guesses))
+                session_updated(live.session_id)
+        except Exception:
+            logger.exception(
+                'Could not write %s actions of session %s',
+                len(bluffs) + len(guesses), live.session_id)
+            live.stale = True
+            return
+        self.stats['flushes'] += 1
+        self.stats['written'] += len(bluffs) + len(guesses)
+
+    def _write_each(self, objects):
+        """Write the objects one by one, returns the ones written"""
+        written = []
+        for obj in objects:
+            try:
+                with transaction.atomic():
+                    type(obj).objects.bulk_create([obj])
+            except (DataError, IntegrityError):
+                logger.warning(
+                    'Could not write the %s of player %s',
+                    type(obj).__name__.lower(), obj.player_id, exc_info=True)
+                self.stats['rejected'] += 1
+            else:
+                written.append(obj)
+        return written
+
+    def flush(self):
+        """Write the pending actions of every session"""
+        with self._lock:
+            for live in list(self.sessions.values()):
+                self._flush(live)
+
+    def invalidate(self, session_id):
+        """Load the state again on the next action"""
+        live = self.sessions.get(session_id)
+        if live is not None:
+            live.stale = True
+
+    def invalidate_fobbit(self, fobbit_id):
+        """Load the state of the session playing the fobbit again"""
+        for live in list(self.sessions.values()):
+            if live.fobbit_id == fobbit_id:
+                live.stale = True
+
+    def start(self):
+        if self._thread is None or not self._thread.is_alive():
+            self._thread = threading.Thread(
+                target=self._write_behind, name='engine-write-behind',
+                daemon=True)
+            self._thread.start()
+
+    def _write_behind(self):
+        stop = threading.Event()
+        while not stop.wait(self.interval):
+            try:
+                self.flush()
+            except Exception:
+                logger.exception('Write-behind failed')
+
+
+engine = Engine(
+    batch_size=settings.WRITE_BEHIND_BATCH,
+    interval=settings.WRITE_BEHIND_SECONDS,
+)
+
+atexit.register(engine.flush)
+
+
+@receiver(post_save, sender=Session)
+def session_saved(sender, instance, **kwargs):
+    engine.invalidate(instance.id)
+
+
+@receiver(post_save, sender=Fobbit)
+def fobbit_saved(sender, instance, **kwargs):
+    engine.invalidate(instance.session_id)
+
+
+@receiver(m2m_changed, sender=Session.players.through)
+def players_changed(sender, instance, **kwargs):
+    if isinstance(instance, Session):
+        engine.invalidate(instance.id)
+
+
+# bluffs and guesses made over the REST api, the engine writes without
+# signals
+@receiver(post_save, sender=Bluff)
+def bluff_saved(sender, instance, **kwargs):
+    engine.invalidate_fobbit(instance.fobbit_id)
+
+
+@receiver(post_save, sender=Guess)
+def guess_saved(sender, instance, **kwargs):
+    engine.invalidate_fobbit(instance.answer.fobbit_id)
@@ -1,15 +1,155 @@
+"""
+Session broadcasts
+
+Saving a single object can fire several `post_save` signals for the same
+session. `session_updated` only marks a session as changed, the changed
+sessions are broadcast once when the transaction commits, or at the end of a
+`coalesce_broadcasts` block such as a request.
+
+The sessions changed in a transaction are kept by the commit callback of that
+transaction. When the transaction rolls back Django drops the callback, and
+the changes go with it.
+"""
+import logging
+import threading
+import weakref
+from collections import Counter
+from contextlib import contextmanager
+
 from channels.layers import get_channel_layer
 from asgiref.sync import async_to_sync
+from django.conf import settings
+from django.core.exceptions import ObjectDoesNotExist
+from django.db import transaction
+
+from . import snapshots
+from .outbox import outbox
+
+logger = logging.getLogger(__name__)
 
 channel_layer = get_channel_layer()
 
+_local = threading.local()
+
+# updates, suppressed (already pending) and sent broadcasts
+_stats = Counter()
+_stats_lock = threading.Lock()
+
+
+def _count(key):
+    with _stats_lock:
+        _stats[key] += 1
+
+
+def broadcast_stats():
+    """Copy of the broadcast counters"""
+    with _stats_lock:
+        return dict(_stats)
+
+
+class _TransactionFlush:
+    """Commit callback, broadcasts the sessions changed in a transaction"""
+
+    def __init__(self):
+        self.session_ids = set()
+        self.done = False
+
+    def add(self, session_id):
+        if session_id in self.session_ids:
+            _count('suppressed')
+        self.session_ids.add(session_id)
+
+    def __call__(self):
+        self.done = True
+        if getattr(_local, 'depth', 0):
+            # committed in a coalesce_broadcasts block, wait for its end
+            for session_id in self.session_ids:
+                _add_pending(session_id)
+        else:
+            flush(self.session_ids)
+
+
+def _transaction_flush():
+    """Commit callback of the current transaction, registered on first use"""
+    ref = getattr(_local, 'transaction', None)
+    # dead when the transaction rolled back and Django dropped the callback
+    callback = ref() if ref is not None else None
+    if callback is None or callback.done:
+        callback = _TransactionFlush()
+        transaction.on_commit(callback)
+        _local.transaction = weakref.ref(callback)
+    return callback
+
+
+def _add_pending(session_id):
+    if session_id in _local.pending:
+        _count('suppressed')
+    _local.pending.add(session_id)
+
 
 def session_updated(session_id):
-    # send to channel_layer
-    async_to_sync(channel_layer.group_send)(
-        f"session_{session_id}",
-        {
-            "type": "session_message",
-            "session_id": session_id,
-        },
-    )
+    """Mark a session as changed, it is broadcast once per transaction"""
+    _count('updates')
+    snapshots.invalidate(session_id)
+    if transaction.get_connection().in_atomic_block:
+        _transaction_flush().add(session_id)
+    elif getattr(_local, 'depth', 0):
+        # wait for the end of the coalesce_broadcasts block
+        _add_pending(session_id)
+    else:
+        flush([session_id])
+
+
+@contextmanager
+def coalesce_broadcasts():
+    """Broadcast every changed session once, at the end of the block"""
+    if not getattr(_local, 'depth', 0):
+        _local.depth = 0
+        _local.pending = set()
+    _local.depth += 1
+    try:
+        yield
+    finally:
+        _local.depth -= 1
+        if not _local.depth:
+            session_ids, _local.pending = _local.pending, set()
+            if transaction.get_connection().in_atomic_block:
+                # the block ended inside a transaction, wait for its commit
+                for session_id in session_ids:
+                    _transaction_flush().add(session_id)
+            else:
+                flush(session_ids)
+
+
+def flush(session_ids):
+    """Broadcast the given sessions"""
+    for session_id in sorted(session_ids):
+        broadcast(session_id)
+    if session_ids:
+        logger.debug('Broadcast stats: %s', broadcast_stats())
+
+
+def broadcast(session_id):
+    # imported here, the models import this module
+    from .deltas import session_patch
+
+    try:
+        version, patch = session_patch(session_id)
+    except ObjectDoesNotExist:
+        # deleted in the same transaction
+        return
+
+    group = f"session_{session_id}"
+    message = {
+        "type": "session_message",
+        "session_id": session_id,
+        "version": version,
+        "patch": patch,
+    }
+    if settings.BROADCAST_OUTBOX:
+        # don't wait for the channel layer
+        outbox.put(group, message)
+    else:
+        # send to channel_layer
+        async_to_sync(channel_layer.group_send)(group, message)
+    _count('sent')
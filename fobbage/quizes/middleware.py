@@ -0,0 +1,12 @@
+from .messages import coalesce_broadcasts
+
+
+class BroadcastMiddleware:
+    """Broadcast each session changed by a request only once"""
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        with coalesce_broadcasts():
+            return self.get_response(request)
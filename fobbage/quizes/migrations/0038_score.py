@@ -0,0 +1,30 @@
+# Generated by Django 5.2.18 on 2026-10-17 03:43
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('quizes', '0037_auto_20220219_1902'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='Score',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('score', models.FloatField(default=0)),
+                ('fobbit', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='scores', to='quizes.fobbit')),
+                ('player', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='scores', to=settings.AUTH_USER_MODEL)),
+                ('session', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='scores', to='quizes.session')),
+            ],
+            options={
+                'indexes': [models.Index(fields=['session', 'player'], name='quizes_scor_session_8997d9_idx')],
+                'unique_together': {('fobbit', 'player')},
+            },
+        ),
+    ]
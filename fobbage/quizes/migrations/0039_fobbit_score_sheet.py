@@ -0,0 +1,18 @@
+# Generated by Django 5.2.18 on 2026-10-17 03:44
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('quizes', '0038_score'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='fobbit',
+            name='score_sheet',
+            field=models.JSONField(blank=True, default=None, null=True),
+        ),
+    ]
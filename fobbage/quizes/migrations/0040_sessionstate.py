@@ -0,0 +1,22 @@
+# Generated by Django 5.2.18 on 2026-10-17 04:10
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('quizes', '0039_fobbit_score_sheet'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='SessionState',
+            fields=[
+                ('session', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='broadcast_state', serialize=False, to='quizes.session')),
+                ('version', models.PositiveBigIntegerField(default=0)),
+                ('state', models.JSONField(default=dict)),
+            ],
+        ),
+    ]
@@ -0,0 +1,23 @@
+# Generated by Django 5.2.18 on 2026-10-17 04:21
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('quizes', '0040_sessionstate'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='QuestionDeck',
+            fields=[
+                ('session', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='deck', serialize=False, to='quizes.session')),
+                ('question_ids', models.JSONField(default=list)),
+                ('cursor', models.PositiveIntegerField(default=0)),
+                ('seed', models.BigIntegerField(blank=True, null=True)),
+            ],
+        ),
+    ]
@@ -0,0 +1,33 @@
+# Generated by Django 5.2.18 on 2026-10-17 04:22
+
+import django.db.models.deletion
+from django.db import migrations, models
+from django.db.models import Count
+
+
+def count_bluffs(apps, schema_editor):
+    Fobbit = apps.get_model('quizes', 'Fobbit')
+    FobbitProgress = apps.get_model('quizes', 'FobbitProgress')
+    FobbitProgress.objects.bulk_create(
+        FobbitProgress(fobbit_id=fobbit['id'], bluffs=fobbit['n'])
+        for fobbit in Fobbit.objects.annotate(
+            n=Count('bluffs')).values('id', 'n').iterator()
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('quizes', '0041_questiondeck'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='FobbitProgress',
+            fields=[
+                ('fobbit', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='progress', serialize=False, to='quizes.fobbit')),
+                ('bluffs', models.PositiveIntegerField(default=0)),
+            ],
+        ),
+        migrations.RunPython(count_bluffs, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,31 @@
+# Generated by Django 5.2.18 on 2026-10-17 04:25
+
+from django.db import migrations, models
+from django.db.models import Count, OuterRef, Subquery
+
+
+def count_guesses(apps, schema_editor):
+    Guess = apps.get_model('quizes', 'Guess')
+    FobbitProgress = apps.get_model('quizes', 'FobbitProgress')
+    guesses = Guess.objects.filter(
+        answer__fobbit=OuterRef('fobbit'),
+    ).values('answer__fobbit').annotate(n=Count('*')).values('n')
+    FobbitProgress.objects.filter(
+        fobbit__answers__guesses__isnull=False,
+    ).update(guesses=Subquery(guesses))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('quizes', '0042_fobbitprogress'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='fobbitprogress',
+            name='guesses',
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.RunPython(count_guesses, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 5.2.18 on 2026-10-17 04:28
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('quizes', '0043_fobbitprogress_guesses'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='fobbit',
+            name='deadline',
+            field=models.DateTimeField(blank=True, null=True),
+        ),
+    ]
@@ -0,0 +1,29 @@
+# Generated by Django 5.2.18 on 2026-10-17 05:19
+
+from django.db import migrations, models
+from django.db.models import Q
+
+
+def mark_scored(apps, schema_editor):
+    Fobbit = apps.get_model('quizes', 'Fobbit')
+    # finishing writes the ledger and the score sheet together, a fobbit
+    # nobody scored on only has the sheet
+    Fobbit.objects.filter(
+        Q(scores__isnull=False) | Q(score_sheet__isnull=False),
+    ).update(scored=True)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('quizes', '0045_sessionevent'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='fobbit',
+            name='scored',
+            field=models.BooleanField(default=False),
+        ),
+        migrations.RunPython(mark_scored, migrations.RunPython.noop),
+    ]
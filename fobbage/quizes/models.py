@@ -2,17 +2,26 @@
 The different models that together make out a quiz
 """
 import random
+from datetime import timedelta
 
-from django.db import models
+from django.db import models, transaction
+from django.db.models import Count, F, OuterRef, Subquery
 from django.contrib.auth import get_user_model
-from django.db.models.signals import post_save
+from django.db.models.signals import m2m_changed, post_delete, post_save
 from django.dispatch import receiver
+from django.utils import timezone
 
 from .messages import session_updated
+from .timers import send_deadline
 
 User = get_user_model()
 
 
+def is_prefetched(instance, relation):
+    """Whether a relation of the instance was loaded by prefetch_related"""
+    return relation in getattr(instance, '_prefetched_objects_cache', {})
+
+
 class Quiz(models.Model):
     title = models.CharField(
         max_length=255,
@@ -126,6 +135,16 @@ class Session(models.Model):
 
         return -1
 
+    def multiplier_for_round(self, round):
+        # get the multiplier from the round
+        if self.rounds:
+            try:
+                return self.rounds[round]['multiplier']
+            except IndexError:
+                return round + 1
+        else:
+            return 1
+
     def questions_in_round(self, round):
         # active round
         try:
@@ -157,18 +176,41 @@ class Session(models.Model):
 
     # move to manager
     def generate_fobbit(self, round):
-        questions = self.quiz.questions.exclude(
-                id__in=[self.fobbits.values_list('question', flat=True)]
-            )
-        question = questions.first()
-
-        return Fobbit.objects.create(
-            question=question,
+        fobbit = Fobbit.objects.create(
+            question_id=self.question_deck().draw(),
             session=self,
             round=round,
         )
+        fobbit.start_timer()
+        return fobbit
+
+    def question_deck(self):
+        """
+        The deck the questions of this session are drawn from
+
+        With `shuffle_questions` in the settings the deck is shuffled
+        """
+        deck, created = QuestionDeck.objects.get_or_create(
+            session=self,
+            defaults={
+                'seed': random.randrange(2 ** 31)
+                if self.settings.get('shuffle_questions') else None,
+            },
+        )
+        if created:
+            # sessions that started before they had a deck
+            asked = list(dict.fromkeys(
+                self.fobbits.values_list('question_id', flat=True)))
+            if asked:
+                deck.question_ids, deck.cursor = asked, len(asked)
+                deck.save(update_fields=['question_ids', 'cursor'])
+            deck.refill()
+        return deck
 
     def new_round(self, round):
+        # questions added to the quiz since the last round
+        self.question_deck().refill()
+
         rounds = self.rounds
         rounds.append(round)
 
@@ -185,6 +227,54 @@ class Session(models.Model):
         return score
 
 
+class QuestionDeck(models.Model):
+    """
+    Questions of a session in the order they are asked
+
+    A fobbit draws the question at the cursor, so a question is never asked
+    twice and drawing does not depend on the history of the session.
+    """
+    session = models.OneToOneField(
+        Session,
+        related_name='deck',
+        on_delete=models.CASCADE,
+        primary_key=True,
+    )
+    question_ids = models.JSONField(default=list)
+    cursor = models.PositiveIntegerField(default=0)
+    # shuffled when set
+    seed = models.BigIntegerField(null=True, blank=True)
+
+    def __str__(self):
+        """ string representation """
+        return "{}: {}/{}".format(
+            self.session_id, self.cursor, len(self.question_ids))
+
+    def refill(self):
+        """Add the questions of the quiz that are not in the deck yet"""
+        new_ids = list(Question.objects.filter(
+            quiz__sessions=self.session_id,
+        ).exclude(id__in=self.question_ids).values_list('id', flat=True))
+        if not new_ids:
+            return
+        if self.seed is not None:
+            random.Random(self.seed + len(self.question_ids)).shuffle(new_ids)
+        self.question_ids = self.question_ids + new_ids
+        self.save(update_fields=['question_ids'])
+
+    def draw(self):
+        """Id of the next question, None when all questions were asked"""
+        while self.cursor < len(self.question_ids):
+            # only one of concurrent draws moves the cursor
+            if QuestionDeck.objects.filter(
+                    pk=self.pk, cursor=self.cursor,
+            ).update(cursor=F('cursor') + 1):
+                self.cursor += 1
+                return self.question_ids[self.cursor - 1]
+            self.refresh_from_db(fields=['cursor'])
+        return None
+
+
 class Fobbit(models.Model):
     """Combination of session and question"""
 
@@ -212,92 +302,197 @@ class Fobbit(models.Model):
         choices=STATUS_CHOICES,
         default=0
     )
+    # end of the bluff or guess phase, see `timers`
+    deadline = models.DateTimeField(null=True, blank=True)
 
     # integer, round details are stored in the session
     round = models.IntegerField(default=0)
 
+    # serialized score sheets, frozen when the fobbit is finished
+    score_sheet = models.JSONField(null=True, blank=True, default=None)
+    # the scores are in the ledger, also when nobody scored
+    scored = models.BooleanField(default=False)
+
     def __str__(self):
         return self.question.text
 
     @property
     def multiplier(self):
-        # get the multiplier from the round
-        if self.session.rounds:
-            try:
-                return self.session.rounds[self.round]['multiplier']
-            except IndexError:
-                return self.round + 1
-        else:
-            return 1
+        return self.session.multiplier_for_round(self.round)
+
+    @property
+    def _guesses_prefetched(self):
+        return (
+            is_prefetched(self, 'answers')
+            and is_prefetched(self.session, 'players'))
+
+    @property
+    def _bluffs_prefetched(self):
+        return (
+            is_prefetched(self, 'bluffs')
+            and is_prefetched(self.session, 'players'))
 
     @property
     def players_without_guess(self):
-        return [
-            player for player in self.session.players.all()
-            if len(player.guesses.filter(answer__fobbit=self)) == 0]
+        if self._guesses_prefetched:
+            # set difference over the prefetched rows
+            guessed = self.guessed_player_ids
+            return [
+                player for player in self.session.players.all()
+                if player.id not in guessed]
+        return list(self.session.players.exclude(
+            guesses__answer__fobbit=self))
 
     @property
     def players_without_bluff(self):
-        return [
-            player for player in self.session.players.all()
-            if len(player.bluffs.filter(fobbit=self)) == 0]
+        if self._bluffs_prefetched:
+            bluffed = self.bluffed_player_ids
+            return [
+                player for player in self.session.players.all()
+                if player.id not in bluffed]
+        return list(self.session.players.exclude(bluffs__fobbit=self))
+
+    @property
+    def players_without_guess_count(self):
+        if self._guesses_prefetched:
+            return len(self.players_without_guess)
+        return self.session.players.exclude(
+            guesses__answer__fobbit=self).count()
+
+    @property
+    def players_without_bluff_count(self):
+        if self._bluffs_prefetched:
+            return len(self.players_without_bluff)
+        return self.session.players.exclude(bluffs__fobbit=self).count()
+
+    @property
+    def bluffed_player_ids(self):
+        if is_prefetched(self, 'bluffs'):
+            return {bluff.player_id for bluff in self.bluffs.all()}
+        return set(self.bluffs.values_list('player_id', flat=True))
+
+    @property
+    def guessed_player_ids(self):
+        if is_prefetched(self, 'answers'):
+            return {
+                guess.player_id
+                for answer in self.answers.all()
+                for guess in answer.guesses.all()
+            }
+        return set(Guess.objects.filter(
+            answer__fobbit=self).values_list('player_id', flat=True))
 
     @property
     def scored_answers(self):
         if self.status == self.FINISHED:
             return self.answers.annotate(
                 num_guesses=models.Count('guesses')
-            ).order_by('is_correct', 'num_guesses')
+            ).order_by('is_correct', 'num_guesses', 'order')
         else:
-            return self.answers.empty()
-
-    def generate_answers(self):
+            return self.answers.none()
+
+    def start_timer(self):
+        """Set the deadline of the current phase, from the session settings"""
+        seconds = self.session.settings.get(
+            {self.BLUFF: 'bluff_seconds', self.GUESS: 'guess_seconds'}.get(
+                self.status))
+        if not seconds and self.deadline is None:
+            return
+        self.deadline = (
+            timezone.now() + timedelta(seconds=seconds) if seconds else None)
+        Fobbit.objects.filter(id=self.id).update(deadline=self.deadline)
+        send_deadline(self)
+
+    def stop_timer(self):
+        """Clear the deadline, it is saved with the fobbit"""
+        if self.deadline is not None:
+            self.deadline = None
+            send_deadline(self)
+
+    def generate_answers(self, force=False):
         """
         Creates a new list of possible answers
         use a combination of bluffs and the correct answer
+
+        Forced when the bluff deadline passed, players without a bluff are
+        then left out.
         """
-        if len(self.session.players.all()) == 0:
+        if not self.session.players.exists():
             return False
 
         # Check if all players have bluffed
-        if len(self.bluffs.all()) != len(self.session.players.all()):
+        if not force and self.players_without_bluff_count:
             return False
         # Check if not already listed
         if self.status >= self.GUESS:
             return False
 
-        for answer in self.answers.all():
-            answer.delete()
+        with transaction.atomic():
+            Answer.objects.filter(fobbit=self).delete()
+            FobbitProgress.objects.filter(fobbit=self).update(guesses=0)
 
-        Answer.objects.create(
-            fobbit=self,
-            text=self.question.correct_answer,
-            is_correct=True,
-        )
-
-        for bluff in self.bluffs.all():
-            answer = self.answers.filter(text__iexact=bluff.text).first()
-            if answer is None:
-                answer = Answer.objects.create(
+            # bluffs that only differ in case share an answer
+            answers = {
+                self.question.correct_answer.lower(): Answer(
                     fobbit=self,
-                    text=bluff.text)
+                    text=self.question.correct_answer,
+                    is_correct=True,
+                ),
+            }
+            bluffs = list(Bluff.objects.filter(fobbit=self))
+            for bluff in bluffs:
+                bluff.answer = answers.setdefault(
+                    bluff.text.lower(), Answer(fobbit=self, text=bluff.text))
+
+            shuffled = list(answers.values())
+            random.shuffle(shuffled)
+            for order, answer in enumerate(shuffled, start=1):
+                answer.order = order
+            Answer.objects.bulk_create(shuffled)
+            Bluff.objects.bulk_update(bluffs, ['answer'])
+
+            self.status = Fobbit.GUESS
+            self.stop_timer()
+            self.save()
 
-            bluff.answer = answer
-            bluff.save()
+            # TODO: go to next question
+            # if status is addded before guess
+            self.session.next_question()
+        return True
 
-        answers = [answer for answer in self.answers.all()]
-        random.shuffle(answers)
-        i = 0
-        for answer in answers:
-            answer.order = i = i + 1
-            answer.save()
+    def guessing_complete(self):
+        """
+        Finish the fobbit after the last guess
 
-        self.status = Fobbit.GUESS
-        self.save()
+        Like `bluffing_complete`, only the first of concurrent last guesses
+        finishes it. Hosts that set `auto_finish` to false in the session
+        settings finish it themselves.
+        """
+        if not self.session.settings.get('auto_finish', True):
+            return False
+        with transaction.atomic():
+            self.status = Fobbit.objects.select_for_update().values_list(
+                'status', flat=True).get(id=self.id)
+            if self.status != Fobbit.GUESS:
+                return False
+            try:
+                self.finish()
+            except Guess.DoesNotExist:
+                # a guess was counted twice
+                return False
+        return True
 
-        # TODO: go to next question
-        # if status is addded before guess
-        self.session.next_question()
+    def bluffing_complete(self):
+        """
+        Generate the answers after the last bluff
+
+        Concurrent last bluffs wait for the lock on the fobbit, only the first
+        one generates the answers.
+        """
+        with transaction.atomic():
+            self.status = Fobbit.objects.select_for_update().values_list(
+                'status', flat=True).get(id=self.id)
+            return self.generate_answers()
 
     def score_for_player(self, player):
         score = 0
@@ -326,29 +521,94 @@ class Fobbit(models.Model):
         return score
 
     def reset(self):
-        self.status = Fobbit.BLUFF
-        self.answers.all().delete()
-        self.save()
+        with transaction.atomic():
+            self.status = Fobbit.BLUFF
+            self.score_sheet = None
+            self.scored = False
+            self.scores.all().delete()
+            self.answers.all().delete()
+            FobbitProgress.objects.filter(fobbit=self).update(guesses=0)
+            self.save()
+            self.start_timer()
 
     # FOBBIT
-    def finish(self):
-        """Finish the question if all players have guessed"""
-        if len(self.players_without_guess) == 0:
-            self.status = self.FINISHED
-            self.save()
+    def finish(self, force=False):
+        """
+        Finish the question if all players have guessed, or when forced by
+        the guess deadline
+        """
+        from .scoring import record_scores
+
+        if force or self.players_without_guess_count == 0:
+            with transaction.atomic():
+                self.status = self.FINISHED
+                self.stop_timer()
+                self.save()
+                record_scores(self.session, [self.id])
+                self.scored = True
+                self.freeze_score_sheet()
         else:
             raise Guess.DoesNotExist("Not all players have guessed")
 
+    def freeze_score_sheet(self):
+        """Store the score sheets of a finished fobbit, they can't change"""
+        from .serializers import AnswerScoreSheetSerializer
+
+        self.score_sheet = AnswerScoreSheetSerializer(
+            self.scored_answers, many=True).data
+        self.save(update_fields=['score_sheet'])
+
     def delete_answers(self):
         if self.status < self.FINISHED:
             # self.guesses.delete()
+            self.scores.all().delete()
             self.answers.all().delete()
+            FobbitProgress.objects.filter(fobbit=self).update(guesses=0)
 
             self.status = self.BLUFF
             self.save()
             return True
 
 
+class FobbitProgress(models.Model):
+    """
+    Number of bluffs and guesses of a fobbit
+
+    Counted with `F()` updates as bluffs and guesses come in, so the last one
+    is found without loading the bluffs, guesses and players. Guesses are
+    deleted with their answers, which resets the guess count.
+    """
+    fobbit = models.OneToOneField(
+        Fobbit,
+        related_name='progress',
+        on_delete=models.CASCADE,
+        primary_key=True,
+    )
+    bluffs = models.PositiveIntegerField(default=0)
+    guesses = models.PositiveIntegerField(default=0)
+
+    def __str__(self):
+        """ string representation """
+        return "{}: {} bluffs, {} guesses".format(
+            self.fobbit_id, self.bluffs, self.guesses)
+
+    @classmethod
+    def count(cls, fobbit_id, **changes):
+        cls.objects.filter(fobbit_id=fobbit_id).update(**{
+            field: F(field) + n for field, n in changes.items()})
+
+    @classmethod
+    def complete(cls, fobbit_id, field):
+        """Whether every player of the session is counted"""
+        players = User.playing.through.objects.filter(
+            session_id=OuterRef('fobbit__session_id'),
+        ).values('session_id').annotate(n=Count('*')).values('n')
+        return cls.objects.filter(
+            fobbit_id=fobbit_id,
+            **{field + '__gte': Subquery(players)},
+        ).exists()
+
+
 class Answer(models.Model):
     class Meta:
         ordering = ['order']
@@ -450,29 +710,138 @@ class Guess(models.Model):
             return 0
 
 
+class Score(models.Model):
+    """Score ledger, the score of a player for a finished fobbit"""
+
+    class Meta:
+        unique_together = ("fobbit", "player"),
+        indexes = [
+            models.Index(fields=['session', 'player']),
+        ]
+
+    session = models.ForeignKey(
+        Session,
+        related_name='scores',
+        on_delete=models.CASCADE,
+    )
+    fobbit = models.ForeignKey(
+        Fobbit,
+        related_name='scores',
+        on_delete=models.CASCADE,
+    )
+    player = models.ForeignKey(
+        User,
+        related_name='scores',
+        on_delete=models.CASCADE,
+    )
+    score = models.FloatField(default=0)
+
+    def __str__(self):
+        """ string representation """
+        return "{}: {}".format(self.player, self.score)
+
+
+class SessionState(models.Model):
+    """
+    Version and compact state of the last broadcast about a session
+
+    Kept out of `Session`, so saving a session never overwrites the version
+    with a stale one.
+    """
+    session = models.OneToOneField(
+        Session,
+        related_name='broadcast_state',
+        on_delete=models.CASCADE,
+        primary_key=True,
+    )
+    version = models.PositiveBigIntegerField(default=0)
+    state = models.JSONField(default=dict)
+
+    def __str__(self):
+        """ string representation """
+        return "{} v{}".format(self.session_id, self.version)
+
+
+class SessionEvent(models.Model):
+    """
+    Broadcast about a session, kept to replay to reconnecting websockets
+
+    Only the last `SESSION_LOG_SIZE` events of a session are kept.
+    """
+    class Meta:
+        ordering = ['seq']
+        unique_together = ("session", "seq"),
+
+    session = models.ForeignKey(
+        Session,
+        related_name='events',
+        on_delete=models.CASCADE,
+    )
+    # the version of the session after the broadcast
+    seq = models.PositiveBigIntegerField()
+    patch = models.JSONField(default=dict)
+
+    def __str__(self):
+        """ string representation """
+        return "{} #{}".format(self.session_id, self.seq)
+
+
 @receiver(post_save, sender=Session)
 def session_updated_signal(sender, instance, created, **kwargs):
     session_updated(instance.id)
+    # the guess phase of a fobbit starts when it is made active
+    if instance.settings.get('guess_seconds') and instance.active_fobbit_id:
+        for fobbit in Fobbit.objects.filter(
+                id=instance.active_fobbit_id,
+                status=Fobbit.GUESS, deadline=None):
+            fobbit.session = instance
+            fobbit.start_timer()
+
+
+@receiver(m2m_changed, sender=Session.players.through)
+def players_updated_signal(sender, instance, action, pk_set, **kwargs):
+    if not action.startswith('post_'):
+        return
+    # changed from either side, user.playing or session.players
+    if isinstance(instance, Session):
+        session_updated(instance.id)
+    else:
+        for session_id in pk_set or ():
+            session_updated(session_id)
 
 
 @receiver(post_save, sender=Fobbit)
 def fobbit_updated_signal(sender, instance, created, **kwargs):
-    session_updated(instance.session.id)
+    if created:
+        FobbitProgress.objects.create(fobbit=instance)
+    session_updated(instance.session_id)
 
 
 @receiver(post_save, sender=Bluff)
 def bluff_updated_signal(sender, instance, created, **kwargs):
-    session_updated(instance.fobbit.session.id)
+    session_updated(instance.fobbit.session_id)
     # everyone bluffed?
     if created:
-        if len(instance.fobbit.bluffs.all()) == len(
-                instance.fobbit.session.players.all()):
-            instance.fobbit.generate_answers()
+        FobbitProgress.count(instance.fobbit_id, bluffs=1)
+        if FobbitProgress.complete(instance.fobbit_id, 'bluffs'):
+            instance.fobbit.bluffing_complete()
+
+
+@receiver(post_delete, sender=Bluff)
+def bluff_deleted_signal(sender, instance, **kwargs):
+    session_updated(instance.fobbit.session_id)
+    FobbitProgress.count(instance.fobbit_id, bluffs=-1)
 
 
 @receiver(post_save, sender=Guess)
 def guess_updated_signal(sender, instance, created, **kwargs):
-    session_updated(instance.answer.fobbit.session.id)
+    fobbit = instance.answer.fobbit
+    session_updated(fobbit.session_id)
+    # everyone guessed?
+    if created:
+        FobbitProgress.count(fobbit.id, guesses=1)
+        if FobbitProgress.complete(fobbit.id, 'guesses'):
+            fobbit.guessing_complete()
 
 
 @receiver(post_save, sender=Answer)
@@ -0,0 +1,98 @@
+"""
+Group subscriptions per process
+
+Every websocket of a session joins the `session_N` group, with a channel
+layer like Redis pub/sub each of them receives and decodes every broadcast
+itself. With `WEBSOCKET_MULTIPLEXER` the process joins each group once, on
+its own channel, and hands every message it receives to the consumers of the
+group in the process. Subscriptions are counted, the process leaves a group
+when its last consumer disconnects.
+"""
+import asyncio
+import logging
+import weakref
+
+from channels.layers import get_channel_layer
+
+logger = logging.getLogger(__name__)
+
+
+class _Group:
+    def __init__(self):
+        self.channel = None
+        self.subscribers = []
+        self.reader = None
+        # set once the process channel joined the group
+        self.joined = asyncio.Event()
+
+
+class GroupMultiplexer:
+    def __init__(self, layer):
+        self.layer = layer
+        self.groups = {}
+        self.stats = {'received': 0, 'delivered': 0}
+
+    async def subscribe(self, group, handler):
+        """Call `handler(message)` for the messages sent to the group"""
+        state = self.groups.get(group)
+        if state is None:
+            state = self.groups[group] = _Group()
+            state.subscribers.append(handler)
+            try:
+                state.channel = await self.layer.new_channel()
+                await self.layer.group_add(group, state.channel)
+            except Exception:
+                del self.groups[group]
+                raise
+            finally:
+                state.joined.set()
+            state.reader = asyncio.ensure_future(self._read(state))
+        else:
+            state.subscribers.append(handler)
+            await state.joined.wait()
+
+    async def unsubscribe(self, group, handler):
+        state = self.groups.get(group)
+        if state is None or handler not in state.subscribers:
+            return
+        state.subscribers.remove(handler)
+        if state.subscribers:
+            return
+        # the last one leaves, so does the process
+        del self.groups[group]
+        await state.joined.wait()
+        if state.reader is None:
+            # joining failed
+            return
+        state.reader.cancel()
+        await self.layer.group_discard(group, state.channel)
+
+    def subscriptions(self):
+        """Number of subscribers per group"""
+        return {
+            group: len(state.subscribers)
+            for group, state in self.groups.items()}
+
+    async def _read(self, state):
+        while True:
+            message = await self.layer.receive(state.channel)
+            self.stats['received'] += 1
+            for handler in list(state.subscribers):
+                try:
+                    await handler(message)
+                except Exception:
+                    logger.exception('Could not deliver %s', message['type'])
+                self.stats['delivered'] += 1
+
+
+_multiplexers = weakref.WeakKeyDictionary()
+
+
+def get_multiplexer():
+    """The multiplexer of the running event loop and default channel layer"""
+    loop = asyncio.get_running_loop()
+    layer = get_channel_layer()
+    multiplexer = _multiplexers.get(loop)
+    if multiplexer is None or multiplexer.layer is not layer:
+        multiplexer = _multiplexers[loop] = GroupMultiplexer(layer)
+    return multiplexer
@@ -0,0 +1,128 @@
+"""
+Background broadcast outbox
+
+Request threads put group messages in a bounded queue and return right away.
+A daemon thread with its own event loop drains the queue in batches and
+sends them to the channel layer, so channel layer latency is not part of the
+request. When the queue is full new messages are dropped and counted.
+
+Whatever is still queued when the process exits is sent from an `atexit`
+handler, so management commands don't lose their broadcasts.
+"""
+import asyncio
+import atexit
+import logging
+import queue
+import threading
+from collections import Counter, defaultdict
+
+from channels.layers import get_channel_layer
+from django.conf import settings
+
+logger = logging.getLogger(__name__)
+
+
+class BroadcastOutbox:
+    def __init__(self, maxsize=1000, batch_size=100, layer=None):
+        self.queue = queue.Queue(maxsize=maxsize)
+        self.batch_size = batch_size
+        self.layer = layer
+        # queued, sent, dropped, batches, errors and max_depth
+        self.stats = Counter()
+        self._thread = None
+        self._lock = threading.Lock()
+        # messages queued but not sent yet
+        self._unsent = 0
+        self._sent = threading.Condition(self._lock)
+
+    @property
+    def depth(self):
+        return self.queue.qsize()
+
+    def snapshot(self):
+        """Copy of the stats and the current depth"""
+        with self._lock:
+            return dict(self.stats, depth=self.depth)
+
+    def _count(self, key, n=1):
+        with self._lock:
+            self.stats[key] += n
+
+    def put(self, group, message):
+        """Queue a group message, returns False when it was dropped"""
+        self.start()
+        with self._lock:
+            try:
+                self.queue.put_nowait((group, message))
+            except queue.Full:
+                self.stats['dropped'] += 1
+                return False
+            self._unsent += 1
+            self.stats['queued'] += 1
+            self.stats['max_depth'] = max(
+                self.stats['max_depth'], self.queue.qsize())
+        return True
+
+    def start(self):
+        with self._lock:
+            if self._thread is None or not self._thread.is_alive():
+                self._thread = threading.Thread(
+                    target=self._run, name='broadcast-outbox', daemon=True)
+                self._thread.start()
+
+    def wait(self, timeout=5):
+        """Wait until everything queued was sent, returns False on timeout"""
+        with self._sent:
+            return self._sent.wait_for(lambda: not self._unsent, timeout)
+
+    def _run(self):
+        if self.layer is None:
+            self.layer = get_channel_layer()
+        # the loop stays open, so the layer can keep its connections
+        loop = asyncio.new_event_loop()
+        while True:
+            batch = self._next_batch()
+            loop.run_until_complete(self._send_batch(batch))
+            with self._sent:
+                self._unsent -= len(batch)
+                self._sent.notify_all()
+
+    def _next_batch(self):
+        # block for the first message, then take what is already waiting
+        batch = [self.queue.get()]
+        while len(batch) < self.batch_size:
+            try:
+                batch.append(self.queue.get_nowait())
+            except queue.Empty:
+                break
+        return batch
+
+    async def _send_batch(self, batch):
+        # channel layers have no multi message send, so a batch sends to its
+        # groups concurrently and to each group in order
+        groups = defaultdict(list)
+        for group, message in batch:
+            groups[group].append(message)
+        await asyncio.gather(*(
+            self._send(group, messages)
+            for group, messages in groups.items()))
+        self._count('batches')
+
+    async def _send(self, group, messages):
+        for message in messages:
+            try:
+                await self.layer.group_send(group, message)
+                self._count('sent')
+            except Exception:
+                self._count('errors')
+                logger.exception('Could not broadcast to %s', group)
+
+
+outbox = BroadcastOutbox(maxsize=settings.BROADCAST_OUTBOX_SIZE)
+
+
+@atexit.register
+def _drain_outbox():
+    if outbox._thread is not None and not outbox.wait(timeout=5):
+        logger.warning(
+            'Exited with %s unsent broadcasts', outbox.depth)
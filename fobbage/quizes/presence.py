@@ -0,0 +1,182 @@
+"""
+Who is connected to a session
+
+The players connected over a websocket are kept in the cache, not in the
+database: per session the user ids with their username and, per process
+they are connected to, until when they count as online. Every process
+refreshes its users every `PRESENCE_HEARTBEAT` seconds, users of a process
+that stopped doing so expire after `PRESENCE_TTL` seconds.
+
+Changes are sent to the session group as
+
+    {"type": "presence_message", "session": .., "joined": [..], "left": [..]}
+
+with `{"id": .., "username": ..}` users.
+"""
+import asyncio
+import logging
+import threading
+import time
+import uuid
+import weakref
+
+from asgiref.sync import sync_to_async
+from channels.layers import get_channel_layer
+from django.conf import settings
+from django.core.cache import cache
+
+logger = logging.getLogger(__name__)
+
+# this process in the rosters
+PROCESS = uuid.uuid4().hex
+
+
+def _key(session_id):
+    return 'presence:{}'.format(session_id)
+
+
+def _online(roster):
+    return {
+        int(user_id): entry['username']
+        for user_id, entry in roster.items()}
+
+
+class Presence:
+    def __init__(self):
+        # session id: {user id: [username, connections]} of this process
+        self.local = {}
+        # the roster of a session is read, changed and written back
+        self._lock = threading.Lock()
+
+    def _update(self, session_id, change):
+        """
+        Change the roster of a session, drops the expired users
+
+        returns the joined and left users
+        """
+        now = time.time()
+        with self._lock:
+            roster = cache.get(_key(session_id)) or {}
+            before = _online(roster)
+            change(roster, now + settings.PRESENCE_TTL)
+            for user_id, entry in list(roster.items()):
+                entry['processes'] = {
+                    process: expires
+                    for process, expires in entry['processes'].items()
+                    if expires > now}
+                if not entry['processes']:
+                    del roster[user_id]
+            # kept longer than its entries, so the next update sees who left
+            cache.set(_key(session_id), roster, 2 * settings.PRESENCE_TTL)
+        after = _online(roster)
+        return (
+            [{'id': user_id, 'username': username}
+             for user_id, username in after.items() if user_id not in before],
+            [{'id': user_id, 'username': username}
+             for user_id, username in before.items() if user_id not in after],
+        )
+
+    def join(self, session_id, user_id, username):
+        users = self.local.setdefault(session_id, {})
+        users.setdefault(user_id, [username, 0])[1] += 1
+
+        def change(roster, expires):
+            entry = roster.setdefault(
+                str(user_id), {'username': username, 'processes': {}})
+            entry['processes'][PROCESS] = expires
+        return self._update(session_id, change)
+
+    def leave(self, session_id, user_id):
+        users = self.local.get(session_id, {})
+        if user_id in users:
+            users[user_id][1] -= 1
+            if users[user_id][1] > 0:
+                # still connected from this process
+                return [], []
+            del users[user_id]
+            if not users:
+                del self.local[session_id]
+
+        def change(roster, expires):
+            entry = roster.get(str(user_id))
+            if entry:
+                entry['processes'].pop(PROCESS, None)
+        return self._update(session_id, change)
+
+    def heartbeat(self):
+        """Refresh the users of this process, returns the changes"""
+        changes = {}
+        for session_id, users in list(self.local.items()):
+            users = dict(users)
+
+            def change(roster, expires):
+                for user_id, (username, _) in users.items():
+                    entry = roster.setdefault(
+                        str(user_id), {'username': username, 'processes': {}})
+                    entry['processes'][PROCESS] = expires
+            joined, left = self._update(session_id, change)
+            if joined or left:
+                changes[session_id] = joined, left
+        return changes
+
+    def online(self, session_id):
+        """The connected users of a session"""
+        now = time.time()
+        roster = cache.get(_key(session_id)) or {}
+        return [
+            {'id': int(user_id), 'username': entry['username']}
+            for user_id, entry in roster.items()
+            if any(expires > now for expires in entry['processes'].values())
+        ]
+
+
+presence = Presence()
+
+
+async def send_changes(session_id, joined, left):
+    if joined or left:
+        await get_channel_layer().group_send(
+            'session_{}'.format(session_id), {
+                'type': 'presence_message', 'session': session_id,
+                'joined': joined, 'left': left,
+            })
+
+
+async def join(session_id, user):
+    _start_heartbeat()
+    await send_changes(session_id, *await sync_to_async(presence.join)(
+        session_id, user.id, user.username))
+
+
+async def leave(session_id, user):
+    await send_changes(session_id, *await sync_to_async(presence.leave)(
+        session_id, user.id))
+    if not presence.local:
+        _stop_heartbeat()
+
+
+_heartbeats = weakref.WeakKeyDictionary()
+
+
+def _start_heartbeat():
+    """One heartbeat per event loop"""
+    loop = asyncio.get_running_loop()
+    if loop not in _heartbeats:
+        _heartbeats[loop] = asyncio.ensure_future(_heartbeat())
+
+
+def _stop_heartbeat():
+    heartbeat = _heartbeats.pop(asyncio.get_running_loop(), None)
+    if heartbeat is not None:
+        heartbeat.cancel()
+
+
+async def _heartbeat():
+    while True:
+        await asyncio.sleep(settings.PRESENCE_HEARTBEAT)
+        try:
+            changes = await sync_to_async(presence.heartbeat)()
+            for session_id, (joined, left) in changes.items():
+                await send_changes(session_id, joined, left)
+        except Exception:
+            logger.exception('Presence heartbeat failed')
@@ -0,0 +1,153 @@
+"""
+Set based scoring of a session
+
+Computes the same scores as `Fobbit.score_for_player`, but for every player
+of a session at once, using a fixed number of aggregate queries instead of
+several queries per player and fobbit.
+"""
+from django.db import transaction
+from django.db.models import (
+    BooleanField, Count, ExpressionWrapper, F, Q, Sum,
+)
+
+from .models import Answer, Bluff, Fobbit, Guess, Score
+
+
+def fobbit_scores(session, fobbits=None):
+    """
+    Score every player for the finished fobbits of a session
+
+    returns a dict of {(fobbit_id, player_id): score}, only players that
+    bluffed or guessed on a fobbit are listed.
+    """
+    finished = session.fobbits.filter(status=Fobbit.FINISHED)
+    if fobbits is not None:
+        finished = finished.filter(id__in=fobbits)
+
+    multipliers = {
+        fobbit_id: session.multiplier_for_round(round)
+        for fobbit_id, round in finished.values_list('id', 'round')
+    }
+    if not multipliers:
+        return {}
+
+    # number of guesses and bluffs for every answer
+    answers = {
+        answer_id: (is_correct, num_guesses, num_bluffs)
+        for answer_id, is_correct, num_guesses, num_bluffs in
+        Answer.objects.filter(
+            fobbit__in=multipliers.keys(),
+        ).annotate(
+            num_guesses=Count('guesses', distinct=True),
+            num_bluffs=Count('bluffs', distinct=True),
+        ).order_by().values_list(
+            'id', 'is_correct', 'num_guesses', 'num_bluffs')
+    }
+
+    bluffs = {
+        (fobbit_id, player_id): answer_id
+        for player_id, fobbit_id, answer_id in Bluff.objects.filter(
+            fobbit__in=multipliers.keys(),
+        ).values_list('player_id', 'fobbit_id', 'answer_id')
+    }
+
+    guesses = {
+        (fobbit_id, player_id): (answer_id, is_right)
+        for player_id, fobbit_id, answer_id, is_right in
+        Guess.objects.filter(
+            answer__fobbit__in=multipliers.keys(),
+        ).annotate(
+            is_right=ExpressionWrapper(
+                Q(answer__text=F('answer__fobbit__question__correct_answer')),
+                output_field=BooleanField(),
+            ),
+        ).values_list(
+            'player_id', 'answer__fobbit_id', 'answer_id', 'is_right')
+    }
+
+    scores = {}
+    for key in bluffs.keys() | guesses.keys():
+        scores[key] = _score(
+            multipliers[key[0]], answers, bluffs.get(key, 0), guesses.get(key))
+    return scores
+
+
+def _score(multiplier, answers, bluff_answer, guess):
+    """
+    Mirrors `Fobbit.score_for_player`, `Bluff.score` and `Guess.score`
+
+    `bluff_answer` is 0 when the player did not bluff and None when the
+    bluff is not linked to an answer.
+    """
+    score = 0
+    if bluff_answer:
+        is_correct, num_guesses, num_bluffs = answers[bluff_answer]
+        # 0 punten als jouw bluff = correct antwoord
+        if is_correct:
+            return 0
+
+        if guess and guess[0] != bluff_answer:
+            score += (num_guesses * multiplier * 500) / num_bluffs
+
+    if guess:
+        answer_id, is_right = guess
+        # 0 punten als je op je eigen antwoord stemt
+        if bluff_answer and answer_id == bluff_answer:
+            return 0
+        if is_right:
+            score += multiplier * 1000
+
+    return score
+
+
+def session_scores(session):
+    """
+    Total score of every player in a session
+
+    returns a dict of {player_id: score}
+    """
+    totals = {}
+    # sum in fobbit order to match `Session.score_for_player`
+    for (fobbit_id, player_id), score in sorted(
+            fobbit_scores(session).items()):
+        totals[player_id] = totals.get(player_id, 0) + score
+    return totals
+
+
+def record_scores(session, fobbits):
+    """Write the scores of finished fobbits to the score ledger"""
+    scores = fobbit_scores(session, fobbits=fobbits)
+    with transaction.atomic():
+        Fobbit.objects.filter(id__in=fobbits).update(scored=True)
+        Score.objects.filter(fobbit__in=fobbits).delete()
+        Score.objects.bulk_create([
+            Score(
+                session=session,
+                fobbit_id=fobbit_id,
+                player_id=player_id,
+                score=score,
+            )
+            for (fobbit_id, player_id), score in scores.items()
+        ])
+
+
+def recorded_scores(session):
+    """
+    Total score of every player in a session, read from the score ledger
+
+    Sessions with finished fobbits that are not in the ledger yet (finished
+    before it existed and not backfilled) are scored live instead.
+    `Fobbit.scored` tells, a fobbit nobody scored on has no rows.
+
+    returns a dict of {player_id: score}
+    """
+    if session.fobbits.filter(
+            status=Fobbit.FINISHED, scored=False).exists():
+        return session_scores(session)
+    return dict(
+        Score.objects.filter(
+            session=session,
+        ).values('player').annotate(
+            total=Sum('score'),
+        ).order_by().values_list('player', 'total')
+    )
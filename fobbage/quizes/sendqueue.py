@@ -0,0 +1,161 @@
+"""
+Bounded send queues of websockets
+
+The messages for a websocket are queued and sent by a task of its own, so a
+client that reads slowly only holds up its own messages, not the fan-out of
+the group to the other websockets of the session.
+
+A queue holds `WEBSOCKET_SEND_QUEUE` messages. When it is full:
+
+- a message that can `collapse` replaces the collapsible messages queued
+  before it, e.g. session broadcasts by one that makes the client fetch the
+  session, only the latest version matters
+- other messages are dropped
+
+Servers like daphne buffer what is sent without ever making `send` wait, the
+queue of a client that stopped reading then never fills. So clients also
+tell which session version they read (`ack`), a client that is more than
+`WEBSOCKET_MAX_LAG` versions behind what was queued for it is lagging.
+Clients that never acked are only judged by their queue.
+
+A client whose queue stays full, or that keeps lagging, for
+`WEBSOCKET_SLOW_SECONDS` is disconnected.
+
+The counters, the depth of the queues and the largest lag of this process
+are in `snapshot()`.
+"""
+import asyncio
+import logging
+import time
+import weakref
+from collections import Counter, deque
+
+logger = logging.getLogger(__name__)
+
+# closed for being too slow, see RFC 6455 7.4.1
+SLOW_CLOSE_CODE = 1008
+
+stats = Counter()
+_queues = weakref.WeakSet()
+
+
+def snapshot():
+    """The counters, the queued messages, the deepest queue and largest lag"""
+    queues = list(_queues)
+    depths = [len(queue.messages) for queue in queues]
+    return dict(
+        stats, connections=len(depths), depth=sum(depths),
+        max_depth=max(depths, default=0),
+        max_lag=max((queue.lag for queue in queues), default=0))
+
+
+class SendQueue:
+    def __init__(self, send, close, size=100, slow_after=10, max_lag=None):
+        """`send(payload)` sends a message, `close()` disconnects"""
+        self.send = send
+        self.close = close
+        self.size = size
+        self.slow_after = slow_after
+        self.max_lag = max_lag
+        # (collapsible, payload)
+        self.messages = deque()
+        # the last version queued, and the last the client read
+        self.version = None
+        self.seen = None
+        # since when the client is behind
+        self.slow_since = None
+        self.closed = False
+        self._ready = asyncio.Event()
+        self._writer = None
+        _queues.add(self)
+
+    @property
+    def lag(self):
+        """Number of versions the client is behind, 0 when it never acked"""
+        if self.seen is None or self.version is None:
+            return 0
+        return max(self.version - self.seen, 0)
+
+    def start(self):
+        if self._writer is None:
+            self._writer = asyncio.ensure_future(self._write())
+
+    def stop(self):
+        self.closed = True
+        self.messages.clear()
+        if self._writer is not None:
+            self._writer.cancel()
+
+    def ack(self, version):
+        """The client read `version`"""
+        if self.seen is None or version > self.seen:
+            self.seen = version
+        if not self._behind():
+            self.slow_since = None
+
+    def put(self, payload, collapse=None, force=False, version=None):
+        """
+        Queue a message, returns False when it was dropped
+
+        `collapse()` returns the message to send instead of this one and
+        the collapsible ones queued before it, `force` queues the message
+        even when the queue is full. `version` is the session version the
+        message brings the client to.
+        """
+        if self.closed:
+            return False
+        if version is not None and (
+                self.version is None or version > self.version):
+            self.version = version
+        if self._behind():
+            now = time.monotonic()
+            if self.slow_since is None:
+                self.slow_since = now
+            elif now - self.slow_since > self.slow_after:
+                self._disconnect()
+                return False
+        if len(self.messages) >= self.size and not force:
+            if collapse is None:
+                stats['dropped'] += 1
+                return False
+            kept = deque(
+                message for message in self.messages if not message[0])
+            if len(kept) >= self.size:
+                stats['dropped'] += 1
+                return False
+            stats['collapsed'] += len(self.messages) - len(kept) + 1
+            self.messages = kept
+            payload = collapse()
+        self.messages.append((collapse is not None, payload))
+        stats['queued'] += 1
+        self._ready.set()
+        return True
+
+    def _behind(self):
+        return len(self.messages) >= self.size or (
+            self.max_lag is not None and self.lag > self.max_lag)
+
+    def _disconnect(self):
+        logger.info(
+            'Disconnecting a slow websocket, %s queued, %s versions behind',
+            len(self.messages), self.lag)
+        stats['disconnected'] += 1
+        self.stop()
+        asyncio.ensure_future(self.close())
+
+    async def _write(self):
+        while True:
+            if not self.messages:
+                self._ready.clear()
+                await self._ready.wait()
+                continue
+            _, payload = self.messages.popleft()
+            if not self._behind():
+                self.slow_since = None
+            try:
+                await self.send(payload)
+            except Exception:
+                logger.exception('Could not send to a websocket')
+                stats['errors'] += 1
+            else:
+                stats['sent'] += 1
@@ -1,3 +1,4 @@
+from django.core.exceptions import ObjectDoesNotExist
 from rest_framework import serializers
 # from django.urls import reverse as django_reverse
 # from rest_framework.reverse import reverse
@@ -27,7 +28,7 @@ class BluffSerializer(serializers.ModelSerializer):
         fobbit = attrs['fobbit']
         user = self.context['request'].user
 
-        if user not in fobbit.session.players.all():
+        if not user.playing.filter(id=fobbit.session_id).exists():
             raise serializers.ValidationError(
                 'player is not playing this session')
 
@@ -116,8 +117,7 @@ class QuestionSerializer(serializers.ModelSerializer):
 
 class FobbitSerializer(serializers.ModelSerializer):
     answers = AnswerSerializer(many=True, read_only=True)
-    score_sheets = AnswerScoreSheetSerializer(
-        many=True, read_only=True, source='scored_answers')
+    score_sheets = serializers.SerializerMethodField()
 
     # bluffs = BluffSerializer(many=True, read_only=True)
     question = QuestionSerializer(read_only=True)
@@ -130,18 +130,26 @@ class FobbitSerializer(serializers.ModelSerializer):
     players_without_guess = UserSerializer(
         many=True, read_only=True,
     )
+    players_without_bluff_count = serializers.IntegerField(read_only=True)
+    players_without_guess_count = serializers.IntegerField(read_only=True)
+
+    def get_score_sheets(self, instance):
+        if instance.status != Fobbit.FINISHED:
+            return None
+        if instance.score_sheet is not None:
+            return instance.score_sheet
+        return AnswerScoreSheetSerializer(
+            instance.scored_answers, many=True).data
 
     def get_have_bluffed(self, instance):
         if 'request' in self.context:
             player = self.context['request'].user
-            return Bluff.objects.filter(
-                player=player, fobbit=instance.id).count() > 0
+            return player.id in instance.bluffed_player_ids
 
     def get_have_guessed(self, instance):
         if 'request' in self.context:
             player = self.context['request'].user
-            return Guess.objects.filter(
-                player=player, answer__fobbit=instance.id).count() > 0
+            return player.id in instance.guessed_player_ids
 
     class Meta:
         model = Fobbit
@@ -151,6 +159,7 @@ class FobbitSerializer(serializers.ModelSerializer):
             'status', 'have_bluffed', 'have_guessed',
             'question', 'answers', 'score_sheets',
             'players_without_bluff', 'players_without_guess',
+            'players_without_bluff_count', 'players_without_guess_count',
             'session', 'multiplier'
         )
 
@@ -166,6 +175,7 @@ class QuizSerializer(serializers.ModelSerializer):
 
 class SessionSerializer(serializers.ModelSerializer):
     websocket = serializers.SerializerMethodField()
+    version = serializers.SerializerMethodField()
     active_fobbit = FobbitSerializer(read_only=True)
     fobbits = serializers.PrimaryKeyRelatedField(
         many=True, read_only=True)
@@ -179,6 +189,12 @@ class SessionSerializer(serializers.ModelSerializer):
         validated_data['owner'] = self.context['request'].user
         return super().create(validated_data)
 
+    def get_version(self, instance):
+        try:
+            return instance.broadcast_state.version
+        except ObjectDoesNotExist:
+            return 0
+
     def get_websocket(self, instance):
         request = self.context.get('request', None)
 
@@ -194,6 +210,7 @@ class SessionSerializer(serializers.ModelSerializer):
             'id',
             'url',
             'name',
+            'version',
             'websocket',
             'quiz',
             'owner',
@@ -0,0 +1,144 @@
+"""
+Rendered session snapshots
+
+Every player of a session fetches the same session after a broadcast, only
+`have_bluffed` and `have_guessed` of the active fobbit depend on the player.
+The rest is rendered to JSON once per session version and cached, split
+around those two fields, which are filled in per request.
+
+A snapshot is dropped when the session changes (`session_updated`) and only
+used for the version it was rendered for. Concurrent requests that miss the
+snapshot render it once, see `SingleFlight`.
+"""
+import threading
+from collections import Counter
+
+from django.core.cache import cache
+from rest_framework.renderers import JSONRenderer
+
+# the resources rendered from a session
+NAMES = ('session', 'active_fobbit')
+
+# stand-ins for the per player fields in the rendered JSON
+_HAVE_BLUFFED = '\x00have_bluffed\x00'
+_HAVE_GUESSED = '\x00have_guessed\x00'
+
+
+def _key(name, session_id):
+    return '{}-snapshot:{}'.format(name, session_id)
+
+
+def invalidate(session_id):
+    cache.delete_many([_key(name, session_id) for name in NAMES])
+
+
+def get(name, session_id, version, base_url):
+    """The snapshot of the session at `version`, or None"""
+    snapshot = cache.get(_key(name, session_id))
+    if snapshot and snapshot['version'] == version \
+            and snapshot['base_url'] == base_url:
+        return snapshot
+    return None
+
+
+def store(name, session_id, version, base_url, data, fobbit):
+    """
+    Render and cache serialized data, returns the snapshot
+
+    `fobbit` is the serialized fobbit in `data` with the player's fields, or
+    None.
+    """
+    if fobbit:
+        marked = dict(
+            fobbit, have_bluffed=_HAVE_BLUFFED, have_guessed=_HAVE_GUESSED)
+        data = marked if fobbit is data else dict(
+            data, active_fobbit=marked)
+    rendered = JSONRenderer().render(data)
+    snapshot = {
+        'version': version,
+        'base_url': base_url,
+        'active_fobbit': fobbit['id'] if fobbit else None,
+        'parts': _split(rendered),
+    }
+    cache.set(_key(name, session_id), snapshot)
+    return snapshot
+
+
+def _split(rendered):
+    parts = [rendered]
+    for mark in (_HAVE_BLUFFED, _HAVE_GUESSED):
+        mark = JSONRenderer().render(mark)
+        parts[-1:] = parts[-1].split(mark, 1)
+    return parts
+
+
+def render(snapshot, have_bluffed=False, have_guessed=False):
+    """The JSON of the snapshot for a player"""
+    parts = snapshot['parts']
+    if len(parts) == 1:
+        return parts[0]
+    return b''.join((
+        parts[0], b'true' if have_bluffed else b'false',
+        parts[1], b'true' if have_guessed else b'false',
+        parts[2],
+    ))
+
+
+class _Call:
+    def __init__(self):
+        self.done = threading.Event()
+        self.result = None
+        self.error = None
+
+
+class SingleFlight:
+    """
+    Runs a function once for concurrent callers with the same key
+
+    The first caller runs it, the others wait for and share its result (or
+    exception).
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._calls = {}
+        # snapshot hits, renders and requests that waited for a render
+        self.stats = Counter()
+
+    def do(self, key, func):
+        """returns the result and whether it came from another caller"""
+        with self._lock:
+            call = self._calls.get(key)
+            leader = call is None
+            if leader:
+                call = self._calls[key] = _Call()
+
+        if not leader:
+            call.done.wait()
+            self.count('merged')
+            if call.error is not None:
+                raise call.error
+            return call.result, True
+
+        try:
+            call.result = func()
+        except BaseException as error:
+            call.error = error
+            raise
+        finally:
+            with self._lock:
+                del self._calls[key]
+            call.done.set()
+        self.count('rendered')
+        return call.result, False
+
+    def count(self, key):
+        with self._lock:
+            self.stats[key] += 1
+
+    def snapshot(self):
+        with self._lock:
+            return dict(self.stats)
+
+
+flight = SingleFlight()
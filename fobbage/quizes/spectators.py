@@ -0,0 +1,156 @@
+"""
+Spectators of live sessions
+
+Spectators (`ws/session/<id>/watch/`) only read. The spectators of a
+session in a process share a `SpectatorHub`: it subscribes once to the
+session group, keeps the state of the session up to date with the patches
+and encodes every message to JSON once, for all of them. New spectators
+get the current state from the hub, so only the first spectator of a
+session in a process costs a query.
+
+    {"type": "state", "session_id": .., "version": .., "state": {..}}
+
+is sent on connect, followed by the broadcasts (`session_message` with a
+version and patch) and chat messages. A spectator that falls behind gets
+the current state instead of the broadcasts it did not read yet.
+"""
+import asyncio
+import json
+import weakref
+
+from channels.db import database_sync_to_async
+
+from .deltas import last_state
+from .models import Session
+from .multiplexer import get_multiplexer
+
+
+class SpectatorHub:
+    def __init__(self, session_id):
+        self.session_id = session_id
+        self.group = 'session_{}'.format(session_id)
+        self.spectators = set()
+        self.version = None
+        self.state = None
+        self._state_frame = None
+        # set once the state is loaded, or the session was not found
+        self.ready = asyncio.Event()
+        self.found = False
+        # broadcasts that come in while the state loads
+        self._pending = []
+        self.stats = {'messages': 0, 'encoded': 0, 'frames': 0, 'loads': 0}
+
+    async def start(self):
+        # subscribe before loading, so no broadcast falls in between
+        await get_multiplexer().subscribe(self.group, self.publish)
+        self.found = await self.load()
+        self.ready.set()
+        if not self.found:
+            await self.stop()
+
+    async def stop(self):
+        await get_multiplexer().unsubscribe(self.group, self.publish)
+
+    async def load(self):
+        self.stats['loads'] += 1
+        if self._pending is None:
+            self._pending = []
+        try:
+            version, state = await database_sync_to_async(last_state)(
+                self.session_id)
+        except Session.DoesNotExist:
+            self._pending = None
+            return False
+        self.version, self.state = version, state
+        self._state_frame = None
+        pending, self._pending = self._pending, None
+        for message in pending:
+            self.apply(message)
+        return True
+
+    def apply(self, message):
+        """Apply a broadcast to the state, returns False on a gap"""
+        version = message.get('version')
+        if version is None or version <= self.version:
+            return True
+        if version != self.version + 1:
+            return False
+        self.state = dict(self.state, **message['patch'])
+        self.version = version
+        self._state_frame = None
+        return True
+
+    def state_frame(self):
+        """The state as JSON, encoded once per version"""
+        if self._state_frame is None:
+            self._state_frame = json.dumps({
+                'type': 'state', 'session_id': self.session_id,
+                'version': self.version, 'state': self.state,
+            })
+            self.stats['encoded'] += 1
+        return self._state_frame
+
+    async def publish(self, message):
+        """A message to the session group, from the multiplexer"""
+        self.stats['messages'] += 1
+        if message['type'] == 'session_message':
+            if self._pending is not None:
+                # loading, the state spectators get will include it
+                self._pending.append(message)
+                return
+            if not self.apply(message):
+                # missed one, start over from the database
+                if not await self.load():
+                    return
+                self.send_all(
+                    self.state_frame(), self.state_frame, self.version)
+                return
+            collapse, version = self.state_frame, self.version
+        else:
+            collapse = version = None
+
+        frame = json.dumps(message)
+        self.stats['encoded'] += 1
+        self.send_all(frame, collapse, version)
+
+    def send_all(self, frame, collapse=None, version=None):
+        """Queue a frame for every spectator, see `SendQueue.put`"""
+        for spectator in list(self.spectators):
+            spectator.queue.put(frame, collapse, version=version)
+        self.stats['frames'] += len(self.spectators)
+
+    async def join(self, spectator):
+        self.spectators.add(spectator)
+        spectator.queue.put(
+            self.state_frame(), self.state_frame, version=self.version)
+        self.stats['frames'] += 1
+
+    async def leave(self, spectator):
+        self.spectators.discard(spectator)
+        if not self.spectators and _hubs().get(self.session_id) is self:
+            del _hubs()[self.session_id]
+            await self.stop()
+
+
+_loop_hubs = weakref.WeakKeyDictionary()
+
+
+def _hubs():
+    loop = asyncio.get_running_loop()
+    return _loop_hubs.setdefault(loop, {})
+
+
+async def get_hub(session_id):
+    """The hub of a session in this process, None when it doesn't exist"""
+    hubs = _hubs()
+    hub = hubs.get(session_id)
+    if hub is None:
+        hub = hubs[session_id] = SpectatorHub(session_id)
+        await hub.start()
+    else:
+        await hub.ready.wait()
+    if not hub.found:
+        if hubs.get(session_id) is hub:
+            del hubs[session_id]
+        return None
+    return hub
@@ -0,0 +1,189 @@
+"""
+Bluff and guess deadlines
+
+With `bluff_seconds` or `guess_seconds` in the session settings, a fobbit gets
+a deadline when its bluff or guess phase starts. When the deadline passes the
+phase ends, whether everyone acted or not: the answers are generated or the
+fobbit is finished.
+
+The deadlines are stored on the fobbit and sent to the `phase-timers`
+channel. A single worker (`manage.py runphasetimers`) keeps them in a heap
+and fires them. It reloads them from the database when it starts and every
+`PHASE_TIMERS_RELOAD` seconds, so deadlines survive restarts and lost
+messages.
+"""
+import asyncio
+import heapq
+import logging
+import time
+
+from asgiref.sync import async_to_sync
+from channels.db import database_sync_to_async
+from channels.layers import get_channel_layer
+from channels.worker import Worker
+from django.conf import settings
+from django.db import transaction
+from django.utils import timezone
+
+logger = logging.getLogger(__name__)
+
+PHASE_TIMER_CHANNEL = 'phase-timers'
+
+
+def send_deadline(fobbit):
+    """Tell the scheduler about the deadline of a fobbit, after commit"""
+    if not settings.PHASE_TIMERS:
+        return
+    message = {
+        'type': 'phase.timer',
+        'fobbit': fobbit.id,
+        'status': fobbit.status,
+        'deadline': fobbit.deadline.timestamp() if fobbit.deadline else None,
+    }
+
+    def send():
+        try:
+            async_to_sync(get_channel_layer().send)(
+                PHASE_TIMER_CHANNEL, message)
+        except Exception:
+            # the scheduler finds it when it reloads
+            logger.exception('Could not send deadline of %s', fobbit.id)
+    transaction.on_commit(send)
+
+
+def expire(fobbit_id, status):
+    """End the phase of a fobbit, returns False when it did not end it"""
+    from .models import Fobbit
+
+    fobbit = Fobbit.objects.select_related('session').get(id=fobbit_id)
+    with transaction.atomic():
+        fobbit.status, fobbit.deadline = Fobbit.objects.select_for_update(
+        ).values_list('status', 'deadline').get(id=fobbit_id)
+        if (fobbit.status != status or fobbit.deadline is None
+                or fobbit.deadline > timezone.now()):
+            # acted on or moved since it was scheduled
+            return False
+        if status == Fobbit.BLUFF:
+            if not fobbit.generate_answers(force=True):
+                # a session without players, it waits for them without a
+                # deadline instead of expiring again on every reload
+                fobbit.stop_timer()
+                fobbit.save(update_fields=['deadline'])
+                return False
+        else:
+            fobbit.finish(force=True)
+    return True
+
+
+def pending_deadlines():
+    from .models import Fobbit
+
+    return [
+        (fobbit_id, status, deadline.timestamp())
+        for fobbit_id, status, deadline in Fobbit.objects.filter(
+            deadline__isnull=False, status__lt=Fobbit.FINISHED,
+        ).values_list('id', 'status', 'deadline')
+    ]
+
+
+class PhaseScheduler:
+    """
+    Heap of fobbit deadlines, fires each one when it passes
+
+    A fobbit only has one deadline, scheduling it again replaces the old one
+    and entries left in the heap are skipped.
+    """
+
+    def __init__(self, fire=None, reload_seconds=None):
+        self.fire = fire or database_sync_to_async(expire)
+        self.reload_seconds = reload_seconds
+        self.heap = []
+        # fobbit id: (deadline, status) of the entry that counts
+        self.deadlines = {}
+        self.metrics = {
+            'scheduled': 0, 'fired': 0, 'expired': 0, 'skipped': 0,
+            'errors': 0,
+            # seconds between a deadline and the moment it fired
+            'skew_max': 0.0, 'skew_total': 0.0,
+            # seconds it took to end the phase
+            'latency_max': 0.0, 'latency_total': 0.0,
+        }
+        self._wakeup = None
+
+    def schedule(self, fobbit_id, status, deadline):
+        """Set or, with a deadline of None, cancel the deadline of a fobbit"""
+        if deadline is None:
+            self.deadlines.pop(fobbit_id, None)
+            return
+        if self.deadlines.get(fobbit_id) == (deadline, status):
+            return
+        self.deadlines[fobbit_id] = (deadline, status)
+        heapq.heappush(self.heap, (deadline, fobbit_id, status))
+        self.metrics['scheduled'] += 1
+        if self._wakeup is not None:
+            self._wakeup.set()
+
+    async def reload(self):
+        for entry in await database_sync_to_async(pending_deadlines)():
+            self.schedule(*entry)
+        logger.info('Phase timers: %s pending, %s', len(self.deadlines),
+                    self.metrics)
+
+    async def run(self):
+        self._wakeup = asyncio.Event()
+        await self.reload()
+        if self.reload_seconds:
+            asyncio.ensure_future(self._reload_forever())
+        while True:
+            await self.fire_due()
+            timeout = self.heap[0][0] - time.time() if self.heap else None
+            self._wakeup.clear()
+            try:
+                await asyncio.wait_for(self._wakeup.wait(), timeout)
+            except asyncio.TimeoutError:
+                pass
+
+    async def _reload_forever(self):
+        while True:
+            await asyncio.sleep(self.reload_seconds)
+            try:
+                await self.reload()
+            except Exception:
+                logger.exception('Could not reload the phase timers')
+
+    async def fire_due(self):
+        while self.heap and self.heap[0][0] <= time.time():
+            deadline, fobbit_id, status = heapq.heappop(self.heap)
+            if self.deadlines.get(fobbit_id) != (deadline, status):
+                self.metrics['skipped'] += 1
+                continue
+            del self.deadlines[fobbit_id]
+
+            start = time.time()
+            skew = start - deadline
+            try:
+                expired = await self.fire(fobbit_id, status)
+            except Exception:
+                self.metrics['errors'] += 1
+                logger.exception('Could not end the phase of %s', fobbit_id)
+                continue
+            latency = time.time() - start
+
+            self.metrics['fired'] += 1
+            self.metrics['expired'] += bool(expired)
+            self.metrics['skew_total'] += skew
+            self.metrics['skew_max'] = max(self.metrics['skew_max'], skew)
+            self.metrics['latency_total'] += latency
+            self.metrics['latency_max'] = max(
+                self.metrics['latency_max'], latency)
+
+
+scheduler = PhaseScheduler(reload_seconds=settings.PHASE_TIMERS_RELOAD)
+
+
+class PhaseTimerWorker(Worker):
+    """Channel worker that also runs the scheduler"""
+
+    async def handle(self):
+        asyncio.ensure_future(scheduler.run())
+        await super().handle()
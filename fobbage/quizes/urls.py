@@ -4,7 +4,7 @@ from rest_framework.routers import DefaultRouter
 from fobbage.quizes.views import (
     SessionViewSet, FobbitViewSet,
     AnswerViewSet, QuizViewSet, ActiveFobbitViewSet, BluffViewSet,
-    GuessViewSet, QuestionViewSet,
+    GuessViewSet, QuestionViewSet, broadcast_stats_view,
 )
 
 
@@ -21,4 +21,5 @@ router.register(
 
 urlpatterns = [
     path('', include(router.urls)),
+    path('broadcast_stats/', broadcast_stats_view, name='broadcast_stats'),
 ]
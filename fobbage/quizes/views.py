@@ -1,9 +1,15 @@
 from django.shortcuts import get_object_or_404
 from django.contrib.auth import get_user_model
+from django.db.models import Exists, OuterRef, Prefetch
+from django.http import Http404, HttpResponse
+from django.utils.decorators import method_decorator
+from django.views.decorators.cache import cache_control
+from django.views.decorators.http import condition
 
 from rest_framework import viewsets, status
 from rest_framework.response import Response
-from rest_framework.decorators import action
+from rest_framework.decorators import action, api_view, permission_classes
+from rest_framework.permissions import IsAdminUser
 
 from .serializers import (
     QuizSerializer, BluffSerializer, AnswerSerializer, SessionSerializer,
@@ -12,35 +18,190 @@ from .serializers import (
 )
 from fobbage.quizes.models import (
     Quiz, Answer, Bluff, Guess, Session, Fobbit, Question)
+from fobbage.quizes.scoring import recorded_scores
+from fobbage.quizes import sendqueue, snapshots
+from fobbage.quizes.messages import broadcast_stats
+from fobbage.quizes.outbox import outbox
+from fobbage.quizes.presence import presence
 
 
 # Get the UserModel
 User = get_user_model()
 
 
+def fobbit_prefetch(prefix=''):
+    """
+    Relations `FobbitSerializer` reads, so serializing a fobbit costs a fixed
+    number of queries however many players and answers it has
+    """
+    return [
+        prefix + lookup
+        for lookup in ('answers__guesses', 'bluffs', 'session__players')
+    ]
+
+
+def fobbit_queryset():
+    return Fobbit.objects.select_related(
+        'question', 'session',
+    ).prefetch_related(*fobbit_prefetch())
+
+
+def session_queryset():
+    # the version is read with the session, the prefetched data is never
+    # older than it
+    return Session.objects.select_related(
+        'owner', 'broadcast_state',
+        'active_fobbit__question', 'active_fobbit__session',
+    ).prefetch_related(
+        Prefetch('fobbits', queryset=Fobbit.objects.only('id', 'session')),
+        *fobbit_prefetch('active_fobbit__'),
+    )
+
+
+def request_session(request, pk):
+    """
+    The session with its version, read once per request, or None
+
+    From the database, other processes (e.g. the phase timers) bump the
+    version too.
+    """
+    if not hasattr(request, 'versioned_session'):
+        request.versioned_session = Session.objects.select_related(
+            'broadcast_state',
+        ).only('id', 'broadcast_state__version').filter(pk=int(pk)).first()
+    return request.versioned_session
+
+
+def session_etag(request, pk=None, *args, **kwargs):
+    """
+    Weak ETag of a session resource, from the session version
+
+    Every change of a session bumps its version, have_bluffed and
+    have_guessed make it differ per user.
+    """
+    try:
+        session = request_session(request, pk)
+    except (TypeError, ValueError):
+        return None
+    version = SessionSerializer().get_version(session) if session else 0
+    if version:
+        return 'W/"{}-{}-{}"'.format(pk, version, request.user.id)
+
+
+# browsers keep the response, but check the ETag before using it
+conditional_session_get = [
+    cache_control(private=True, no_cache=True),
+    condition(etag_func=session_etag),
+]
+
+
+class PlainObjectMixin:
+    """
+    Actions change a plain instance, the prefetched queryset is only used to
+    serialize the response. Prefetched relations of an instance are not
+    refreshed when the instance changes them.
+    """
+    model = None
+
+    def get_plain_object(self):
+        obj = get_object_or_404(self.model, pk=self.kwargs['pk'])
+        self.check_object_permissions(self.request, obj)
+        return obj
+
+
+class SnapshotMixin:
+    """
+    Responds with the cached snapshot of a session resource
+
+    Requests that miss the snapshot of a version render it once, the
+    others wait for it and only look up their own fields.
+    """
+
+    def snapshot_response(self, name, session_id, version, serialize):
+        """
+        `serialize` returns the version, data and the fobbit in the data, of
+        the resource for the current user
+        """
+        base_url = self.request.build_absolute_uri('/')
+        snapshot = snapshots.get(name, session_id, version, base_url)
+        shared = True
+        if snapshot is None:
+            def render():
+                version, data, fobbit = serialize()
+                snapshot = snapshots.store(
+                    name, session_id, version, base_url, data, fobbit)
+                return snapshot, fobbit
+            (snapshot, fobbit), shared = snapshots.flight.do(
+                (name, session_id, version, base_url), render)
+        else:
+            snapshots.flight.count('hits')
+
+        if not shared:
+            fobbit = fobbit or {}
+            flags = fobbit.get('have_bluffed'), fobbit.get('have_guessed')
+        elif snapshot['active_fobbit']:
+            user_id = self.request.user.id
+            flags = Fobbit.objects.filter(
+                id=snapshot['active_fobbit'],
+            ).annotate(
+                have_bluffed=Exists(Bluff.objects.filter(
+                    fobbit=OuterRef('id'), player_id=user_id)),
+                have_guessed=Exists(Guess.objects.filter(
+                    answer__fobbit=OuterRef('id'), player_id=user_id)),
+            ).values_list('have_bluffed', 'have_guessed').get()
+        else:
+            flags = False, False
+
+        return HttpResponse(
+            snapshots.render(snapshot, *flags),
+            content_type='application/json')
+
+
 class QuizViewSet(viewsets.ModelViewSet):
     queryset = Quiz.objects.all()
     serializer_class = QuizSerializer
 
 
-class SessionViewSet(viewsets.ModelViewSet):
-    queryset = Session.objects.all()
+class SessionViewSet(
+        SnapshotMixin, PlainObjectMixin, viewsets.ModelViewSet):
     serializer_class = SessionSerializer
+    model = Session
+
+    def get_queryset(self):
+        return session_queryset()
+
+    @method_decorator(conditional_session_get)
+    def retrieve(self, request, *args, **kwargs):
+        """The cached snapshot of the session, with the player's fields"""
+        if request.accepted_renderer.format != 'json':
+            return super().retrieve(request, *args, **kwargs)
+
+        session = request_session(request, self.kwargs['pk'])
+        if session is None:
+            raise Http404
+        self.check_object_permissions(request, session)
+
+        def serialize():
+            data = self.get_serializer(self.get_object()).data
+            return data['version'], data, data['active_fobbit']
+        return self.snapshot_response(
+            'session', session.id,
+            SessionSerializer().get_version(session), serialize)
 
     @action(
         detail=True, methods=['POST'])
     def join(self, request, pk=None):
-        session = self.get_object()
+        session = self.get_plain_object()
         user = request.user
         session.players.add(user)
         return Response(
             SessionSerializer(
-                session,
+                self.get_object(),
                 context=self.get_serializer_context()).data)
 
     @action(detail=True, methods=['POST'],)
     def next_question(self, request, pk=None):
-        self.get_object().next_question()
+        self.get_plain_object().next_question()
         return Response(
             SessionSerializer(
                 self.get_object(),
@@ -50,7 +211,7 @@ class SessionViewSet(viewsets.ModelViewSet):
     def new_round(self, request, pk=None):
         serializer = RoundSerializer(data=request.data)
         if serializer.is_valid(raise_exception=True):
-            self.get_object().new_round(serializer.data)
+            self.get_plain_object().new_round(serializer.data)
 
         return Response(
             SessionSerializer(
@@ -60,28 +221,38 @@ class SessionViewSet(viewsets.ModelViewSet):
     @action(
         detail=True, methods=['POST'], serializer_class=ActiveFobbitSerializer)
     def set_active_fobbit(self, request, pk=None):
-        session = self.get_object()
+        session = self.get_plain_object()
         serializer = ActiveFobbitSerializer(
             instance=session, data=request.data)
         if serializer.is_valid():
-            session = serializer.save()
+            serializer.save()
             return Response(
                 SessionSerializer(
-                    session,
+                    self.get_object(),
                     context=self.get_serializer_context()).data)
         else:
             return Response(
                 serializer.errors, status=status.HTTP_400_BAD_REQUEST
             )
 
+    @action(detail=True, methods=['GET'])
+    def presence(self, request, pk=None):
+        """The players connected to the session, from the cache"""
+        try:
+            session_id = int(pk)
+        except ValueError:
+            raise Http404
+        return Response(presence.online(session_id))
+
     @action(detail=True, methods=['GET'])
     def score_board(self, request, pk=None):
-        instance = self.get_object()
+        instance = self.get_plain_object()
+        scores = recorded_scores(instance)
         return Response(
             ScoreSerializer(
                 [
                     {
-                        'score': instance.score_for_player(player),
+                        'score': scores.get(player.id, 0),
                         'player': player
                     }
                     for player in instance.players.all()
@@ -90,18 +261,20 @@ class SessionViewSet(viewsets.ModelViewSet):
             ).data)
 
 
-class FobbitViewSet(viewsets.ModelViewSet):
-    queryset = Fobbit.objects.all()
+class FobbitViewSet(PlainObjectMixin, viewsets.ModelViewSet):
     serializer_class = FobbitSerializer
+    model = Fobbit
+
+    def get_queryset(self):
+        return fobbit_queryset()
 
     @action(
         detail=True, methods=['POST'],)
     def generate_answers(self, request, pk=None):
-        fobbit = self.get_object()
-        if fobbit.generate_answers():
+        if self.get_plain_object().generate_answers():
             return Response(
                 FobbitSerializer(
-                    fobbit, context=self.get_serializer_context()
+                    self.get_object(), context=self.get_serializer_context()
                 ).data)
         else:
             return Response(
@@ -110,7 +283,7 @@ class FobbitViewSet(viewsets.ModelViewSet):
 
     @action(detail=True, methods=['POST'])
     def finish(self, request, pk=None, serializer_class=None):
-        self.get_object().finish()
+        self.get_plain_object().finish()
         return Response(
             FobbitSerializer(
                 self.get_object(), context=self.get_serializer_context()
@@ -118,7 +291,7 @@ class FobbitViewSet(viewsets.ModelViewSet):
 
     @action(detail=True, methods=['POST'])
     def reset(self, request, pk=None):
-        self.get_object().reset()
+        self.get_plain_object().reset()
         return Response(
             FobbitSerializer(
                 self.get_object(), context=self.get_serializer_context()
@@ -135,7 +308,7 @@ class AnswerViewSet(viewsets.ReadOnlyModelViewSet):
     serializer_class = AnswerSerializer
 
 
-class ActiveFobbitViewSet(viewsets.ModelViewSet):
+class ActiveFobbitViewSet(SnapshotMixin, viewsets.ModelViewSet):
     serializer_class = FobbitSerializer
 
     def get_queryset(self):
@@ -143,11 +316,27 @@ class ActiveFobbitViewSet(viewsets.ModelViewSet):
             session__in=Session.objects.values_list(
                 'active_fobbit', flat=True))
 
+    @method_decorator(conditional_session_get)
     def retrieve(self, request, pk=None):
-        fobbit = get_object_or_404(Session, id=pk).active_fobbit
-        Session.objects.get(id=pk).active_fobbit
-        serializer = FobbitSerializer(fobbit, context={'request': request})
-        return Response(serializer.data)
+        try:
+            session = request_session(request, pk)
+        except ValueError:
+            session = None
+        if session is None:
+            raise Http404
+        version = SessionSerializer().get_version(session)
+        if request.accepted_renderer.format != 'json':
+            return Response(self.serialize(pk, version)[1])
+        return self.snapshot_response(
+            'active_fobbit', int(pk), version,
+            lambda: self.serialize(pk, version))
+
+    def serialize(self, pk, version):
+        # the version is read first, the fobbit is never older than it
+        fobbit = fobbit_queryset().filter(active_in=pk).first()
+        data = FobbitSerializer(
+            fobbit, context={'request': self.request}).data
+        return version, data, data if fobbit else None
 
 
 class BluffViewSet(viewsets.ModelViewSet):
@@ -178,3 +367,18 @@ class GuessViewSet(viewsets.ModelViewSet):
     def post(self, request, *args, **kwargs):
         return self.create(
             request, player=request.user, *args, **kwargs)
+
+
+@api_view(['GET'])
+@permission_classes([IsAdminUser])
+def broadcast_stats_view(request):
+    """
+    Counters of the session broadcasts, the outbox, the snapshots and the
+    websocket send queues of this process
+    """
+    return Response({
+        'broadcasts': broadcast_stats(),
+        'outbox': outbox.snapshot(),
+        'snapshots': snapshots.flight.snapshot(),
+        'send_queues': sendqueue.snapshot(),
+    })
@@ -97,6 +97,7 @@ MIDDLEWARE = [
     'django.contrib.auth.middleware.AuthenticationMiddleware',
     'django.contrib.messages.middleware.MessageMiddleware',
     'django.middleware.clickjacking.XFrameOptionsMiddleware',
+    'fobbage.quizes.middleware.BroadcastMiddleware',
 ]
 
 # CSRF_USE_SESSIONS = False
@@ -194,14 +195,66 @@ ASGI_APPLICATION = 'fobbage.asgi.application'
 # $ sudo docker run -p 6379:6379 -d redis:2.8
 REDIS_URL = os.environ.get("REDIS_URL", ('localhost', 6379))
 
-CHANNEL_LAYERS = {
-    "default": {
-        "BACKEND": "channels_redis.pubsub.RedisPubSubChannelLayer",
-        "CONFIG": {
-            "hosts": [REDIS_URL, ],
+# 'local' keeps the channel layer in the process, for deployments with a
+# single daphne process. Deadlines sent to a separate phase timer worker
+# don't reach it then, it picks them up when it reloads.
+CHANNEL_LAYER = env.str('CHANNEL_LAYER', default='redis')
+
+if CHANNEL_LAYER == 'local':
+    CHANNEL_LAYERS = {
+        "default": {
+            "BACKEND": "fobbage.layers.LocalChannelLayer",
+            "CONFIG": {
+                "capacity": env.int('CHANNEL_LAYER_CAPACITY', default=100),
+                "expiry": env.int('CHANNEL_LAYER_EXPIRY', default=60),
+            },
         },
-    },
-}
+    }
+else:
+    CHANNEL_LAYERS = {
+        "default": {
+            "BACKEND": "channels_redis.pubsub.RedisPubSubChannelLayer",
+            "CONFIG": {
+                "hosts": [REDIS_URL, ],
+            },
+        },
+    }
+
+# every process joins a session group once and hands its messages to the
+# websockets of the session, see fobbage.quizes.multiplexer
+WEBSOCKET_MULTIPLEXER = env.bool('WEBSOCKET_MULTIPLEXER', default=True)
+
+# messages queued per websocket, see fobbage.quizes.sendqueue. Clients that
+# keep a full queue, or stay more than WEBSOCKET_MAX_LAG session versions
+# behind, for WEBSOCKET_SLOW_SECONDS are disconnected
+WEBSOCKET_SEND_QUEUE = env.int('WEBSOCKET_SEND_QUEUE', default=100)
+WEBSOCKET_SLOW_SECONDS = env.float('WEBSOCKET_SLOW_SECONDS', default=10)
+WEBSOCKET_MAX_LAG = env.int('WEBSOCKET_MAX_LAG', default=20)
+
+# send bluff and guess deadlines to the phase timer worker, it also reloads
+# them from the database every PHASE_TIMERS_RELOAD seconds
+PHASE_TIMERS = env.bool('PHASE_TIMERS', default=False)
+PHASE_TIMERS_RELOAD = env.int('PHASE_TIMERS_RELOAD', default=30)
+
+# 'memory' plays websocket bluffs and guesses against in-memory state and
+# writes them in batches, see fobbage.quizes.engine
+GAME_ENGINE = env.str('GAME_ENGINE', default='orm')
+WRITE_BEHIND_BATCH = env.int('WRITE_BEHIND_BATCH', default=500)
+WRITE_BEHIND_SECONDS = env.float('WRITE_BEHIND_SECONDS', default=0.5)
+
+# send session broadcasts from a background thread, with a bounded queue
+BROADCAST_OUTBOX = env.bool('BROADCAST_OUTBOX', default=True)
+BROADCAST_OUTBOX_SIZE = env.int('BROADCAST_OUTBOX_SIZE', default=1000)
+
+# number of broadcasts per session kept to replay to reconnecting websockets,
+# clients that missed more fetch the whole session
+SESSION_LOG_SIZE = env.int('SESSION_LOG_SIZE', default=200)
+
+# websocket presence is kept in the cache, every process refreshes its
+# players every PRESENCE_HEARTBEAT seconds, they expire after PRESENCE_TTL.
+# Use a shared cache when running more than one process
+PRESENCE_HEARTBEAT = env.int('PRESENCE_HEARTBEAT', default=30)
+PRESENCE_TTL = env.int('PRESENCE_TTL', default=90)
 
 # CSRF
 CSRF_TRUSTED_ORIGINS = ["https://fobbage-quiz.herokuapp.com"]
@@ -23,4 +23,8 @@ export default new Resource(client, 'api/sessions',
       const url = `/${this.base}/${id}/score_board/`;
       return this.client.get(url);
     },
+    getPresence(id) {
+      const url = `/${this.base}/${id}/presence/`;
+      return this.client.get(url);
+    },
   });
@@ -28,9 +28,14 @@ export default {
     commit('QUIZES_JOIN', { id });
   },
 
-  bluff: ({ commit }, { fobbit, text }) => new Promise(
+  bluff: ({ commit, dispatch, rootState }, { fobbit, text }) => new Promise(
     (resolve, reject) => {
-      bluffsAPI.post({ fobbit, text })
+      // over the websocket when it is open, skips a separate request
+      const submit = rootState.websocket.connected
+        ? dispatch('sendRequest', { action: 'bluff', fobbit, text })
+          .then((data) => ({ data }))
+        : bluffsAPI.post({ fobbit, text });
+      submit
         .then((response) => {
           commit('BLUFF_SUCCESS', { bluff: response.data });
           resolve(response.data);
@@ -56,9 +61,13 @@ export default {
     },
   ),
 
-  guess: ({ commit }, { fobbit, answer }) => new Promise(
+  guess: ({ commit, dispatch, rootState }, { fobbit, answer }) => new Promise(
     (resolve, reject) => {
-      guessAPI.post({ fobbit, answer })
+      const submit = rootState.websocket.connected
+        ? dispatch('sendRequest', { action: 'guess', answer })
+          .then((data) => ({ data }))
+        : guessAPI.post({ fobbit, answer });
+      submit
         .then((response) => {
           commit('GUESS_SUCCESS', { guess: response.data });
           resolve(response);
@@ -76,13 +85,6 @@ export default {
       }));
     }
   },
-  sendAnswer({ state }, { answer }) {
-    if (state.websocket) {
-      state.websocket.send(JSON.stringify({
-        answer,
-      }));
-    }
-  },
   createGuess: ({ commit, dispatch }, { id, guess }) => new Promise((resolve, reject) => {
     guessAPI.post({ question: id, answer: guess })
       .then((response) => {
@@ -95,13 +97,25 @@ export default {
         reject(error);
       });
   }),
-  newMessage({ dispatch }, { message }) {
-    // toodo: get quiz id from message and query new active question
+  newMessage({ state, commit, dispatch }, { message }) {
     if ('session_id' in message) {
-      dispatch('retrieveSession', { id: message.session_id });
-      // setTimeout(() => {
-      //   dispatch('newactive_fobbit');
-      // }, 200);
+      const session = state.sessions[message.session_id];
+      const { patch, version } = message;
+      if (session && version && version <= session.version) {
+        // replayed after a reconnect, already applied
+        return;
+      }
+      // apply the patch when we have the previous version and the same
+      // question in the same status, otherwise fetch the whole session:
+      // a new question or status changes fields the patch doesn't carry
+      if (session && patch && session.version + 1 === version
+          && !('active_fobbit' in patch) && !('status' in patch)) {
+        commit('SESSIONS_PATCH', { id: message.session_id, version, patch });
+      } else {
+        dispatch('retrieveSession', { id: message.session_id });
+      }
+    } else if (message.type === 'presence_message') {
+      commit('PRESENCE_UPDATE', message);
     }
   },
 
@@ -245,4 +259,11 @@ export default {
         });
     },
   ),
+
+  // the connected players, the websocket sends the changes
+  retrievePresence: ({ commit }, { id }) => sessionsAPI.getPresence(id)
+    .then((response) => {
+      commit('PRESENCE_SUCCESS', { session: id, users: response.data });
+      return response;
+    }),
 };
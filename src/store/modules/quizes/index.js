@@ -12,6 +12,8 @@ export default {
     bluff: undefined,
     guess: undefined,
     scoreBoard: undefined,
+    // connected players per session id
+    presence: {},
   },
   mutations,
   getters,
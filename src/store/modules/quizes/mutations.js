@@ -45,6 +45,45 @@ export default {
       Vue.set(state.sessions, s.id, s);
     });
   },
+  [types.SESSIONS_PATCH]: (state, { id, version, patch }) => {
+    const session = state.sessions[id];
+    const { scores, ...fobbitPatch } = patch;
+    if (session.active_fobbit) {
+      Object.keys(fobbitPatch).forEach((key) => {
+        Vue.set(session.active_fobbit, key, fobbitPatch[key]);
+      });
+    }
+    if (scores && state.scoreBoard) {
+      state.scoreBoard.forEach((entry) => {
+        if (entry.player.id in scores) {
+          Vue.set(entry, 'score', scores[entry.player.id]);
+        }
+      });
+    }
+    Vue.set(session, 'version', version);
+  },
+  [types.PRESENCE_SUCCESS]: (state, { session, users }) => {
+    Vue.set(state.presence, session, users);
+  },
+  [types.PRESENCE_UPDATE]: (state, { session, joined, left }) => {
+    // the fetched players may include the ones that joined meanwhile
+    const changed = left.concat(joined).map(user => user.id);
+    const online = (state.presence[session] || [])
+      .filter(user => !changed.includes(user.id));
+    Vue.set(state.presence, session, online.concat(joined));
+  },
+  [types.FOBBIT_SUCCESS]: (state, fobbits) => {
+    fobbits.forEach((fobbit) => {
+      Object.values(state.sessions).forEach((session) => {
+        if (session.active_fobbit && session.active_fobbit.id === fobbit.id) {
+          Vue.set(session, 'active_fobbit', fobbit);
+        }
+      });
+    });
+  },
+  [types.FOBBIT_ERROR]: (state) => {
+    state.error = 'There was a problem!';
+  },
   [types.SESSIONS_ERROR]: (state) => {
     state.sessions = [];
   },
@@ -1,20 +1,71 @@
 export default {
-  connectToWebSocket: ({ state, commit, dispatch }, { scheme, uri }) => {
-    const websocket = new WebSocket(`${scheme}://${uri}`);
+  connectToWebSocket: ({
+    state, commit, dispatch, rootState,
+  }, { scheme, uri, sessionId }) => {
+    // after a reconnect the server replays what we missed since our version
+    const session = rootState.quizes.sessions[sessionId];
+    const query = session && session.version ? `?last_seq=${session.version}` : '';
+    const websocket = new WebSocket(`${scheme}://${uri}${query}`);
     websocket.onopen = () => {
       commit('SOCKET_OPEN');
+      dispatch('retrievePresence', { id: sessionId });
     };
     websocket.onclose = () => {
       commit('SOCKET_CLOSE');
+      // the acks of requests sent over this socket won't come, the session
+      // is fetched again on reconnect and shows what was saved
+      Object.entries(state.requests).forEach(([requestId, request]) => {
+        if (request.websocket === websocket) {
+          commit('REQUEST_DONE', { requestId });
+          request.reject(['disconnected']);
+        }
+      });
+      if (state.websocket === websocket) {
+        // spread out the reconnects of every client after a deploy
+        setTimeout(() => {
+          dispatch('connectToWebSocket', { scheme, uri, sessionId });
+        }, 1000 + Math.random() * 4000);
+      }
     };
     websocket.onerror = (event) => {
       commit('SOCKET_ERROR', { event });
     };
     websocket.onmessage = (event) => {
       const message = JSON.parse(event.data);
+      if (message.type === 'ack') {
+        // answer to a request sent with sendRequest
+        const request = state.requests[message.request_id];
+        if (request) {
+          commit('REQUEST_DONE', { requestId: message.request_id });
+          if (message.ok) {
+            request.resolve(message.data);
+          } else {
+            request.reject(message.errors);
+          }
+        }
+        return;
+      }
       state.messages.push(message);
       dispatch('newMessage', { message });
+      if (message.version) {
+        // the server disconnects clients that stay too far behind
+        websocket.send(JSON.stringify({
+          action: 'seen', version: message.version,
+        }));
+      }
     };
     commit('SOCKET_SET', { websocket });
   },
+
+  // send a bluff or guess, resolves with the acknowledged data
+  sendRequest: ({ state, commit }, { action, ...content }) => new Promise(
+    (resolve, reject) => {
+      const { websocket } = state;
+      commit('REQUEST_ADD', { request: { resolve, reject, websocket } });
+      const requestId = state.lastRequestId;
+      websocket.send(JSON.stringify({
+        action, request_id: requestId, ...content,
+      }));
+    },
+  ),
 };
@@ -10,5 +10,8 @@ export default {
     websocket: undefined,
     messages: [],
     connected: false,
+    // requests waiting for an ack, by request id
+    requests: {},
+    lastRequestId: 0,
   },
 };
@@ -1,3 +1,4 @@
+import Vue from 'vue';
 import * as types from '@/store/mutation-types';
 
 export default {
@@ -14,6 +15,13 @@ export default {
     const message = JSON.parse(event.data);
     state.messages.push(message);
   },
+  [types.REQUEST_ADD]: (state, { request }) => {
+    state.lastRequestId += 1;
+    Vue.set(state.requests, state.lastRequestId, request);
+  },
+  [types.REQUEST_DONE]: (state, { requestId }) => {
+    Vue.delete(state.requests, requestId);
+  },
   [types.SOCKET_ERROR]: (state, { event }) => {
     const message = JSON.parse(event.data);
     state.error = message;
@@ -28,6 +28,9 @@ export const GUESS_ERROR = 'GUESS_ERROR';
 
 export const SESSIONS_SUCCESS = 'SESSIONS_SUCCESS';
 export const SESSIONS_ERROR = 'SESSIONS_ERROR';
+export const SESSIONS_PATCH = 'SESSIONS_PATCH';
+export const PRESENCE_SUCCESS = 'PRESENCE_SUCCESS';
+export const PRESENCE_UPDATE = 'PRESENCE_UPDATE';
 
 export const SCOREBOARD_SUCCESS = 'SCOREBOARD_SUCCESS';
 export const SCOREBOARD_ERROR = 'SCOREBOARD_ERROR';
@@ -37,6 +40,8 @@ export const SOCKET_ERROR = 'SOCKET_ERROR';
 export const SOCKET_OPEN = 'SOCKET_OPEN';
 export const SOCKET_CLOSE = 'SOCKET_CLOSE';
 export const SOCKET_SET = 'SOCKET_SET';
+export const REQUEST_ADD = 'REQUEST_ADD';
+export const REQUEST_DONE = 'REQUEST_DONE';
 
 export const ACTIVE_QUESTION_SUCCES = 'ACTIVE_QUESTION_SUCCES';
 
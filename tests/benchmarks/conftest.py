@@ -0,0 +1,14 @@
+import pytest
+from channels_redis import pubsub
+
+
+@pytest.fixture
+def fake_redis(monkeypatch):
+    """Redis pub/sub layers connect to an in-process fake redis server"""
+    # not a dependency of the project, the benchmarks that need it skip
+    fakeredis = pytest.importorskip('fakeredis')
+    server = fakeredis.FakeServer()
+    monkeypatch.setattr(
+        pubsub.aioredis, 'Redis',
+        lambda connection_pool=None, **kwargs: fakeredis.FakeAsyncRedis(
+            server=server))
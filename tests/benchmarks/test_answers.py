@@ -0,0 +1,57 @@
+import random
+
+import pytest
+
+from fobbage.quizes.models import Answer, Bluff, Fobbit
+from tests.benchmarks.utils import create_players, measure, report
+from tests.factories.quiz_factories import QuestionFactory, SessionFactory
+
+
+def row_by_row_generate_answers(fobbit):
+    """generate_answers before it used bulk queries"""
+    for answer in fobbit.answers.all():
+        answer.delete()
+    Answer.objects.create(
+        fobbit=fobbit, text=fobbit.question.correct_answer, is_correct=True)
+    for bluff in fobbit.bluffs.all():
+        answer = fobbit.answers.filter(text__iexact=bluff.text).first()
+        if answer is None:
+            answer = Answer.objects.create(fobbit=fobbit, text=bluff.text)
+        bluff.answer = answer
+        bluff.save()
+    answers = list(fobbit.answers.all())
+    random.shuffle(answers)
+    for i, answer in enumerate(answers, start=1):
+        answer.order = i
+        answer.save()
+    fobbit.status = Fobbit.GUESS
+    fobbit.save()
+    fobbit.session.next_question()
+
+
+def bluffed_fobbit(players):
+    session = SessionFactory()
+    QuestionFactory.create_batch(2, quiz=session.quiz)
+    session.players.set(players)
+    session.new_round({'multiplier': 1, 'number_of_questions': 2})
+    fobbit = session.active_fobbit
+    Bluff.objects.bulk_create([
+        Bluff(fobbit=fobbit, player=player, text='bluff {}'.format(i // 2))
+        for i, player in enumerate(players)
+    ])
+    return Fobbit.objects.get(id=fobbit.id)
+
+
+@pytest.mark.benchmark
+@pytest.mark.django_db
+def test_generate_answers_100_players():
+    players = create_players(100)
+
+    _, old_seconds, old_queries = measure(
+        row_by_row_generate_answers, bluffed_fobbit(players))
+    _, new_seconds, new_queries = measure(
+        bluffed_fobbit(players).generate_answers)
+
+    report('row by row generate_answers', old_seconds, old_queries)
+    report('bulk generate_answers', new_seconds, new_queries)
+    assert new_queries < old_queries
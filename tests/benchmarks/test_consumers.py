@@ -0,0 +1,281 @@
+import asyncio
+import time
+import tracemalloc
+
+import pytest
+from asgiref.sync import async_to_sync
+from channels.layers import get_channel_layer
+from channels_redis import pubsub
+from django.contrib.auth.models import AnonymousUser
+from rest_framework.test import APIClient
+
+from fobbage.quizes.deltas import session_version
+from fobbage.quizes.models import Bluff
+from fobbage.quizes.multiplexer import get_multiplexer
+from fobbage.quizes import sendqueue
+from fobbage.quizes.sendqueue import SendQueue
+from tests.benchmarks.utils import create_players, report
+from tests.factories.quiz_factories import QuestionFactory, SessionFactory
+from tests.unit.quizes.test_consumers import connect
+
+
+@pytest.fixture(autouse=True)
+def in_memory_layer(settings):
+    settings.CHANNEL_LAYERS = {
+        'default': {'BACKEND': 'channels.layers.InMemoryChannelLayer'}}
+
+
+@pytest.mark.benchmark
+@pytest.mark.django_db
+@pytest.mark.parametrize('n_connections', [100, 1000, 3000])
+def test_idle_connections(n_connections):
+    session = SessionFactory()
+
+    async def run():
+        tracemalloc.start()
+        start = time.perf_counter()
+        communicators = []
+        for _ in range(n_connections):
+            communicator = connect(session.id, AnonymousUser())
+            connected, _ = await communicator.connect()
+            assert connected
+            communicators.append(communicator)
+        connect_seconds = time.perf_counter() - start
+        memory = tracemalloc.get_traced_memory()[0]
+        tracemalloc.stop()
+
+        # one broadcast reaches every idle connection
+        start = time.perf_counter()
+        await get_channel_layer().group_send(
+            'session_{}'.format(session.id),
+            {'type': 'session_message', 'session_id': session.id})
+        await asyncio.gather(*(
+            communicator.receive_json_from(timeout=30)
+            for communicator in communicators))
+        fan_out_seconds = time.perf_counter() - start
+
+        await asyncio.gather(*(
+            communicator.disconnect() for communicator in communicators))
+        return connect_seconds, memory, fan_out_seconds
+
+    connect_seconds, memory, fan_out_seconds = async_to_sync(run)()
+    report(
+        'connect {}'.format(n_connections), connect_seconds,
+        kb_per_connection=round(memory / n_connections / 1024, 1))
+    report('fan out {}'.format(n_connections), fan_out_seconds)
+
+
+def bluffing_session(players):
+    session = SessionFactory()
+    QuestionFactory(quiz=session.quiz)
+    session.players.set(players)
+    session.new_round({'multiplier': 1, 'number_of_questions': 1})
+    return session
+
+
+@pytest.mark.benchmark
+@pytest.mark.django_db(transaction=True)
+def test_bluff_latency_rest_vs_websocket(settings):
+    settings.BROADCAST_OUTBOX = False
+    players = create_players(50)
+
+    # rest: a logged in client posts each bluff
+    session = bluffing_session(players)
+    clients = []
+    for player in players:
+        client = APIClient()
+        client.force_login(player)
+        clients.append(client)
+    rest = []
+    for client, player in zip(clients, players):
+        start = time.perf_counter()
+        response = client.post('/api/bluffs/', {
+            'fobbit': session.active_fobbit_id,
+            'text': 'bluff {}'.format(player.id)})
+        rest.append(time.perf_counter() - start)
+        assert response.status_code == 201
+
+    # websocket: each player submits over its open connection
+    session = bluffing_session(players)
+
+    async def run():
+        communicators = []
+        for player in players:
+            communicator = connect(session.id, player)
+            await communicator.connect()
+            communicators.append(communicator)
+        latencies = []
+        for communicator, player in zip(communicators, players):
+            # skip the join and chat messages
+            while not await communicator.receive_nothing(timeout=0.01):
+                await communicator.receive_from()
+            start = time.perf_counter()
+            await communicator.send_json_to({
+                'action': 'bluff', 'request_id': player.id,
+                'fobbit': session.active_fobbit_id,
+                'text': 'bluff {}'.format(player.id)})
+            while True:
+                message = await communicator.receive_json_from(timeout=30)
+                if message.get('type') == 'ack':
+                    break
+            latencies.append(time.perf_counter() - start)
+            assert message['ok'], message
+        for communicator in communicators:
+            await communicator.disconnect()
+        return latencies
+
+    websocket = async_to_sync(run)()
+
+    for name, latencies in (('rest', rest), ('websocket', websocket)):
+        latencies.sort()
+        report(
+            '{} bluff'.format(name), sum(latencies),
+            requests=len(latencies),
+            p50_ms=round(latencies[len(latencies) // 2] * 1000, 2),
+            p95_ms=round(latencies[int(len(latencies) * .95)] * 1000, 2))
+    assert sorted(websocket)[25] < sorted(rest)[25]
+
+
+@pytest.mark.benchmark
+@pytest.mark.django_db(transaction=True)
+@pytest.mark.parametrize('n_clients', [200])
+def test_reconnect_storm(n_clients, settings):
+    settings.BROADCAST_OUTBOX = False
+    players = create_players(10)
+    session = bluffing_session(players)
+    version = session_version(session.id)
+    for player in players[:5]:
+        Bluff.objects.create(
+            fobbit=session.active_fobbit, player=player, text='bluff')
+
+    # every client fetches the session again
+    client = APIClient()
+    client.force_login(players[0])
+    start = time.perf_counter()
+    for _ in range(n_clients):
+        assert client.get(
+            '/api/sessions/{}/'.format(session.id)).status_code == 200
+    refetch_seconds = time.perf_counter() - start
+
+    # every client reconnects with the version it has
+    async def run():
+        for _ in range(n_clients):
+            communicator = connect(
+                session.id, AnonymousUser(), '?last_seq={}'.format(version))
+            await communicator.connect()
+            for _ in range(5):
+                message = await communicator.receive_json_from()
+                assert message['patch'] is not None
+            await communicator.disconnect()
+
+    start = time.perf_counter()
+    async_to_sync(run)()
+    replay_seconds = time.perf_counter() - start
+
+    report('refetch {}'.format(n_clients), refetch_seconds)
+    report('replay {}'.format(n_clients), replay_seconds)
+
+
+@pytest.mark.benchmark
+@pytest.mark.django_db
+@pytest.mark.parametrize('multiplexer', [False, True])
+def test_session_fan_out(settings, monkeypatch, fake_redis, multiplexer):
+    """One session of 300 players on one process, over redis pub/sub"""
+    settings.CHANNEL_LAYERS = {'default': {
+        'BACKEND': 'channels_redis.pubsub.RedisPubSubChannelLayer',
+        'CONFIG': {'hosts': ['redis://localhost:6379']},
+    }}
+    settings.WEBSOCKET_MULTIPLEXER = multiplexer
+    n_connections, n_messages = 300, 20
+    session = SessionFactory()
+
+    decoded = []
+    deserialize = pubsub.RedisPubSubChannelLayer.deserialize
+    monkeypatch.setattr(
+        pubsub.RedisPubSubChannelLayer, 'deserialize',
+        lambda self, message: decoded.append(1) or deserialize(self, message))
+
+    async def run():
+        communicators = []
+        for _ in range(n_connections):
+            communicator = connect(session.id, AnonymousUser())
+            await communicator.connect()
+            communicators.append(communicator)
+
+        start = time.perf_counter()
+        for version in range(n_messages):
+            await get_channel_layer().group_send(
+                'session_{}'.format(session.id), {
+                    'type': 'session_message', 'session_id': session.id,
+                    'version': version})
+        for communicator in communicators:
+            for _ in range(n_messages):
+                await communicator.receive_json_from(timeout=30)
+        seconds = time.perf_counter() - start
+
+        for communicator in communicators:
+            await communicator.disconnect()
+        await get_channel_layer().flush()
+        return seconds
+
+    seconds = async_to_sync(run)()
+    report(
+        'fan out {} x {} multiplexer={}'.format(
+            n_connections, n_messages, multiplexer),
+        seconds, decoded=len(decoded))
+
+
+@pytest.mark.benchmark
+@pytest.mark.parametrize('queued', [False, True])
+def test_fan_out_with_slow_clients(settings, queued):
+    """A group of 1000 websockets of which 10 read slowly"""
+    settings.CHANNEL_LAYERS = {
+        'default': {'BACKEND': 'fobbage.layers.LocalChannelLayer'}}
+    n_clients, n_slow, n_messages = 1000, 10, 20
+
+    async def run():
+        # the fast clients that have the last version
+        waiting = set(range(n_slow, n_clients))
+        done = asyncio.Event()
+
+        def client(i):
+            async def send(message):
+                if i < n_slow:
+                    await asyncio.sleep(0.05)
+                    return
+                if message['version'] == n_messages - 1:
+                    waiting.discard(i)
+                    if not waiting:
+                        done.set()
+
+            if not queued:
+                return send
+            queue = SendQueue(send, None, size=10, slow_after=60)
+            queue.start()
+
+            async def put(message):
+                queue.put(message, collapse=lambda: dict(message, patch=None))
+            return put
+
+        multiplexer = get_multiplexer()
+        handlers = [client(i) for i in range(n_clients)]
+        for handler in handlers:
+            await multiplexer.subscribe('session_1', handler)
+
+        start = time.perf_counter()
+        for version in range(n_messages):
+            await get_channel_layer().group_send('session_1', {
+                'type': 'session_message', 'version': version, 'patch': {}})
+        await asyncio.wait_for(done.wait(), 60)
+        seconds = time.perf_counter() - start
+
+        for handler in handlers:
+            await multiplexer.unsubscribe('session_1', handler)
+        return seconds
+
+    collapsed = sendqueue.stats['collapsed']
+    seconds = async_to_sync(run)()
+    report(
+        'fan out {} x {} with {} slow clients queued={}'.format(
+            n_clients, n_messages, n_slow, queued),
+        seconds, collapsed=sendqueue.stats['collapsed'] - collapsed)
@@ -0,0 +1,61 @@
+import json
+
+import pytest
+from rest_framework.test import APIClient
+
+from fobbage.quizes.deltas import session_patch
+from fobbage.quizes.models import Bluff, SessionState
+from tests.benchmarks.utils import create_players, measure, report
+from tests.factories.quiz_factories import QuestionFactory, SessionFactory
+
+
+@pytest.mark.benchmark
+@pytest.mark.django_db
+def test_bluff_refetch_vs_patch(monkeypatch):
+    """Cost of telling 50 clients about one bluff"""
+    players = create_players(50)
+    session = SessionFactory()
+    QuestionFactory(quiz=session.quiz)
+    session.players.set(players)
+    session.new_round({'multiplier': 1, 'number_of_questions': 1})
+
+    for player in players[:10]:
+        Bluff.objects.create(
+            fobbit=session.active_fobbit, player=player,
+            text='bluff {}'.format(player.id))
+    clients = []
+    for player in players:
+        client = APIClient()
+        client.force_authenticate(player)
+        clients.append(client)
+
+    # refetch: every client GETs the session after a {session_id} message
+    def refetch():
+        return sum(
+            len(client.get('/api/sessions/{}/'.format(session.id)).content)
+            for client in clients)
+
+    refetch_bytes, refetch_seconds, refetch_queries = measure(refetch)
+    refetch_bytes += len(players) * len(json.dumps({
+        'type': 'session_message', 'session_id': session.id}))
+
+    # patch: the server computes one patch that is sent to every client
+    def patch():
+        version, patch = session_patch(session.id)
+        return len(players) * len(json.dumps({
+            'type': 'session_message', 'session_id': session.id,
+            'version': version, 'patch': patch}))
+
+    # diff against the state from before the bluff
+    session_patch(session.id)
+    previous = SessionState.objects.get(session=session).state
+    Bluff.objects.create(
+        fobbit=session.active_fobbit, player=players[10], text='another')
+    SessionState.objects.filter(session=session).update(state=previous)
+    patch_bytes, patch_seconds, patch_queries = measure(patch)
+
+    report('refetch', refetch_seconds, refetch_queries, bytes=refetch_bytes)
+    report('patch', patch_seconds, patch_queries, bytes=patch_bytes)
+
+    assert patch_queries < refetch_queries
+    assert patch_bytes < refetch_bytes
@@ -0,0 +1,60 @@
+import time
+from types import SimpleNamespace
+
+import pytest
+
+from fobbage.quizes.engine import Engine
+from fobbage.quizes.models import Bluff, Fobbit
+from fobbage.quizes.serializers import BluffSerializer
+from tests.benchmarks.utils import create_players, report
+from tests.factories.quiz_factories import QuestionFactory, SessionFactory
+
+
+def bluffing_session(players):
+    session = SessionFactory()
+    QuestionFactory(quiz=session.quiz)
+    session.players.set(players)
+    session.new_round({'multiplier': 1, 'number_of_questions': 1})
+    return session
+
+
+@pytest.mark.benchmark
+@pytest.mark.django_db
+@pytest.mark.parametrize('n_players', [100, 1000])
+def test_bluffs_per_second(n_players, settings):
+    settings.BROADCAST_OUTBOX = False
+    players = create_players(n_players)
+
+    # orm: the serializer of the REST api and websocket saves each bluff
+    session = bluffing_session(players)
+    fobbit = session.active_fobbit
+    start = time.perf_counter()
+    for player in players:
+        serializer = BluffSerializer(
+            data={'fobbit': fobbit.id, 'text': 'bluff {}'.format(player.id)},
+            context={'request': SimpleNamespace(user=player)})
+        serializer.is_valid(raise_exception=True)
+        serializer.save()
+    orm_seconds = time.perf_counter() - start
+    fobbit.refresh_from_db()
+    assert fobbit.status == Fobbit.GUESS
+
+    # memory: checked in memory, written in batches
+    session = bluffing_session(players)
+    fobbit = session.active_fobbit
+    engine = Engine(batch_size=500, interval=3600)
+    start = time.perf_counter()
+    for player in players:
+        assert engine.bluff(
+            session.id, player.id, fobbit.id,
+            'bluff {}'.format(player.id)) is None
+    memory_seconds = time.perf_counter() - start
+    fobbit.refresh_from_db()
+    assert fobbit.status == Fobbit.GUESS
+    assert Bluff.objects.filter(fobbit=fobbit).count() == n_players
+
+    report('orm {} bluffs'.format(n_players), orm_seconds,
+           per_second=round(n_players / orm_seconds))
+    report('memory {} bluffs'.format(n_players), memory_seconds,
+           per_second=round(n_players / memory_seconds),
+           flushes=engine.stats['flushes'])
@@ -0,0 +1,67 @@
+import asyncio
+import time
+
+import pytest
+from asgiref.sync import async_to_sync
+from channels.layers import InMemoryChannelLayer
+from channels_redis import pubsub
+
+from fobbage.layers import LocalChannelLayer
+from tests.benchmarks.utils import report
+
+
+LAYERS = {
+    'local': lambda: LocalChannelLayer(capacity=1000),
+    'in-memory': lambda: InMemoryChannelLayer(capacity=1000),
+    'redis-pubsub': lambda: pubsub.RedisPubSubChannelLayer(
+        hosts=['redis://localhost:6379']),
+}
+
+
+@pytest.mark.benchmark
+@pytest.mark.parametrize('n_members', [100, 1000])
+@pytest.mark.parametrize('name', list(LAYERS))
+def test_broadcast(name, n_members, fake_redis):
+    n_messages = 20
+
+    async def run():
+        layer = LAYERS[name]()
+        channels = [await layer.new_channel() for _ in range(n_members)]
+        for channel in channels:
+            await layer.group_add('session_1', channel)
+
+        async def drain(channel, n):
+            for _ in range(n):
+                await layer.receive(channel)
+
+        # latency: one broadcast until every member received it
+        latencies = []
+        for i in range(n_messages):
+            receivers = [
+                asyncio.ensure_future(drain(channel, 1))
+                for channel in channels]
+            await asyncio.sleep(0)
+            start = time.perf_counter()
+            await layer.group_send(
+                'session_1', {'type': 'session.message', 'version': i})
+            await asyncio.gather(*receivers)
+            latencies.append(time.perf_counter() - start)
+
+        # throughput: broadcasts sent back to back
+        receivers = [
+            asyncio.ensure_future(drain(channel, n_messages))
+            for channel in channels]
+        start = time.perf_counter()
+        for i in range(n_messages):
+            await layer.group_send(
+                'session_1', {'type': 'session.message', 'version': i})
+        await asyncio.gather(*receivers)
+        seconds = time.perf_counter() - start
+        await layer.flush()
+        return sorted(latencies), seconds
+
+    latencies, seconds = async_to_sync(run)()
+    report(
+        '{} {} members'.format(name, n_members), seconds,
+        p50_latency_ms=round(latencies[len(latencies) // 2] * 1000, 2),
+        deliveries_per_second=round(n_members * n_messages / seconds))
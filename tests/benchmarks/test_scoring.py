@@ -0,0 +1,25 @@
+import pytest
+
+from fobbage.quizes.scoring import session_scores
+from tests.benchmarks.utils import create_played_session, measure, report
+
+
+@pytest.mark.benchmark
+@pytest.mark.django_db
+def test_score_board_50_players_40_fobbits():
+    session, players = create_played_session(n_players=50, n_fobbits=40)
+
+    def per_player():
+        return {
+            player.id: session.score_for_player(player)
+            for player in players
+        }
+
+    old, old_seconds, old_queries = measure(per_player)
+    new, new_seconds, new_queries = measure(session_scores, session)
+
+    report('score_for_player per player', old_seconds, old_queries)
+    report('session_scores', new_seconds, new_queries)
+
+    assert new == old
+    assert new_queries == 4
@@ -0,0 +1,98 @@
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import pytest
+from django.db import connection
+from rest_framework.test import APIClient
+
+from fobbage.quizes import snapshots
+from fobbage.quizes.snapshots import SingleFlight
+from fobbage.quizes.models import Bluff
+from tests.benchmarks.utils import create_players, report
+from tests.factories.quiz_factories import QuestionFactory, SessionFactory
+
+
+@pytest.mark.benchmark
+@pytest.mark.django_db
+@pytest.mark.parametrize('n_players', [100, 500])
+def test_session_fetch_after_broadcast(n_players):
+    players = create_players(n_players)
+    session = SessionFactory()
+    QuestionFactory(quiz=session.quiz)
+    session.players.set(players)
+    session.new_round({'multiplier': 1, 'number_of_questions': 1})
+    Bluff.objects.bulk_create([
+        Bluff(fobbit=session.active_fobbit, player=player, text='bluff')
+        for player in players[1:]])
+    url = '/api/sessions/{}/'.format(session.id)
+    client = APIClient()
+
+    def fetch_all(cached):
+        start = time.perf_counter()
+        for player in players:
+            if not cached:
+                snapshots.invalidate(session.id)
+            client.force_authenticate(player)
+            assert client.get(url).status_code == 200
+        return time.perf_counter() - start
+
+    serialized = fetch_all(cached=False)
+    cached = fetch_all(cached=True)
+    report('serialize {} players'.format(n_players), serialized)
+    report('snapshot {} players'.format(n_players), cached)
+    assert cached < serialized
+
+
+class NoFlight(SingleFlight):
+    """Every request renders"""
+
+    def do(self, key, func):
+        self.count('rendered')
+        return func(), False
+
+
+@pytest.mark.benchmark
+@pytest.mark.django_db(transaction=True)
+@pytest.mark.parametrize('n_clients', [200])
+def test_simultaneous_session_fetches(n_clients, monkeypatch):
+    players = create_players(n_clients)
+    session = SessionFactory()
+    QuestionFactory(quiz=session.quiz)
+    session.players.set(players)
+    session.new_round({'multiplier': 1, 'number_of_questions': 1})
+    Bluff.objects.bulk_create([
+        Bluff(fobbit=session.active_fobbit, player=player, text='bluff')
+        for player in players[1:]])
+    url = '/api/sessions/{}/'.format(session.id)
+
+    def burst(flight):
+        """Every client fetches the session right after a broadcast"""
+        monkeypatch.setattr(snapshots, 'flight', flight)
+        snapshots.invalidate(session.id)
+        queries = []
+        lock = threading.Lock()
+
+        def count(execute, sql, params, many, context):
+            with lock:
+                queries.append(sql)
+            return execute(sql, params, many, context)
+
+        def fetch(player):
+            try:
+                client = APIClient()
+                client.force_authenticate(player)
+                with connection.execute_wrapper(count):
+                    assert client.get(url).status_code == 200
+            finally:
+                connection.close()
+
+        start = time.perf_counter()
+        with ThreadPoolExecutor(max_workers=64) as pool:
+            list(pool.map(fetch, players))
+        return time.perf_counter() - start, len(queries), flight.snapshot()
+
+    for flight in (NoFlight(), SingleFlight()):
+        seconds, queries, stats = burst(flight)
+        report('{} {} clients'.format(type(flight).__name__, n_clients),
+               seconds, queries, **stats)
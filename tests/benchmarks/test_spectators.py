@@ -0,0 +1,67 @@
+import time
+import tracemalloc
+
+import pytest
+from asgiref.sync import async_to_sync
+
+from fobbage.quizes.spectators import get_hub
+from tests.benchmarks.utils import create_players, report
+from tests.factories.quiz_factories import QuestionFactory, SessionFactory
+from tests.unit.quizes.test_spectators import broadcast, watch
+
+
+@pytest.fixture(autouse=True)
+def local_layer(settings):
+    settings.BROADCAST_OUTBOX = False
+    settings.CHANNEL_LAYERS = {
+        'default': {'BACKEND': 'fobbage.layers.LocalChannelLayer'}}
+
+
+@pytest.mark.benchmark
+@pytest.mark.django_db(transaction=True)
+@pytest.mark.parametrize('n_spectators', [5000])
+def test_spectator_soak(n_spectators):
+    n_broadcasts = 20
+    session = SessionFactory()
+    QuestionFactory(quiz=session.quiz)
+    session.players.set(create_players(50))
+    session.new_round({'multiplier': 1, 'number_of_questions': 1})
+
+    async def run():
+        tracemalloc.start()
+        start = time.perf_counter()
+        spectators = []
+        for _ in range(n_spectators):
+            spectator = watch(session.id)
+            connected, _ = await spectator.connect()
+            assert connected
+            await spectator.receive_from()
+            spectators.append(spectator)
+        connect_seconds = time.perf_counter() - start
+        memory = tracemalloc.get_traced_memory()[0]
+        tracemalloc.stop()
+
+        latencies = []
+        for _ in range(n_broadcasts):
+            start = time.perf_counter()
+            await broadcast(session.id)
+            for spectator in spectators:
+                await spectator.receive_from(timeout=30)
+            latencies.append(time.perf_counter() - start)
+        stats = dict((await get_hub(session.id)).stats)
+
+        for spectator in spectators:
+            await spectator.disconnect()
+        return connect_seconds, memory, sorted(latencies), stats
+
+    connect_seconds, memory, latencies, stats = async_to_sync(run)()
+    report(
+        'connect {} spectators'.format(n_spectators), connect_seconds,
+        kb_per_spectator=round(memory / n_spectators / 1024, 1))
+    report(
+        'broadcast to {} spectators'.format(n_spectators), sum(latencies),
+        p50_ms=round(latencies[len(latencies) // 2] * 1000, 1),
+        max_ms=round(latencies[-1] * 1000, 1), **stats)
+    # every broadcast and state encoded once, one query for all spectators
+    assert stats['loads'] == 1
+    assert stats['encoded'] <= n_broadcasts + 1
@@ -0,0 +1,101 @@
+import time
+
+from django.db import connection
+
+from fobbage.accounts.models import User
+from fobbage.quizes.models import (
+    Answer, Bluff, Fobbit, Guess, Question, Quiz, Session,
+)
+
+
+def measure(func, *args, **kwargs):
+    """Run func once, returns (result, seconds, number of queries)"""
+    queries = []
+
+    def count(execute, sql, params, many, context):
+        queries.append(sql)
+        return execute(sql, params, many, context)
+
+    with connection.execute_wrapper(count):
+        start = time.perf_counter()
+        result = func(*args, **kwargs)
+        seconds = time.perf_counter() - start
+    return result, seconds, len(queries)
+
+
+def report(name, seconds, queries=None, **extra):
+    if queries is not None:
+        extra = dict(queries=queries, **extra)
+    details = ''.join(
+        ', {}={}'.format(key, value) for key, value in extra.items())
+    print('\n{}: {:.4f}s{}'.format(name, seconds, details))
+
+
+def create_players(n):
+    User.objects.bulk_create([
+        User(username='bench-player-{}'.format(i)) for i in range(n)])
+    return list(User.objects.filter(username__startswith='bench-player-'))
+
+
+def create_played_session(n_players, n_fobbits, status=Fobbit.FINISHED):
+    """
+    Session where every player bluffed and guessed on every fobbit
+
+    Uses bulk inserts, so no signals (and broadcasts) are fired.
+    """
+    players = create_players(n_players)
+    quiz = Quiz.objects.create(title='benchmark', created_by=players[0])
+    session = Session.objects.create(
+        quiz=quiz, name='benchmark', owner=players[0],
+        settings={'rounds': [
+            {'multiplier': 1, 'number_of_questions': n_fobbits // 2},
+            {'multiplier': 2, 'number_of_questions': n_fobbits // 2},
+        ]},
+    )
+    session.players.set(players)
+
+    questions = Question.objects.bulk_create([
+        Question(
+            quiz=quiz, player=players[0], order=i,
+            text='question {}'.format(i),
+            correct_answer='answer {}'.format(i),
+        )
+        for i in range(n_fobbits)
+    ])
+    fobbits = Fobbit.objects.bulk_create([
+        Fobbit(
+            session=session, question=question, status=status,
+            round=i * 2 // n_fobbits,
+        )
+        for i, question in enumerate(questions)
+    ])
+
+    answers = Answer.objects.bulk_create([
+        Answer(
+            fobbit=fobbit, order=j, is_correct=j == 0,
+            text=fobbit.question.correct_answer if j == 0
+            else 'bluff {}'.format(j),
+        )
+        for fobbit in fobbits
+        for j in range(n_players + 1)
+    ])
+    by_fobbit = {}
+    for answer in answers:
+        by_fobbit.setdefault(answer.fobbit_id, []).append(answer)
+
+    bluffs, guesses = [], []
+    for fobbit in fobbits:
+        options = by_fobbit[fobbit.id]
+        for i, player in enumerate(players):
+            # every fifth player bluffs the same as the previous one
+            bluffed = options[i] if i % 5 == 4 else options[i + 1]
+            bluffs.append(Bluff(
+                fobbit=fobbit, player=player, text=bluffed.text,
+                answer=bluffed))
+            guesses.append(Guess(
+                player=player,
+                answer=options[(i * 7 + fobbit.id) % len(options)]))
+    Bluff.objects.bulk_create(bluffs)
+    Guess.objects.bulk_create(guesses)
+
+    return session, players
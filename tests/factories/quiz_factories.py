@@ -1,7 +1,7 @@
 import factory
 
 from fobbage.quizes.models import (
-    Quiz, Question, Answer, Bluff, Fobbit, Session
+    Quiz, Question, Answer, Bluff, Fobbit, Guess, Session
 )
 from tests.factories.account_factories import UserFactory
 
@@ -73,3 +73,12 @@ class BluffFactory(factory.django.DjangoModelFactory):
     # text = 'bluff'
     fobbit = factory.SubFactory(FobbitFactory)
     player = factory.SubFactory(UserFactory)
+
+
+class GuessFactory(factory.django.DjangoModelFactory):
+    """ Factory that creates a guess"""
+    class Meta:
+        model = Guess
+
+    answer = factory.SubFactory(AnswerFactory)
+    player = factory.SubFactory(UserFactory)
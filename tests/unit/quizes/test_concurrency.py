@@ -0,0 +1,96 @@
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+import pytest
+from channels.layers import InMemoryChannelLayer
+from django.db import connection
+
+from tests.factories.account_factories import UserFactory
+from tests.factories.quiz_factories import QuestionFactory, SessionFactory
+
+from fobbage.quizes import messages
+from fobbage.quizes.models import Bluff, Fobbit, Guess
+
+
+@pytest.fixture
+def generated(monkeypatch, settings):
+    """Number of times answers were generated"""
+    settings.BROADCAST_OUTBOX = False
+    monkeypatch.setattr(messages, 'channel_layer', InMemoryChannelLayer())
+
+    calls = []
+    lock = threading.Lock()
+    generate_answers = Fobbit.generate_answers
+
+    def counted(self):
+        result = generate_answers(self)
+        if result:
+            with lock:
+                calls.append(self.id)
+        return result
+    monkeypatch.setattr(Fobbit, 'generate_answers', counted)
+    return calls
+
+
+def in_threads(func, items, workers=16):
+    def run(item):
+        try:
+            return func(item)
+        finally:
+            connection.close()
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        return list(pool.map(run, items))
+
+
+@pytest.mark.django_db(transaction=True)
+def test_concurrent_bluffs_generate_answers_once(generated):
+    session = SessionFactory()
+    QuestionFactory.create_batch(2, quiz=session.quiz)
+    players = UserFactory.create_batch(200)
+    session.players.set(players)
+    session.new_round({'multiplier': 1, 'number_of_questions': 2})
+    fobbit = session.active_fobbit
+
+    in_threads(
+        lambda player: Bluff.objects.create(
+            fobbit=fobbit, player=player, text='bluff {}'.format(player.id)),
+        players)
+
+    fobbit.refresh_from_db()
+    assert generated == [fobbit.id]
+    assert fobbit.status == Fobbit.GUESS
+    assert fobbit.progress.bluffs == 200
+    assert fobbit.answers.count() == 201
+    assert not fobbit.bluffs.filter(answer=None).exists()
+
+
+@pytest.mark.django_db(transaction=True)
+def test_concurrent_guesses_finish_once(generated, monkeypatch):
+    finished = []
+    finish = Fobbit.finish
+
+    def counted(self):
+        finish(self)
+        finished.append(self.id)
+    monkeypatch.setattr(Fobbit, 'finish', counted)
+
+    session = SessionFactory()
+    QuestionFactory.create_batch(2, quiz=session.quiz)
+    players = UserFactory.create_batch(50)
+    session.players.set(players)
+    session.new_round({'multiplier': 1, 'number_of_questions': 2})
+    fobbit = session.active_fobbit
+    Bluff.objects.bulk_create([
+        Bluff(fobbit=fobbit, player=player, text='bluff {}'.format(player.id))
+        for player in players])
+    fobbit.generate_answers()
+    answer = fobbit.answers.get(is_correct=True)
+
+    in_threads(
+        lambda player: Guess.objects.create(answer=answer, player=player),
+        players)
+
+    fobbit.refresh_from_db()
+    assert finished == [fobbit.id]
+    assert fobbit.status == Fobbit.FINISHED
+    assert fobbit.scores.count() == 50
@@ -0,0 +1,211 @@
+import asyncio
+
+import pytest
+from asgiref.sync import async_to_sync
+from channels.layers import get_channel_layer
+from channels.routing import URLRouter
+from channels.testing import WebsocketCommunicator
+from django.contrib.auth.models import AnonymousUser
+from django.urls import re_path
+
+from tests.factories.account_factories import UserFactory
+from tests.factories.quiz_factories import QuestionFactory, SessionFactory
+
+from fobbage.quizes.consumers import ChatConsumer
+from fobbage.quizes.deltas import session_version
+from fobbage.quizes.engine import engine
+from fobbage.quizes.models import Bluff, Guess
+
+application = URLRouter([
+    re_path(r'^ws/session/(?P<session_id>[^/]+)/$', ChatConsumer.as_asgi()),
+])
+
+
+@pytest.fixture(autouse=True)
+def in_memory_layer(settings):
+    settings.CHANNEL_LAYERS = {
+        'default': {'BACKEND': 'channels.layers.InMemoryChannelLayer'}}
+
+
+def connect(session_id, user, query=''):
+    communicator = WebsocketCommunicator(
+        application, '/ws/session/{}/{}'.format(session_id, query))
+    communicator.scope['user'] = user
+    return communicator
+
+
+@pytest.mark.django_db
+def test_connect_and_chat(django_assert_num_queries):
+    session = SessionFactory()
+    user = UserFactory()
+
+    async def run():
+        communicator = connect(session.id, user)
+        connected, _ = await communicator.connect()
+        assert connected
+        joined = await communicator.receive_json_from()
+        assert joined['type'] == 'presence_message'
+        assert joined['joined'] == [
+            {'id': user.id, 'username': user.username}]
+
+        await communicator.send_json_to({'message': 'hello'})
+        message = await communicator.receive_json_from()
+        await communicator.disconnect()
+        return message
+
+    # only the session is loaded, at connect
+    with django_assert_num_queries(1):
+        message = async_to_sync(run)()
+    assert message == {
+        'type': 'chat_message', 'message': 'hello', 'user': user.username}
+
+
+@pytest.mark.django_db
+def test_connect_to_unknown_session():
+    user = UserFactory()
+
+    async def run():
+        communicator = connect('unknown', user)
+        connected, _ = await communicator.connect()
+        return connected
+
+    assert async_to_sync(run)() is False
+
+
+def submit(session_id, user, *requests):
+    """Send requests over a new connection, returns the acks"""
+    async def run():
+        communicator = connect(session_id, user)
+        await communicator.connect()
+        # user joined
+        await communicator.receive_json_from()
+        acks = []
+        for request in requests:
+            await communicator.send_json_to(request)
+            acks.append(await communicator.receive_json_from())
+        await communicator.disconnect()
+        return acks
+    return async_to_sync(run)()
+
+
+@pytest.fixture
+def session(settings):
+    settings.BROADCAST_OUTBOX = False
+    session = SessionFactory()
+    QuestionFactory(quiz=session.quiz)
+    session.players.set(UserFactory.create_batch(2))
+    session.new_round({'multiplier': 1, 'number_of_questions': 1})
+    return session
+
+
+# database_sync_to_async closes connections that are in a transaction
+@pytest.mark.django_db(transaction=True)
+def test_bluff_over_websocket(session):
+    p1, p2 = session.players.all()
+    fobbit = session.active_fobbit
+    bluff = {'action': 'bluff', 'fobbit': fobbit.id, 'text': 'lie'}
+
+    ok, again = submit(
+        session.id, p1, dict(bluff, request_id=1), dict(bluff, request_id=2))
+    outsider, = submit(session.id, UserFactory(), dict(bluff, request_id=3))
+
+    assert ok['type'] == 'ack'
+    assert ok['request_id'] == 1 and ok['ok'] is True
+    assert ok['data']['text'] == 'lie'
+    assert Bluff.objects.get(fobbit=fobbit, player=p1).text == 'lie'
+    # the same rules as the REST api
+    assert again['ok'] is False
+    assert again['errors'] == ['player already bluffed for this question']
+    assert outsider['ok'] is False
+
+
+@pytest.mark.django_db(transaction=True)
+def test_guess_over_websocket(session):
+    p1, p2 = session.players.all()
+    fobbit = session.active_fobbit
+    Bluff.objects.create(fobbit=fobbit, player=p1, text='one')
+    Bluff.objects.create(fobbit=fobbit, player=p2, text='two')
+    answer = fobbit.answers.get(is_correct=True)
+
+    ack, = submit(session.id, p1, {
+        'action': 'guess', 'request_id': 'a', 'answer': answer.id})
+
+    assert ack['ok'] is True and ack['request_id'] == 'a'
+    assert Guess.objects.get(player=p1).answer == answer
+
+
+@pytest.mark.django_db(transaction=True)
+def test_bluff_over_websocket_in_memory(session, settings):
+    settings.GAME_ENGINE = 'memory'
+    p1, p2 = session.players.all()
+    fobbit = session.active_fobbit
+    bluff = {'action': 'bluff', 'fobbit': fobbit.id, 'text': 'lie'}
+
+    ok, again = submit(
+        session.id, p1, dict(bluff, request_id=1), dict(bluff, request_id=2))
+    invalid, = submit(session.id, p2, {'action': 'bluff', 'request_id': 3})
+
+    assert ok['ok'] is True and ok['data']['text'] == 'lie'
+    assert again['errors'] == ['player already bluffed for this question']
+    assert invalid['ok'] is False
+    engine.flush()
+    assert Bluff.objects.get(fobbit=fobbit, player=p1).text == 'lie'
+
+
+@pytest.mark.django_db(transaction=True)
+def test_reconnect_replays_missed_events(session, settings):
+    settings.SESSION_LOG_SIZE = 1
+    p1, p2 = session.players.all()
+    version = session_version(session.id)
+    Bluff.objects.create(fobbit=session.active_fobbit, player=p1, text='one')
+
+    async def reconnect(last_seq):
+        communicator = connect(
+            session.id, AnonymousUser(), '?last_seq={}'.format(last_seq))
+        await communicator.connect()
+        received = []
+        while not await communicator.receive_nothing():
+            received.append(await communicator.receive_json_from())
+        await communicator.disconnect()
+        return received
+
+    replayed, = async_to_sync(reconnect)(version)
+    assert replayed['version'] == version + 1
+    assert replayed['patch']['players_without_bluff_count'] == 1
+    assert async_to_sync(reconnect)(version + 1) == []
+    # too old, the client fetches the session
+    snapshot, = async_to_sync(reconnect)(0)
+    assert snapshot['version'] is None and snapshot['patch'] is None
+
+
+@pytest.mark.django_db
+def test_lagging_client_is_disconnected(settings):
+    settings.WEBSOCKET_MAX_LAG = 2
+    settings.WEBSOCKET_SLOW_SECONDS = 0
+    session = SessionFactory()
+
+    async def run():
+        reader, stalled = [
+            connect(session.id, AnonymousUser()) for _ in range(2)]
+        for communicator in (reader, stalled):
+            await communicator.connect()
+            await communicator.send_json_to({'action': 'seen', 'version': 0})
+        layer = get_channel_layer()
+        for version in range(1, 6):
+            await layer.group_send('session_{}'.format(session.id), {
+                'type': 'session_message', 'session_id': session.id,
+                'version': version, 'patch': {}})
+            # only the reader says it keeps up
+            await reader.receive_json_from()
+            await reader.send_json_to({'action': 'seen', 'version': version})
+            await asyncio.sleep(0.01)
+        # what the server buffered for it, then the close
+        outputs = []
+        while not await stalled.receive_nothing():
+            outputs.append(await stalled.receive_output())
+        await reader.disconnect()
+        return outputs
+
+    *sent, closed = async_to_sync(run)()
+    assert closed == {'type': 'websocket.close', 'code': 1008}
+    assert len(sent) < 5
@@ -0,0 +1,177 @@
+import pytest
+from django.db import transaction
+from asgiref.sync import async_to_sync
+from channels.layers import InMemoryChannelLayer
+from rest_framework.test import APIClient
+
+from tests.factories.account_factories import UserFactory
+from tests.factories.quiz_factories import (
+    BluffFactory,
+    QuestionFactory,
+    SessionFactory,
+)
+
+from fobbage.quizes import messages
+from fobbage.quizes.messages import broadcast_stats, coalesce_broadcasts
+from fobbage.quizes.deltas import (
+    session_events, session_patch, session_version)
+
+
+@pytest.fixture
+def session(django_capture_on_commit_callbacks):
+    with django_capture_on_commit_callbacks(execute=True):
+        session = SessionFactory()
+        QuestionFactory(quiz=session.quiz)
+        session.players.set(UserFactory.create_batch(2))
+        session.new_round({'multiplier': 1, 'number_of_questions': 1})
+    return session
+
+
+@pytest.fixture
+def broadcasts(monkeypatch, settings, session):
+    """Messages sent to the group of the session"""
+    settings.BROADCAST_OUTBOX = False
+    layer = InMemoryChannelLayer()
+    monkeypatch.setattr(messages, 'channel_layer', layer)
+    channel = async_to_sync(layer.new_channel)()
+    async_to_sync(layer.group_add)('session_{}'.format(session.id), channel)
+
+    def receive():
+        received = []
+        while layer.channels.get(channel):
+            received.append(async_to_sync(layer.receive)(channel))
+        return received
+    return receive
+
+
+@pytest.mark.django_db
+def test_bluff_broadcasts_patch(
+        session, broadcasts, django_capture_on_commit_callbacks):
+    version = session_version(session.id)
+    p1, p2 = session.players.all()
+
+    with django_capture_on_commit_callbacks(execute=True):
+        BluffFactory(fobbit=session.active_fobbit, player=p1, text='bluff')
+
+    message, = broadcasts()
+    assert message['session_id'] == session.id
+    assert message['version'] == version + 1
+    assert message['patch'] == {
+        'players_without_bluff': [{'id': p2.id, 'username': p2.username}],
+        'players_without_bluff_count': 1,
+    }
+
+
+@pytest.mark.django_db
+def test_session_patch_without_changes(session):
+    version, patch = session_patch(session.id)
+
+    assert session_patch(session.id) == (version + 1, {})
+
+
+@pytest.mark.django_db
+def test_answers_in_patch(
+        session, broadcasts, django_capture_on_commit_callbacks):
+    fobbit = session.active_fobbit
+    p1, p2 = session.players.all()
+    with django_capture_on_commit_callbacks(execute=True):
+        BluffFactory(fobbit=fobbit, player=p1, text='one')
+    with django_capture_on_commit_callbacks(execute=True):
+        # the last bluff generates the answers
+        BluffFactory(fobbit=fobbit, player=p2, text='two')
+
+    first, second = broadcasts()
+    assert second['version'] == first['version'] + 1
+    assert second['patch']['status'] == fobbit.GUESS
+    assert {answer['text'] for answer in second['patch']['answers']} == {
+        'one', 'two', fobbit.question.correct_answer}
+
+
+@pytest.mark.django_db
+def test_one_broadcast_per_transaction(
+        session, broadcasts, django_capture_on_commit_callbacks):
+    suppressed = broadcast_stats().get('suppressed', 0)
+    p1, p2 = session.players.all()
+
+    with django_capture_on_commit_callbacks(execute=True):
+        BluffFactory(fobbit=session.active_fobbit, player=p1, text='one')
+        BluffFactory(fobbit=session.active_fobbit, player=p2, text='two')
+        assert broadcasts() == []
+
+    message, = broadcasts()
+    assert message['patch']['status'] == session.active_fobbit.GUESS
+    assert broadcast_stats().get('suppressed', 0) > suppressed
+
+
+@pytest.mark.django_db
+def test_session_response_carries_version(session):
+    client = APIClient()
+    client.force_authenticate(session.owner)
+    version, patch = session_patch(session.id)
+    # saving a loaded session keeps the version
+    session.save()
+
+    response = client.get('/api/sessions/{}/'.format(session.id))
+
+    assert response.json()['version'] == version == session_version(
+        session.id)
+
+
+@pytest.mark.django_db
+def test_rolled_back_updates_are_not_broadcast(
+        session, broadcasts, django_capture_on_commit_callbacks):
+    p1, p2 = session.players.all()
+
+    with django_capture_on_commit_callbacks(execute=True):
+        with pytest.raises(ValueError):
+            with transaction.atomic():
+                BluffFactory(
+                    fobbit=session.active_fobbit, player=p1, text='one')
+                raise ValueError
+    assert broadcasts() == []
+
+    # the next transaction broadcasts again
+    with django_capture_on_commit_callbacks(execute=True):
+        BluffFactory(fobbit=session.active_fobbit, player=p1, text='one')
+    message, = broadcasts()
+    assert message['patch']['players_without_bluff_count'] == 1
+
+
+@pytest.mark.django_db
+def test_coalesce_broadcasts_block(
+        session, broadcasts, django_capture_on_commit_callbacks):
+    p1, p2 = session.players.all()
+
+    with django_capture_on_commit_callbacks(execute=True):
+        with coalesce_broadcasts():
+            with transaction.atomic():
+                BluffFactory(
+                    fobbit=session.active_fobbit, player=p1, text='one')
+            session.save()
+
+    message, = broadcasts()
+    assert message['patch']['players_without_bluff_count'] == 1
+
+
+@pytest.mark.django_db
+def test_broadcast_stats_view(admin_client):
+    response = admin_client.get('/api/broadcast_stats/')
+
+    assert response.status_code == 200
+    assert set(response.data) == {
+        'broadcasts', 'outbox', 'snapshots', 'send_queues'}
+
+
+@pytest.mark.django_db
+def test_session_events_are_kept(session, settings):
+    settings.SESSION_LOG_SIZE = 3
+    version = session_version(session.id)
+    patches = [session_patch(session.id) for _ in range(4)]
+
+    assert [seq for seq, _ in patches] == list(range(version + 1, version + 5))
+    assert session_events(session.id, version + 4) == []
+    assert session_events(session.id, version + 2) == patches[2:]
+    # only the last 3 are kept
+    assert session.events.count() == 3
+    assert session_events(session.id, version) is None
+    assert session_events(session.id, version + 5) is None
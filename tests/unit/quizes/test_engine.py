@@ -0,0 +1,101 @@
+import pytest
+
+from tests.factories.account_factories import UserFactory
+from tests.factories.quiz_factories import QuestionFactory, SessionFactory
+
+from fobbage.quizes.engine import Engine
+from fobbage.quizes.models import Bluff, Fobbit, Guess
+
+
+@pytest.fixture
+def engine(monkeypatch):
+    # no write-behind during the test, it flushes explicitly
+    engine = Engine(batch_size=100, interval=3600)
+    # the one the signals invalidate
+    monkeypatch.setattr('fobbage.quizes.engine.engine', engine)
+    return engine
+
+
+@pytest.fixture
+def session():
+    session = SessionFactory()
+    QuestionFactory(quiz=session.quiz)
+    session.players.set(UserFactory.create_batch(3))
+    session.new_round({'multiplier': 1, 'number_of_questions': 1})
+    return session
+
+
+@pytest.mark.django_db
+def test_engine_checks_bluffs(engine, session):
+    fobbit = session.active_fobbit
+    player = session.players.first()
+
+    assert engine.bluff(
+        session.id, UserFactory().id, fobbit.id, 'x') is not None
+    assert engine.bluff(session.id, player.id, fobbit.id + 1, 'x') is not None
+    assert engine.bluff(session.id, player.id, fobbit.id, 'x') is None
+    assert engine.bluff(session.id, player.id, fobbit.id, 'y') is not None
+    assert engine.guess(session.id, player.id, 0) is not None
+    # validated like the REST api does
+    other = session.players.last()
+    assert engine.bluff(session.id, other.id, fobbit.id, ' ') is not None
+    assert engine.bluff(
+        session.id, other.id, fobbit.id, 'x' * 256) is not None
+
+
+@pytest.mark.django_db
+def test_engine_writes_behind(engine, session):
+    fobbit = session.active_fobbit
+    players = list(session.players.all())
+
+    for player in players[:2]:
+        assert engine.bluff(session.id, player.id, fobbit.id, 'x') is None
+    assert not Bluff.objects.filter(fobbit=fobbit).exists()
+
+    engine.flush()
+    assert Bluff.objects.filter(fobbit=fobbit).count() == 2
+    fobbit.progress.refresh_from_db()
+    assert fobbit.progress.bluffs == 2
+
+
+@pytest.mark.django_db
+def test_engine_plays_a_fobbit(engine, session):
+    fobbit = session.active_fobbit
+    players = list(session.players.all())
+
+    for i, player in enumerate(players):
+        engine.bluff(session.id, player.id, fobbit.id, 'bluff {}'.format(i))
+    fobbit.refresh_from_db()
+    assert fobbit.status == Fobbit.GUESS
+    assert fobbit.answers.count() == 4
+
+    answer = fobbit.answers.get(is_correct=True)
+    for player in players:
+        assert engine.guess(session.id, player.id, answer.id) is None
+    fobbit.refresh_from_db()
+    assert fobbit.status == Fobbit.FINISHED
+    assert Guess.objects.filter(answer__fobbit=fobbit).count() == 3
+    assert engine.stats['written'] == 6
+
+
+@pytest.mark.django_db
+def test_engine_keeps_actions_next_to_a_conflict(engine, session):
+    fobbit = session.active_fobbit
+    p1, p2, _ = session.players.order_by('id')
+
+    assert engine.bluff(session.id, p1.id, fobbit.id, 'engine') is None
+    # p2 bluffed over the REST api, the engine is told so
+    Bluff.objects.create(fobbit=fobbit, player=p2, text='rest')
+    assert engine.bluff(session.id, p2.id, fobbit.id, 'again') is not None
+    engine.flush()
+    assert Bluff.objects.get(player=p1).text == 'engine'
+
+    # a conflict the engine missed only costs the conflicting bluff
+    p3 = session.players.order_by('id').last()
+    assert engine.bluff(session.id, p3.id, fobbit.id, 'first') is None
+    live = engine.sessions[session.id]
+    live.pending_bluffs.append(Bluff(fobbit=fobbit, player=p1, text='dup'))
+    engine.flush()
+    assert Bluff.objects.get(player=p3).text == 'first'
+    assert Bluff.objects.get(player=p1).text == 'engine'
+    assert engine.stats['rejected'] == 1
@@ -1,14 +1,18 @@
 import pytest
 
+from tests.factories.account_factories import UserFactory
 from tests.factories.quiz_factories import (
     # QuizFactory,
     QuestionFactory,
     AnswerFactory,
     BluffFactory,
     FobbitFactory,
+    GuessFactory,
     SessionFactory,
 )
 
+from fobbage.quizes.models import Bluff, Fobbit
+
 
 @pytest.mark.django_db
 def test_question_string_representation():
@@ -93,3 +97,130 @@ def test_new_round():
 
     assert session.modus == 1
     assert session.active_fobbit.question == q1
+
+
+@pytest.mark.django_db
+def test_players_without_bluff_and_guess(django_assert_num_queries):
+    session = SessionFactory()
+    QuestionFactory(quiz=session.quiz)
+    p1, p2, p3 = players = UserFactory.create_batch(3)
+    session.players.set(players)
+    session.new_round({'multiplier': 1, 'number_of_questions': 1})
+    fobbit = session.active_fobbit
+    BluffFactory(fobbit=fobbit, player=p1, text='one')
+    BluffFactory(fobbit=fobbit, player=p2, text='two')
+
+    fobbit = Fobbit.objects.select_related('session').get(id=fobbit.id)
+    with django_assert_num_queries(1):
+        assert fobbit.players_without_bluff == [p3]
+    with django_assert_num_queries(1):
+        assert fobbit.players_without_bluff_count == 1
+    with django_assert_num_queries(1):
+        assert fobbit.players_without_guess_count == 3
+
+    BluffFactory(fobbit=fobbit, player=p3, text='three')
+    fobbit.refresh_from_db()
+    GuessFactory(answer=fobbit.answers.first(), player=p2)
+
+    prefetched = Fobbit.objects.select_related('session').prefetch_related(
+        'bluffs', 'answers__guesses', 'session__players').get(id=fobbit.id)
+    with django_assert_num_queries(0):
+        assert prefetched.players_without_bluff_count == 0
+        assert set(prefetched.players_without_guess) == {p1, p3}
+    assert set(fobbit.players_without_guess) == {p1, p3}
+
+
+@pytest.mark.django_db
+@pytest.mark.parametrize('n_players', [3, 30])
+def test_generate_answers(django_assert_num_queries, n_players):
+    session = SessionFactory()
+    QuestionFactory(quiz=session.quiz, correct_answer='Paris')
+    QuestionFactory(quiz=session.quiz)
+    players = UserFactory.create_batch(n_players)
+    session.players.set(players)
+    session.new_round({'multiplier': 1, 'number_of_questions': 2})
+    fobbit = session.active_fobbit
+    # bulk, so the last bluff does not generate the answers
+    Bluff.objects.bulk_create([
+        Bluff(fobbit=fobbit, player=player, text=text)
+        for player, text in zip(players, ['paris', 'Lyon', 'LYON'])
+    ] + [
+        Bluff(fobbit=fobbit, player=player, text='bluff {}'.format(i))
+        for i, player in enumerate(players[3:])
+    ])
+    fobbit = Fobbit.objects.get(id=fobbit.id)
+
+    # checks, deletes, insert, updates, save and the next question
+    with django_assert_num_queries(19):
+        assert fobbit.generate_answers()
+
+    answers = {answer.text: answer for answer in fobbit.answers.all()}
+    assert set(answers) == {'Paris', 'Lyon'} | {
+        'bluff {}'.format(i) for i in range(n_players - 3)}
+    assert sorted(answer.order for answer in answers.values()) == list(
+        range(1, len(answers) + 1))
+    bluffs = {bluff.player: bluff.answer for bluff in fobbit.bluffs.all()}
+    assert bluffs[players[0]] == answers['Paris']
+    assert bluffs[players[1]] == bluffs[players[2]] == answers['Lyon']
+    assert fobbit.status == Fobbit.GUESS
+
+
+@pytest.mark.django_db
+@pytest.mark.parametrize('shuffle', [False, True])
+def test_questions_do_not_repeat(shuffle):
+    session = SessionFactory(settings={'shuffle_questions': shuffle})
+    QuestionFactory.create_batch(5, quiz=session.quiz)
+    session.new_round({'multiplier': 1, 'number_of_questions': 2})
+    session.next_question()
+    # a question added to the quiz during the session
+    QuestionFactory(quiz=session.quiz)
+    session.new_round({'multiplier': 2, 'number_of_questions': 4})
+    for _ in range(3):
+        session.next_question()
+
+    asked = list(session.fobbits.values_list('question', flat=True))
+    assert len(asked) == 6
+    assert sorted(asked) == sorted(
+        session.quiz.questions.values_list('id', flat=True))
+    assert session.deck.draw() is None
+
+
+@pytest.mark.django_db
+def test_deck_of_started_session():
+    session = SessionFactory()
+    first, second = QuestionFactory.create_batch(2, quiz=session.quiz)
+    FobbitFactory(session=session, question=first)
+
+    assert session.question_deck().draw() == second.id
+
+
+@pytest.mark.django_db
+@pytest.mark.parametrize('auto_finish', [True, False])
+def test_last_guess_finishes_fobbit(auto_finish):
+    session = SessionFactory(settings={'auto_finish': auto_finish})
+    QuestionFactory.create_batch(2, quiz=session.quiz)
+    p1, p2 = players = UserFactory.create_batch(2)
+    session.players.set(players)
+    session.new_round({'multiplier': 1, 'number_of_questions': 2})
+    fobbit = session.active_fobbit
+    BluffFactory(fobbit=fobbit, player=p1, text='one')
+    BluffFactory(fobbit=fobbit, player=p2, text='two')
+    answer = fobbit.answers.get(is_correct=True)
+
+    GuessFactory(answer=answer, player=p1)
+    fobbit.refresh_from_db()
+    assert fobbit.status == Fobbit.GUESS
+
+    GuessFactory(answer=answer, player=p2)
+    fobbit.refresh_from_db()
+    if auto_finish:
+        assert fobbit.status == Fobbit.FINISHED
+        assert fobbit.scores.count() == 2
+    else:
+        assert fobbit.status == Fobbit.GUESS
+        # the host finishes it
+        fobbit.finish()
+        assert fobbit.status == Fobbit.FINISHED
+
+    fobbit.reset()
+    assert fobbit.progress.guesses == 0
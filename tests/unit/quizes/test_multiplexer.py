@@ -0,0 +1,54 @@
+import pytest
+from asgiref.sync import async_to_sync
+from channels.layers import get_channel_layer
+from django.contrib.auth.models import AnonymousUser
+
+from tests.factories.quiz_factories import SessionFactory
+from tests.unit.quizes.test_consumers import connect
+
+from fobbage.quizes.multiplexer import get_multiplexer
+
+
+@pytest.fixture(autouse=True)
+def in_memory_layer(settings):
+    settings.CHANNEL_LAYERS = {
+        'default': {'BACKEND': 'channels.layers.InMemoryChannelLayer'}}
+
+
+@pytest.mark.django_db
+@pytest.mark.parametrize('multiplexer', [True, False])
+def test_consumers_share_the_group(settings, multiplexer):
+    settings.WEBSOCKET_MULTIPLEXER = multiplexer
+    session = SessionFactory()
+    group = 'session_{}'.format(session.id)
+    layer = get_channel_layer()
+
+    async def run():
+        communicators = [
+            connect(session.id, AnonymousUser()) for _ in range(3)]
+        for communicator in communicators:
+            assert (await communicator.connect())[0]
+        members = len(layer.groups[group])
+        subscriptions = get_multiplexer().subscriptions()
+
+        await layer.group_send(group, {
+            'type': 'session_message', 'session_id': session.id})
+        received = [
+            await communicator.receive_json_from()
+            for communicator in communicators]
+
+        for communicator in communicators:
+            await communicator.disconnect()
+        return members, subscriptions, received
+
+    members, subscriptions, received = async_to_sync(run)()
+    if multiplexer:
+        assert members == 1
+        assert subscriptions == {group: 3}
+    else:
+        assert members == 3
+        assert subscriptions == {}
+    assert received == [
+        {'type': 'session_message', 'session_id': session.id}] * 3
+    # the last one out left the group
+    assert group not in layer.groups
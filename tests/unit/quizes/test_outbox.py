@@ -0,0 +1,33 @@
+from asgiref.sync import async_to_sync
+from channels.layers import InMemoryChannelLayer
+
+from fobbage.quizes.outbox import BroadcastOutbox
+
+
+def test_outbox_sends_in_order():
+    layer = InMemoryChannelLayer()
+    channel = async_to_sync(layer.new_channel)()
+    async_to_sync(layer.group_add)('session_1', channel)
+    outbox = BroadcastOutbox(layer=layer)
+
+    for i in range(5):
+        assert outbox.put('session_1', {'type': 'session_message', 'i': i})
+    assert outbox.wait()
+
+    received = [async_to_sync(layer.receive)(channel) for i in range(5)]
+    assert [message['i'] for message in received] == list(range(5))
+    assert outbox.stats['sent'] == 5
+    assert outbox.depth == 0
+
+
+def test_outbox_drops_when_full():
+    outbox = BroadcastOutbox(maxsize=2, layer=InMemoryChannelLayer())
+    # don't drain
+    outbox.start = lambda: None
+
+    assert outbox.put('session_1', {'type': 'session_message'})
+    assert outbox.put('session_1', {'type': 'session_message'})
+    assert not outbox.put('session_1', {'type': 'session_message'})
+
+    assert outbox.stats['dropped'] == 1
+    assert outbox.stats['max_depth'] == 2
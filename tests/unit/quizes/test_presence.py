@@ -0,0 +1,90 @@
+import time
+
+import pytest
+from asgiref.sync import async_to_sync
+from rest_framework.test import APIClient
+
+from tests.factories.account_factories import UserFactory
+from tests.factories.quiz_factories import SessionFactory
+from tests.unit.quizes.test_consumers import connect, in_memory_layer  # noqa
+
+from fobbage.quizes.presence import Presence, presence
+
+
+def test_presence_counts_connections_and_expires(settings, monkeypatch):
+    settings.PRESENCE_TTL = 10
+    presence = Presence()
+
+    assert presence.join(1, 7, 'ann') == ([{'id': 7, 'username': 'ann'}], [])
+    # a second connection of the same player
+    assert presence.join(1, 7, 'ann') == ([], [])
+    assert presence.join(1, 8, 'bob') == ([{'id': 8, 'username': 'bob'}], [])
+    assert presence.leave(1, 7) == ([], [])
+    assert presence.online(1) == [
+        {'id': 7, 'username': 'ann'}, {'id': 8, 'username': 'bob'}]
+
+    assert presence.leave(1, 7) == ([], [{'id': 7, 'username': 'ann'}])
+    assert presence.online(1) == [{'id': 8, 'username': 'bob'}]
+    assert presence.online(2) == []
+
+    # another process with a player that stops its heartbeats
+    with monkeypatch.context() as patch:
+        patch.setattr('fobbage.quizes.presence.PROCESS', 'other')
+        Presence().join(1, 9, 'cy')
+
+    now = time.time()
+    monkeypatch.setattr(time, 'time', lambda: now + 11)
+    assert presence.online(1) == []
+    # the heartbeat brings back the players of this process
+    assert presence.heartbeat() == {1: ([], [{'id': 9, 'username': 'cy'}])}
+    assert presence.online(1) == [{'id': 8, 'username': 'bob'}]
+
+
+@pytest.mark.django_db
+def test_presence_over_websocket(django_assert_num_queries):
+    session = SessionFactory()
+    ann, bob = UserFactory.create_batch(2)
+
+    async def run():
+        first = connect(session.id, ann)
+        await first.connect()
+        joined = await first.receive_json_from()
+
+        second = connect(session.id, bob)
+        await second.connect()
+        await second.receive_json_from()
+        bob_joined = await first.receive_json_from()
+
+        await second.disconnect()
+        bob_left = await first.receive_json_from()
+        await first.disconnect()
+        return joined, bob_joined, bob_left
+
+    # the sessions are loaded, presence costs no queries
+    with django_assert_num_queries(2):
+        joined, bob_joined, bob_left = async_to_sync(run)()
+    ann_ = {'id': ann.id, 'username': ann.username}
+    bob_ = {'id': bob.id, 'username': bob.username}
+    assert joined == {
+        'type': 'presence_message', 'session': session.id,
+        'joined': [ann_], 'left': []}
+    assert bob_joined['joined'] == [bob_]
+    assert bob_left['joined'] == [] and bob_left['left'] == [bob_]
+
+
+@pytest.mark.django_db
+def test_presence_view(django_assert_num_queries):
+    session = SessionFactory()
+    user = UserFactory()
+    client = APIClient()
+    client.force_authenticate(user)
+    url = '/api/sessions/{}/presence/'.format(session.id)
+    presence.join(session.id, user.id, user.username)
+
+    # only the cache is read
+    with django_assert_num_queries(0):
+        response = client.get(url)
+    assert response.json() == [{'id': user.id, 'username': user.username}]
+
+    presence.leave(session.id, user.id)
+    assert client.get(url).json() == []
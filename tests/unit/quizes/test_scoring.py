@@ -0,0 +1,173 @@
+from io import StringIO
+
+import pytest
+from django.core.management import call_command
+
+from tests.factories.account_factories import UserFactory
+from tests.factories.quiz_factories import (
+    QuestionFactory,
+    SessionFactory,
+)
+
+from fobbage.quizes.models import Bluff, Guess, Score
+from fobbage.quizes.scoring import recorded_scores, session_scores
+from fobbage.quizes.serializers import (
+    AnswerScoreSheetSerializer, FobbitSerializer,
+)
+
+
+def play(fobbit, bluffs, guesses):
+    """Bluff, guess and finish a fobbit, guesses point to bluffing players"""
+    for player, text in bluffs.items():
+        Bluff.objects.create(fobbit=fobbit, player=player, text=text)
+    fobbit.refresh_from_db()
+
+    for player, target in guesses.items():
+        if target is None:
+            answer = fobbit.answers.get(is_correct=True)
+        else:
+            answer = fobbit.bluffs.get(player=target).answer
+        Guess.objects.create(answer=answer, player=player)
+    fobbit.finish()
+
+
+def played_session():
+    session = SessionFactory()
+    for text in ['paris', 'rome', 'bern']:
+        QuestionFactory(quiz=session.quiz, correct_answer=text.title())
+    p1, p2, p3, p4 = players = UserFactory.create_batch(4)
+    session.players.set(players)
+
+    session.new_round({'multiplier': 1, 'number_of_questions': 2})
+    play(
+        session.active_fobbit,
+        # p3 bluffs the correct answer, p1 and p2 share a bluff
+        {p1: 'Lyon', p2: 'lyon', p3: 'paris', p4: 'Nice'},
+        {p1: p4, p2: None, p3: p1, p4: p2},
+    )
+    play(
+        session.active_fobbit,
+        # p1 guesses its own bluff
+        {p1: 'Milan', p2: 'Naples', p3: 'Turin', p4: 'Pisa'},
+        {p1: p1, p2: p3, p3: p4, p4: None},
+    )
+    session.new_round({'multiplier': 3, 'number_of_questions': 1})
+    play(
+        session.active_fobbit,
+        {p1: 'Basel', p2: 'Genf', p3: 'Zurich', p4: 'Bern'},
+        {p1: p3, p2: p3, p3: None, p4: None},
+    )
+    return session, players
+
+
+@pytest.mark.django_db
+def test_session_scores_match_score_for_player():
+    session, players = played_session()
+
+    scores = session_scores(session)
+    for player in players:
+        assert scores.get(player.id, 0) == session.score_for_player(player)
+    assert any(scores.values())
+
+
+@pytest.mark.django_db
+def test_session_scores_query_count(django_assert_num_queries):
+    session = SessionFactory()
+    QuestionFactory(quiz=session.quiz)
+    QuestionFactory(quiz=session.quiz)
+    players = UserFactory.create_batch(3)
+    session.players.set(players)
+
+    session.new_round({'multiplier': 2, 'number_of_questions': 1})
+    play(
+        session.active_fobbit,
+        {player: 'bluff {}'.format(player.id) for player in players},
+        {players[0]: players[1], players[1]: None, players[2]: players[0]},
+    )
+
+    with django_assert_num_queries(4):
+        session_scores(session)
+
+
+@pytest.mark.django_db
+def test_finish_records_scores():
+    session, players = played_session()
+
+    assert recorded_scores(session) == session_scores(session)
+    assert Score.objects.filter(session=session).count() == 3 * 4
+
+
+@pytest.mark.django_db
+def test_reset_removes_recorded_scores():
+    session, players = played_session()
+    fobbit = session.fobbits.last()
+
+    fobbit.reset()
+
+    assert not fobbit.scores.exists()
+    assert recorded_scores(session) == session_scores(session)
+
+
+@pytest.mark.django_db
+def test_finish_freezes_score_sheet(django_assert_num_queries):
+    session, players = played_session()
+    fobbit = session.fobbits.first()
+
+    assert fobbit.score_sheet == AnswerScoreSheetSerializer(
+        fobbit.scored_answers, many=True).data
+    with django_assert_num_queries(0):
+        sheets = FobbitSerializer().get_score_sheets(fobbit)
+    assert sheets == fobbit.score_sheet
+
+    fobbit.reset()
+    fobbit.refresh_from_db()
+    assert fobbit.score_sheet is None
+    assert FobbitSerializer().get_score_sheets(fobbit) is None
+
+
+@pytest.mark.django_db
+def test_backfill_scores():
+    session, players = played_session()
+    scores = recorded_scores(session)
+    sheets = list(session.fobbits.values_list('score_sheet', flat=True))
+    Score.objects.all().delete()
+    session.fobbits.update(score_sheet=None, scored=False)
+
+    call_command('backfill_scores', batch_size=2, stdout=StringIO())
+
+    assert recorded_scores(session) == scores
+    assert list(
+        session.fobbits.values_list('score_sheet', flat=True)) == sheets
+
+
+@pytest.mark.django_db
+def test_recorded_scores_falls_back_without_ledger():
+    session, players = played_session()
+    scores = recorded_scores(session)
+    fobbit = session.fobbits.first()
+    Score.objects.filter(fobbit=fobbit).delete()
+    session.fobbits.filter(id=fobbit.id).update(scored=False)
+
+    assert recorded_scores(session) == scores
+
+    call_command('backfill_scores', missing=True, stdout=StringIO())
+    assert Score.objects.filter(session=session).count() == 3 * 4
+
+
+@pytest.mark.django_db
+def test_recorded_scores_of_a_fobbit_nobody_scored_on(
+        django_assert_num_queries):
+    session = SessionFactory()
+    QuestionFactory(quiz=session.quiz)
+    session.new_round({'multiplier': 1, 'number_of_questions': 1})
+    # no players, forced by the deadline
+    session.active_fobbit.finish(force=True)
+    assert not Score.objects.filter(session=session).exists()
+
+    # fobbits not in the ledger, the ledger
+    with django_assert_num_queries(2):
+        assert recorded_scores(session) == {}
+
+    out = StringIO()
+    call_command('backfill_scores', missing=True, stdout=out)
+    assert out.getvalue() == ''
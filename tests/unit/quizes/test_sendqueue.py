@@ -0,0 +1,116 @@
+import asyncio
+
+from asgiref.sync import async_to_sync
+
+from fobbage.quizes import sendqueue
+from fobbage.quizes.sendqueue import SendQueue
+
+
+def session_message(version):
+    return {'type': 'session_message', 'version': version, 'patch': {}}
+
+
+def test_full_queue_collapses_session_messages():
+    sent = []
+    reading = asyncio.Event()
+
+    async def send(message):
+        await reading.wait()
+        sent.append(message)
+
+    async def run():
+        queue = SendQueue(send, None, size=3)
+        queue.start()
+        queue.put({'type': 'chat_message'})
+        # the writer takes the chat message and waits for the client
+        await asyncio.sleep(0)
+        for version in range(1, 6):
+            message = session_message(version)
+            queue.put(message, collapse=lambda m=message: dict(m, patch=None))
+        queue.put({'type': 'presence_message'})
+        dropped = not queue.put({'type': 'chat_message'})
+        assert queue.put({'type': 'ack'}, force=True)
+
+        reading.set()
+        while queue.messages:
+            await asyncio.sleep(0)
+        await asyncio.sleep(0)
+        queue.stop()
+        return dropped
+
+    collapsed = sendqueue.stats['collapsed']
+    assert async_to_sync(run)() is True
+    assert sent == [
+        {'type': 'chat_message'},
+        # 1 to 3 filled the queue, 4 took their place without a patch
+        {'type': 'session_message', 'version': 4, 'patch': None},
+        session_message(5),
+        {'type': 'presence_message'},
+        {'type': 'ack'},
+    ]
+    assert sendqueue.stats['collapsed'] == collapsed + 4
+
+
+def test_slow_client_is_disconnected():
+    closed = []
+
+    async def send(message):
+        await asyncio.Event().wait()
+
+    async def close():
+        closed.append(True)
+
+    async def run():
+        queue = SendQueue(send, close, size=1, slow_after=0)
+        queue.start()
+        queue.put('first')
+        await asyncio.sleep(0)
+        queue.put('second')
+        assert queue.put('third') is False
+        assert queue.slow_since is not None
+        await asyncio.sleep(0.01)
+        # still full
+        assert queue.put('fourth') is False
+        await asyncio.sleep(0)
+        assert queue.closed and not queue.messages
+        return sendqueue.snapshot()
+
+    disconnected = sendqueue.stats['disconnected']
+    stats = async_to_sync(run)()
+    assert closed == [True]
+    assert stats['disconnected'] == disconnected + 1
+
+
+def test_lagging_client_is_disconnected():
+    closed = []
+
+    async def send(message):
+        # a server that buffers without backpressure
+        pass
+
+    async def close():
+        closed.append(True)
+
+    async def run():
+        queue = SendQueue(send, close, size=100, slow_after=0, max_lag=2)
+        queue.start()
+        # clients that never acked only have to keep their queue
+        for version in range(1, 6):
+            assert queue.put({}, version=version)
+        queue.ack(5)
+        for version in range(6, 9):
+            assert queue.put({}, version=version)
+        assert queue.lag == 3 and queue.slow_since is not None
+        # catching up resets the clock
+        queue.ack(8)
+        assert queue.slow_since is None
+
+        for version in range(9, 12):
+            queue.put({}, version=version)
+        await asyncio.sleep(0.01)
+        assert queue.put({}, version=12) is False
+        await asyncio.sleep(0)
+        return queue.closed
+
+    assert async_to_sync(run)() is True
+    assert closed == [True]
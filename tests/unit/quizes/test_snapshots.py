@@ -0,0 +1,58 @@
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import pytest
+
+from fobbage.quizes import snapshots
+from fobbage.quizes.snapshots import SingleFlight
+
+
+def test_render_fills_in_player_fields():
+    data = {'id': 1, 'active_fobbit': {'id': 2, 'have_bluffed': True}}
+    snapshot = snapshots.store(
+        'session', 1, 3, 'http://testserver/', data, data['active_fobbit'])
+
+    assert snapshots.get('session', 1, 3, 'http://testserver/') == snapshot
+    assert snapshots.get('session', 1, 4, 'http://testserver/') is None
+    assert snapshots.render(snapshot, True, False) == (
+        b'{"id":1,"active_fobbit":{"id":2,'
+        b'"have_bluffed":true,"have_guessed":false}}')
+
+    snapshots.invalidate(1)
+    assert snapshots.get('session', 1, 3, 'http://testserver/') is None
+
+
+def test_single_flight_runs_once():
+    flight = SingleFlight()
+    started = threading.Event()
+    calls = []
+
+    def render():
+        calls.append(1)
+        started.set()
+        # the followers come in while it renders
+        time.sleep(0.2)
+        return 'rendered'
+
+    with ThreadPoolExecutor(max_workers=10) as pool:
+        leader = pool.submit(flight.do, 'key', render)
+        started.wait(5)
+        followers = [pool.submit(flight.do, 'key', render) for _ in range(9)]
+
+    assert leader.result() == ('rendered', False)
+    assert [f.result() for f in followers] == [('rendered', True)] * 9
+    assert len(calls) == 1
+    assert flight.snapshot() == {'rendered': 1, 'merged': 9}
+
+
+def test_single_flight_shares_errors():
+    flight = SingleFlight()
+
+    def fail():
+        raise ValueError
+
+    with pytest.raises(ValueError):
+        flight.do('key', fail)
+    # nothing left in flight
+    assert flight.do('key', lambda: 1) == (1, False)
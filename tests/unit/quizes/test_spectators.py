@@ -0,0 +1,83 @@
+import pytest
+from asgiref.sync import async_to_sync
+from channels.db import database_sync_to_async
+from channels.layers import get_channel_layer
+from channels.testing import WebsocketCommunicator
+
+from tests.factories.account_factories import UserFactory
+from tests.factories.quiz_factories import QuestionFactory, SessionFactory
+
+from fobbage.asgi import application
+from fobbage.quizes.deltas import session_patch
+from fobbage.quizes.spectators import get_hub
+
+
+@pytest.fixture(autouse=True)
+def in_memory_layer(settings):
+    settings.BROADCAST_OUTBOX = False
+    settings.CHANNEL_LAYERS = {
+        'default': {'BACKEND': 'channels.layers.InMemoryChannelLayer'}}
+
+
+def watch(session_id):
+    return WebsocketCommunicator(
+        application, '/ws/session/{}/watch/'.format(session_id))
+
+
+async def broadcast(session_id):
+    version, patch = await database_sync_to_async(session_patch)(session_id)
+    await get_channel_layer().group_send('session_{}'.format(session_id), {
+        'type': 'session_message', 'session_id': session_id,
+        'version': version, 'patch': patch,
+    })
+    return version
+
+
+@pytest.mark.django_db(transaction=True)
+def test_spectators_share_the_session_state():
+    session = SessionFactory()
+    QuestionFactory(quiz=session.quiz, text='what?')
+    session.players.set(UserFactory.create_batch(2))
+    session.new_round({'multiplier': 1, 'number_of_questions': 1})
+
+    async def run():
+        first = watch(session.id)
+        assert (await first.connect())[0]
+        state = await first.receive_json_from()
+
+        # the hub has the state, the next spectators cost no queries
+        others = [watch(session.id) for _ in range(3)]
+        for other in others:
+            assert (await other.connect())[0]
+        states = [await other.receive_json_from() for other in others]
+        loads = (await get_hub(session.id)).stats['loads']
+
+        version = await broadcast(session.id)
+        frames = [
+            await spectator.receive_from()
+            for spectator in [first] + others]
+
+        late = watch(session.id)
+        await late.connect()
+        late_state = await late.receive_json_from()
+        for spectator in [first, late] + others:
+            await spectator.disconnect()
+        return state, states, loads, version, frames, late_state
+
+    state, states, loads, version, frames, late_state = async_to_sync(
+        run)()
+    assert state['type'] == 'state'
+    assert state['state']['question']['text'] == 'what?'
+    assert states == [state] * 3
+    assert loads == 1
+    assert len(set(frames)) == 1
+    assert late_state['version'] == version
+
+
+@pytest.mark.django_db(transaction=True)
+def test_watch_unknown_session():
+    async def run():
+        connected, _ = await watch(404).connect()
+        return connected
+
+    assert async_to_sync(run)() is False
@@ -0,0 +1,122 @@
+import time
+from datetime import timedelta
+
+import pytest
+from asgiref.sync import async_to_sync
+from django.utils import timezone
+
+from tests.factories.account_factories import UserFactory
+from tests.factories.quiz_factories import (
+    BluffFactory,
+    GuessFactory,
+    QuestionFactory,
+    SessionFactory,
+)
+
+from fobbage.quizes.models import Fobbit
+from fobbage.quizes.timers import PhaseScheduler, expire, pending_deadlines
+
+
+def timed_session(**settings):
+    session = SessionFactory(settings=settings)
+    QuestionFactory.create_batch(2, quiz=session.quiz)
+    session.players.set(UserFactory.create_batch(2))
+    session.new_round({'multiplier': 1, 'number_of_questions': 2})
+    return session
+
+
+def pass_deadline(fobbit):
+    Fobbit.objects.filter(id=fobbit.id).update(
+        deadline=timezone.now() - timedelta(seconds=1))
+
+
+@pytest.mark.django_db
+def test_bluff_deadline():
+    session = timed_session(bluff_seconds=30)
+
+    deadline = session.active_fobbit.deadline
+    assert deadline - timezone.now() == pytest.approx(
+        timedelta(seconds=30), abs=timedelta(seconds=5))
+    assert timed_session().active_fobbit.deadline is None
+
+
+@pytest.mark.django_db
+def test_expired_bluff_phase_generates_answers():
+    session = timed_session(bluff_seconds=30, guess_seconds=30)
+    fobbit = session.active_fobbit
+    p1, p2 = session.players.all()
+    BluffFactory(fobbit=fobbit, player=p1, text='one')
+
+    # not passed yet
+    assert expire(fobbit.id, Fobbit.BLUFF) is False
+    pass_deadline(fobbit)
+    assert expire(fobbit.id, Fobbit.BLUFF) is True
+    assert expire(fobbit.id, Fobbit.BLUFF) is False
+
+    fobbit.refresh_from_db()
+    assert fobbit.status == Fobbit.GUESS
+    assert fobbit.answers.count() == 2
+    assert fobbit.deadline is None
+
+
+@pytest.mark.django_db
+def test_expired_bluff_phase_without_players():
+    session = timed_session(bluff_seconds=30)
+    session.players.clear()
+    fobbit = session.active_fobbit
+    pass_deadline(fobbit)
+
+    assert expire(fobbit.id, Fobbit.BLUFF) is False
+    fobbit.refresh_from_db()
+    assert fobbit.status == Fobbit.BLUFF
+    # not scheduled again
+    assert fobbit.deadline is None
+    assert pending_deadlines() == []
+
+
+@pytest.mark.django_db
+def test_expired_guess_phase_finishes():
+    session = timed_session(guess_seconds=30)
+    fobbit = session.active_fobbit
+    p1, p2 = session.players.all()
+    BluffFactory(fobbit=fobbit, player=p1, text='one')
+    BluffFactory(fobbit=fobbit, player=p2, text='two')
+    # the guess phase starts when the fobbit is active again
+    session.active_fobbit = fobbit
+    session.save()
+    fobbit.refresh_from_db()
+    assert fobbit.deadline is not None
+    GuessFactory(answer=fobbit.answers.get(is_correct=True), player=p1)
+
+    pass_deadline(fobbit)
+    assert expire(fobbit.id, Fobbit.GUESS) is True
+
+    fobbit.refresh_from_db()
+    assert fobbit.status == Fobbit.FINISHED
+    assert dict(fobbit.scores.values_list('player', 'score')) == {
+        p1.id: 1000, p2.id: 0}
+
+
+def test_scheduler_fires_due_deadlines_in_order():
+    fired = []
+
+    async def fire(fobbit_id, status):
+        fired.append(fobbit_id)
+        return True
+
+    scheduler = PhaseScheduler(fire=fire)
+    now = time.time()
+    scheduler.schedule(1, Fobbit.BLUFF, now - 1)
+    scheduler.schedule(2, Fobbit.BLUFF, now - 2)
+    scheduler.schedule(3, Fobbit.BLUFF, now - 3)
+    # replaced and cancelled deadlines are skipped
+    scheduler.schedule(3, Fobbit.GUESS, now + 60)
+    scheduler.schedule(1, Fobbit.BLUFF, None)
+
+    async_to_sync(scheduler.fire_due)()
+
+    assert fired == [2]
+    assert scheduler.metrics['fired'] == 1
+    assert scheduler.metrics['skipped'] == 2
+    assert scheduler.metrics['skew_max'] >= 2
+    assert scheduler.deadlines == {3: (now + 60, Fobbit.GUESS)}
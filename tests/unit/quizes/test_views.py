@@ -0,0 +1,181 @@
+import pytest
+from django.db.models import F
+from rest_framework.test import APIClient
+
+from tests.factories.account_factories import UserFactory
+from tests.factories.quiz_factories import (
+    QuestionFactory,
+    SessionFactory,
+)
+
+from fobbage.quizes.deltas import session_patch
+from fobbage.quizes.models import Bluff, Guess, SessionState
+
+
+def session_with_players(n_players, guessing=False):
+    """Session in which all but one player have bluffed (and guessed)"""
+    session = SessionFactory()
+    QuestionFactory(quiz=session.quiz)
+    QuestionFactory(quiz=session.quiz)
+    players = UserFactory.create_batch(n_players)
+    session.players.set(players)
+    session.new_round({'multiplier': 1, 'number_of_questions': 2})
+
+    fobbit = session.active_fobbit
+    bluffing = players if guessing else players[1:]
+    for player in bluffing:
+        Bluff.objects.create(
+            fobbit=fobbit, player=player, text='bluff {}'.format(player.id))
+    if guessing:
+        answer = fobbit.answers.first()
+        for player in players[1:]:
+            Guess.objects.create(answer=answer, player=player)
+        # generating answers moved on to the next question
+        session.active_fobbit = fobbit
+        session.save()
+
+    client = APIClient()
+    client.force_authenticate(players[0])
+    return session, client
+
+
+@pytest.mark.django_db
+@pytest.mark.parametrize('n_players', [2, 10])
+@pytest.mark.parametrize('guessing, queries', [(False, 6), (True, 7)])
+def test_session_retrieve_query_count(
+        django_assert_num_queries, n_players, guessing, queries):
+    session, client = session_with_players(n_players, guessing)
+
+    # session and version, session, fobbits, answers, (guesses), bluffs,
+    # players
+    # guesses are only prefetched when there are answers
+    with django_assert_num_queries(queries):
+        response = client.get('/api/sessions/{}/'.format(session.id))
+
+    fobbit = response.json()['active_fobbit']
+    if guessing:
+        assert len(fobbit['players_without_guess']) == 1
+        assert fobbit['have_bluffed'] is True
+    else:
+        assert len(fobbit['players_without_bluff']) == 1
+        assert fobbit['have_bluffed'] is False
+
+
+@pytest.mark.django_db
+@pytest.mark.parametrize('n_players', [2, 10])
+def test_session_retrieve_snapshot(django_assert_num_queries, n_players):
+    session, client = session_with_players(n_players)
+    url = '/api/sessions/{}/'.format(session.id)
+    first = client.get(url).json()
+
+    # every player gets the cached snapshot with their own fields
+    players = list(session.players.order_by('id'))
+    for player in players:
+        client.force_authenticate(player)
+        # version, have_bluffed and have_guessed
+        with django_assert_num_queries(2):
+            response = client.get(url).json()
+        assert response['active_fobbit']['have_bluffed'] is (
+            player != players[0])
+        assert response == dict(first, active_fobbit=dict(
+            first['active_fobbit'],
+            have_bluffed=response['active_fobbit']['have_bluffed']))
+
+    # a change drops the snapshot
+    Bluff.objects.get(player=players[1]).delete()
+    client.force_authenticate(players[1])
+    response = client.get(url).json()
+    assert response['active_fobbit']['have_bluffed'] is False
+    assert response['active_fobbit']['players_without_bluff_count'] == 2
+
+
+@pytest.mark.django_db
+@pytest.mark.parametrize('n_players', [2, 10])
+def test_session_list_query_count(django_assert_num_queries, n_players):
+    session, client = session_with_players(n_players)
+    session_with_players(n_players)
+
+    with django_assert_num_queries(5):
+        response = client.get('/api/sessions/')
+    assert len(response.data) == 2
+
+
+@pytest.mark.django_db
+@pytest.mark.parametrize('n_players', [2, 10])
+def test_fobbit_retrieve_query_count(django_assert_num_queries, n_players):
+    session, client = session_with_players(n_players, guessing=True)
+
+    # fobbit, answers, guesses, bluffs, players
+    with django_assert_num_queries(5):
+        response = client.get(
+            '/api/fobbits/{}/'.format(session.active_fobbit_id))
+    assert response.data['have_guessed'] is False
+
+
+@pytest.mark.django_db
+@pytest.mark.parametrize('n_players', [2, 10])
+def test_active_fobbit_retrieve_query_count(
+        django_assert_num_queries, n_players):
+    session, client = session_with_players(n_players, guessing=True)
+
+    # version, fobbit, answers, guesses, bluffs, players
+    with django_assert_num_queries(6):
+        response = client.get('/api/active_fobbits/{}/'.format(session.id))
+    assert response.json()['id'] == session.active_fobbit_id
+
+
+@pytest.mark.django_db
+def test_generate_answers_orders_answers():
+    session, client = session_with_players(3)
+    fobbit = session.active_fobbit
+    # the last bluff, without generating the answers
+    player = session.players.exclude(bluffs__fobbit=fobbit).get()
+    Bluff.objects.bulk_create(
+        [Bluff(fobbit=fobbit, player=player, text='last bluff')])
+
+    response = client.post(
+        '/api/fobbits/{}/generate_answers/'.format(fobbit.id))
+
+    assert response.status_code == 200
+    orders = sorted(fobbit.answers.values_list('order', flat=True))
+    assert orders == list(range(1, len(orders) + 1))
+    assert sorted(a['order'] for a in response.data['answers']) == orders
+
+
+@pytest.mark.django_db
+def test_score_board_query_count(django_assert_num_queries):
+    session, client = session_with_players(10)
+
+    # session, unrecorded fobbits, ledger, players
+    with django_assert_num_queries(4):
+        response = client.get(
+            '/api/sessions/{}/score_board/'.format(session.id))
+    assert len(response.data) == 10
+
+
+@pytest.mark.django_db
+@pytest.mark.parametrize('path', ['sessions', 'active_fobbits'])
+def test_session_conditional_get(django_assert_num_queries, path):
+    session, client = session_with_players(2)
+    url = '/api/{}/{}/'.format(path, session.id)
+    version, _ = session_patch(session.id)
+
+    etag = client.get(url)['ETag']
+    assert etag == 'W/"{}-{}-{}"'.format(
+        session.id, version, session.players.order_by('id').first().id)
+
+    # unchanged, answered from the version
+    with django_assert_num_queries(1):
+        response = client.get(url, HTTP_IF_NONE_MATCH=etag)
+    assert response.status_code == 304
+
+    # another player, another ETag
+    client.force_authenticate(session.players.order_by('id').last())
+    assert client.get(url, HTTP_IF_NONE_MATCH=etag).status_code == 200
+
+    # bumped by another process, e.g. the phase timers
+    SessionState.objects.filter(session=session).update(
+        version=F('version') + 1)
+    response = client.get(url, HTTP_IF_NONE_MATCH=etag)
+    assert response.status_code == 200
+    assert response['ETag'] != etag
@@ -0,0 +1,76 @@
+import asyncio
+import threading
+import time
+
+import pytest
+from asgiref.sync import async_to_sync
+from channels.exceptions import ChannelFull
+
+from fobbage.layers import LocalChannelLayer
+
+
+def test_group_send_shares_the_message():
+    layer = LocalChannelLayer()
+    message = {'type': 'session.message', 'patch': {'status': 1}}
+
+    async def run():
+        channels = [await layer.new_channel() for _ in range(3)]
+        for channel in channels:
+            await layer.group_add('session_1', channel)
+        await layer.group_discard('session_1', channels[2])
+        await layer.group_send('session_1', message)
+        received = [await layer.receive(channel) for channel in channels[:2]]
+        return received, layer.channels.get(channels[2])
+
+    received, discarded = async_to_sync(run)()
+    assert all(m is message for m in received)
+    assert discarded is None
+
+
+def test_capacity():
+    layer = LocalChannelLayer(capacity=2)
+
+    async def run():
+        channel = await layer.new_channel()
+        await layer.group_add('session_1', channel)
+        for _ in range(3):
+            await layer.group_send('session_1', {'type': 'test'})
+        with pytest.raises(ChannelFull):
+            await layer.send(channel, {'type': 'test'})
+
+    async_to_sync(run)()
+    assert layer.stats == {'sent': 2, 'dropped': 1, 'expired': 0}
+
+
+def test_expired_channels_leave_their_groups():
+    layer = LocalChannelLayer(expiry=0.01)
+
+    async def run():
+        channel = await layer.new_channel()
+        await layer.group_add('session_1', channel)
+        await layer.group_send('session_1', {'type': 'test'})
+        await asyncio.sleep(0.02)
+        # the receiver is gone, the next message finds the expired one
+        await layer.group_send('session_1', {'type': 'test'})
+
+    async_to_sync(run)()
+    assert layer.groups == {'session_1': {}}
+    assert layer.stats['expired'] == 1
+
+
+def test_send_from_another_thread():
+    layer = LocalChannelLayer()
+
+    async def run():
+        channel = await layer.new_channel()
+        await layer.group_add('session_1', channel)
+        # like the broadcast outbox, with its own event loop
+        sender = threading.Thread(target=lambda: (
+            time.sleep(0.05),
+            async_to_sync(layer.group_send)('session_1', {'type': 'test'})))
+        sender.start()
+        message = await asyncio.wait_for(layer.receive(channel), 5)
+        sender.join()
+        return message
+
+    assert async_to_sync(run)() == {'type': 'test'}